@@ -114,8 +114,463 @@ safe_imports()
 import tkinter as tk
 from tkinter import ttk, messagebox
 import pandas as pd
+import numpy as np
+import heapq
+
+
+def lq_bed(dose, dose_per_fraction, ab_ratio):
+    """Linear-quadratic BED of dose (Gy) delivered in fractions of dose_per_fraction."""
+    return dose * (1.0 + dose_per_fraction / ab_ratio)
+
+
+def eqd2_from_bed(bed, ab_ratio):
+    return bed / (1.0 + 2.0 / ab_ratio)
+
+
+def lq_bed_eqd2(hdr_percent, ab_ratio, hdr_rx_dose, ebt_fractions, ebt_dose_per_fx):
+    """Fraction-wise and total BED/EQD2 of an EBT + HDR course in one broadcast pass.
+
+    hdr_percent is (..., N): the dose of each of N HDR fractions in % of the
+    HDR prescription hdr_rx_dose (Gy). ab_ratio, hdr_rx_dose, ebt_fractions
+    and ebt_dose_per_fx broadcast against hdr_percent[..., 0], so one call
+    covers any stack of structures, α/β values and EBT regimens. Each fraction
+    of dose d adds BED d(1 + d/(α/β)); EQD2 = BED / (1 + 2/(α/β)).
+
+    Returns a dict of arrays: "fraction_dose", "fraction_bed" and
+    "fraction_eqd2" (..., N), and "average_percent", "hdr_dose", "hdr_bed",
+    "hdr_eqd2", "ebt_dose", "ebt_bed", "ebt_eqd2", "total_bed", "total_eqd2"
+    (...). Invalid inputs (NaN, α/β of 0) give NaN or inf only where they occur.
+    """
+    percent = np.asarray(hdr_percent, dtype=np.float64)
+    ab = np.asarray(ab_ratio, dtype=np.float64)
+    rx = np.asarray(hdr_rx_dose, dtype=np.float64)
+    ebt_n = np.asarray(ebt_fractions, dtype=np.float64)
+    ebt_d = np.asarray(ebt_dose_per_fx, dtype=np.float64)
+    shape = np.broadcast_shapes(percent.shape[:-1], ab.shape, rx.shape, ebt_n.shape, ebt_d.shape)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fraction_dose = percent / 100.0 * rx[..., None]
+        fraction_bed = lq_bed(fraction_dose, fraction_dose, ab[..., None])
+        hdr_bed = fraction_bed.sum(axis=-1)
+        ebt_dose = ebt_n * ebt_d
+        ebt_bed = lq_bed(ebt_dose, ebt_d, ab)
+        total_bed = ebt_bed + hdr_bed
+        results = {
+            "fraction_dose": fraction_dose,
+            "fraction_bed": fraction_bed,
+            "fraction_eqd2": eqd2_from_bed(fraction_bed, ab[..., None]),
+            "average_percent": percent.mean(axis=-1),
+            "hdr_dose": fraction_dose.sum(axis=-1),
+            "hdr_bed": hdr_bed,
+            "hdr_eqd2": eqd2_from_bed(hdr_bed, ab),
+            "ebt_dose": ebt_dose,
+            "ebt_bed": ebt_bed,
+            "ebt_eqd2": eqd2_from_bed(ebt_bed, ab),
+            "total_bed": total_bed,
+            "total_eqd2": eqd2_from_bed(total_bed, ab)
+        }
+    fraction_shape = shape + percent.shape[-1:]
+    return {name: np.broadcast_to(value, fraction_shape if name.startswith("fraction_") else shape)
+            for name, value in results.items()}
+
+
+def bed_eqd2_sweep(hdr_percent, ab_ratios, dose_scales, ebt_regimens, hdr_rx_dose):
+    """Total EQD2 (Gy) over α/β x HDR dose scale x EBT regimen for every structure.
+
+    hdr_percent (S, N) holds the nominal %Rx of each structure's N HDR
+    fractions, all multiplied by each of dose_scales (K,); ab_ratios (A,) and
+    ebt_regimens (R, 2) rows of (fractions, dose per fraction) span the other
+    axes. Returns an (S, A, K, R) array from a single lq_bed_eqd2() call.
+    """
+    percent = np.asarray(hdr_percent, dtype=np.float64)
+    scales = np.asarray(dose_scales, dtype=np.float64)
+    regimens = np.asarray(ebt_regimens, dtype=np.float64).reshape(-1, 2)
+    return lq_bed_eqd2(percent[:, None, None, None, :] * scales[:, None, None],
+                       np.asarray(ab_ratios, dtype=np.float64)[:, None, None],
+                       hdr_rx_dose, regimens[:, 0], regimens[:, 1])["total_eqd2"]
+
+
+def eqd2_limit_scale(hdr_percent, ab_ratio, hdr_rx_dose, ebt_fractions, ebt_dose_per_fx, eqd2_limit):
+    """Factor on every HDR fraction dose at which the total EQD2 reaches eqd2_limit.
+
+    HDR BED is quadratic in a common scale s, s*sum(d) + s^2*sum(d^2)/(α/β),
+    so the tolerance crossing is solved in closed form. hdr_percent is
+    (..., N) and the other arguments broadcast like lq_bed_eqd2(). 0 where the
+    EBT alone already reaches the limit, inf where the HDR dose is zero.
+    """
+    percent = np.asarray(hdr_percent, dtype=np.float64)
+    ab = np.asarray(ab_ratio, dtype=np.float64)
+    nominal = lq_bed_eqd2(percent, ab, hdr_rx_dose, ebt_fractions, ebt_dose_per_fx)
+    dose = nominal["fraction_dose"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        remaining = np.asarray(eqd2_limit, dtype=np.float64) * (1.0 + 2.0 / ab) - nominal["ebt_bed"]
+        linear = dose.sum(axis=-1)
+        quadratic = (dose ** 2).sum(axis=-1) / ab
+        scale = 2.0 * remaining / (linear + np.sqrt(linear ** 2 + 4.0 * quadratic * remaining))
+    return np.where(remaining <= 0, 0.0, np.where(linear > 0, scale, np.inf))
+
+
+def unique_output_path(path):
+    """path itself if free, else the first free "<name>_<n><ext>" beside it."""
+    stem, ext = os.path.splitext(path)
+    candidate, n = path, 1
+    while os.path.exists(candidate):
+        candidate = f"{stem}_{n}{ext}"
+        n += 1
+    return candidate
+
+
+def stream_bed_eqd2_csv(input_path, output_path, chunk_size=100000):
+    """Add BED/EQD2 columns to every row of a cohort CSV, one chunk at a time.
+
+    A row is one structure of one patient with "ab_ratio", "ebt_fractions",
+    "ebt_dose_per_fx" and, per HDR fraction n, "fx<n>_dose_gy" or
+    "fx<n>_percent" (the latter with "hdr_rx_dose"); header case is ignored
+    and empty fraction cells count as no dose. A fraction value that is not a
+    number, or a percentage without a prescription, leaves that row's result
+    cells empty rather than being read as 0 Gy. Input columns are passed through
+    verbatim and the result columns match the calculator's CSV export. Only chunk_size
+    rows are in memory at once. The output is never overwritten: if
+    output_path exists a numbered sibling is created instead, and a partial
+    file is removed on error. Returns (path written, rows written).
+    """
+    while True:
+        path = unique_output_path(output_path)
+        try:
+            out = open(path, "x", newline="", encoding="utf-8")
+            break
+        except FileExistsError:
+            continue
+
+    rows = 0
+    try:
+        with out:
+            # Read as text so identifiers and input values are written back exactly as given
+            for chunk in pd.read_csv(input_path, chunksize=chunk_size, dtype=str, keep_default_na=False):
+                columns = {str(c).strip().lower(): c for c in chunk.columns}
+
+                def values(name):
+                    if name not in columns:
+                        raise ValueError(f"Missing column '{name}'")
+                    return pd.to_numeric(chunk[columns[name]], errors="coerce").to_numpy(dtype=np.float64)
+
+                def blank(name):
+                    return chunk[columns[name]].str.strip().eq("").to_numpy()
+
+                fractions = sorted({int(m.group(1)) for m in
+                                    (re.fullmatch(r"fx(\d+)_(?:percent|dose_gy)", c) for c in columns) if m})
+                if not fractions:
+                    raise ValueError("No fx<n>_dose_gy or fx<n>_percent columns")
+                doses = np.zeros((len(chunk), len(fractions)))
+                for i, n in enumerate(fractions):
+                    if f"fx{n}_dose_gy" in columns:
+                        name = f"fx{n}_dose_gy"
+                        dose = values(name)
+                    else:
+                        name = f"fx{n}_percent"
+                        dose = values(name) / 100.0 * values("hdr_rx_dose")
+                    # Only an empty cell is a fraction that was not given; unreadable values stay NaN
+                    doses[:, i] = np.where(blank(name), 0.0, dose)
+
+                # Doses in Gy are percentages of a 1 Gy prescription
+                results = lq_bed_eqd2(doses * 100.0, values("ab_ratio"), 1.0,
+                                      values("ebt_fractions"), values("ebt_dose_per_fx"))
+                output = chunk.copy()
+                for i, n in enumerate(fractions):
+                    output[f"Fx{n}_Dose_Gy"] = results["fraction_dose"][:, i]
+                output["Total_HDR_Dose_Gy"] = results["hdr_dose"]
+                for i, n in enumerate(fractions):
+                    output[f"BED_Fx{n}"] = results["fraction_bed"][:, i]
+                for i, n in enumerate(fractions):
+                    output[f"EQD2_Fx{n}"] = results["fraction_eqd2"][:, i]
+                for column, field in (("HDR_BED_Total", "hdr_bed"), ("HDR_EQD2", "hdr_eqd2"),
+                                      ("EBT_BED", "ebt_bed"), ("EBT_EQD2", "ebt_eqd2"),
+                                      ("Total_BED", "total_bed"), ("Total_EQD2", "total_eqd2")):
+                    output[column] = results[field]
+                output.to_csv(out, header=rows == 0, index=False, float_format="%.4f")
+                rows += len(output)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, rows
+
+
+class CellGraph:
+    """Spreadsheet-style cells: inputs hold values, derived cells are functions of other cells.
+
+    Derived cells must be added after the cells they read, so insertion order
+    is a valid evaluation order. set() only marks the direct dependents dirty;
+    recompute() evaluates them in that order and carries on to a cell's
+    dependents only when its value actually changed. A derived cell is None
+    when any argument is None or its function raises an arithmetic error.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.formulas = {}
+        self.dependents = {}
+        self.rank = {}
+        self.dirty = set()
+
+    def add_input(self, name, value=None):
+        self.values[name] = value
+        self.dependents[name] = []
+        self.rank[name] = len(self.rank)
+
+    def add_derived(self, name, func, *cells):
+        self.formulas[name] = (func, cells)
+        for cell in cells:
+            self.dependents[cell].append(name)
+        self.values[name] = None
+        self.dependents[name] = []
+        self.rank[name] = len(self.rank)
+        self.dirty.add(name)
+
+    def set(self, name, value):
+        if name in self.formulas:
+            raise ValueError(f"{name} is a derived cell")
+        if self.values[name] != value:
+            self.values[name] = value
+            self.dirty.update(self.dependents[name])
+
+    def _evaluate(self, name, values):
+        func, cells = self.formulas[name]
+        args = [values[cell] for cell in cells]
+        if any(arg is None for arg in args):
+            return None
+        try:
+            return func(*args)
+        except (ArithmeticError, ValueError):
+            return None
+
+    def _propagate(self, values, start):
+        queued = set(start)
+        heap = [(self.rank[name], name) for name in queued]
+        heapq.heapify(heap)
+        changed = {}
+        while heap:
+            _, name = heapq.heappop(heap)
+            value = self._evaluate(name, values)
+            if value == values[name]:
+                continue
+            values[name] = changed[name] = value
+            for dependent in self.dependents[name]:
+                if dependent not in queued:
+                    queued.add(dependent)
+                    heapq.heappush(heap, (self.rank[dependent], dependent))
+        return changed
+
+    def recompute(self):
+        """Bring every dirty cell up to date; returns {cell: new value} of the cells that changed."""
+        dirty, self.dirty = self.dirty, set()
+        return self._propagate(self.values, dirty)
+
+    def evaluate(self, overrides, names=None):
+        """What-if values with some inputs overridden, leaving the graph as it was.
+
+        Returns {cell: value} for names, or for every cell the overrides change.
+        """
+        self.recompute()
+        values = dict(self.values)
+        start = set()
+        for name, value in overrides.items():
+            if name in self.formulas:
+                raise ValueError(f"{name} is a derived cell")
+            if values[name] != value:
+                values[name] = value
+                start.update(self.dependents[name])
+        changed = self._propagate(values, start)
+        if names is None:
+            return {**{name: values[name] for name in overrides}, **changed}
+        return {name: values[name] for name in names}
+
+
+def bed_eqd2_cell_graph(structure_keys, fraction_count):
+    """CellGraph of the calculator: inputs and results named like its entries and labels.
+
+    Inputs are "ebt_fractions", "ebt_dose_per_fx", "hdr_rx_dose" and per
+    structure "<key>.ab_ratio" and "<key>.fx<n>_percent"; derived cells are
+    "<key>.fx<n>_dose/_bed/_eqd2", "<key>.avg_percent", "<key>.total_dose"
+    and "<key>." + hdr/ebt/total + _bed/_eqd2, using the same LQ formulas
+    as lq_bed_eqd2().
+    """
+    graph = CellGraph()
+    for name in ("ebt_fractions", "ebt_dose_per_fx", "hdr_rx_dose"):
+        graph.add_input(name)
+    graph.add_derived("ebt_dose", lambda n, d: n * d, "ebt_fractions", "ebt_dose_per_fx")
+    fractions = range(1, fraction_count + 1)
+    for key in structure_keys:
+        ab = f"{key}.ab_ratio"
+        graph.add_input(ab)
+        for n in fractions:
+            graph.add_input(f"{key}.fx{n}_percent")
+        for n in fractions:
+            graph.add_derived(f"{key}.fx{n}_dose", lambda percent, rx: percent / 100.0 * rx,
+                              f"{key}.fx{n}_percent", "hdr_rx_dose")
+            graph.add_derived(f"{key}.fx{n}_bed", lambda dose, ab_ratio: lq_bed(dose, dose, ab_ratio),
+                              f"{key}.fx{n}_dose", ab)
+            graph.add_derived(f"{key}.fx{n}_eqd2", eqd2_from_bed, f"{key}.fx{n}_bed", ab)
+        graph.add_derived(f"{key}.avg_percent", lambda *percents: sum(percents) / len(percents),
+                          *(f"{key}.fx{n}_percent" for n in fractions))
+        graph.add_derived(f"{key}.total_dose", lambda *doses: sum(doses), *(f"{key}.fx{n}_dose" for n in fractions))
+        graph.add_derived(f"{key}.hdr_bed", lambda *beds: sum(beds), *(f"{key}.fx{n}_bed" for n in fractions))
+        graph.add_derived(f"{key}.hdr_eqd2", eqd2_from_bed, f"{key}.hdr_bed", ab)
+        graph.add_derived(f"{key}.ebt_bed", lq_bed, "ebt_dose", "ebt_dose_per_fx", ab)
+        graph.add_derived(f"{key}.ebt_eqd2", eqd2_from_bed, f"{key}.ebt_bed", ab)
+        graph.add_derived(f"{key}.total_bed", lambda ebt, hdr: ebt + hdr, f"{key}.ebt_bed", f"{key}.hdr_bed")
+        graph.add_derived(f"{key}.total_eqd2", eqd2_from_bed, f"{key}.total_bed", ab)
+    return graph
+
+
+# Dose-volume parameters reported for imported DVHs: (label, volume, volume is % of the structure)
+DVH_METRICS = (("D2cc", 2.0, False), ("D0.1cc", 0.1, False), ("D90", 90.0, True))
+
+
+def _dvh_table_columns(columns):
+    """(dose column, Gy per unit, volume column, volume is relative) from table header names"""
+    dose_col = volume_col = None
+    for i, column in enumerate(c.lower() for c in columns):
+        if dose_col is None and "dose" in column and "relative" not in column:
+            dose_col, dose_scale = i, (0.01 if "cgy" in column else 1.0)
+        elif volume_col is None and "volume" in column:
+            volume_col, relative = i, "%" in column
+    if dose_col is None or volume_col is None:
+        raise ValueError(f"No absolute dose and volume columns in {columns}")
+    return dose_col, dose_scale, volume_col, relative
+
+
+def _dvh_text_blocks(text):
+    declared = re.search(r"^\s*Type\s*:\s*(\w+)", text, re.IGNORECASE | re.MULTILINE)
+    differential = declared.group(1).lower().startswith("diff") if declared else None
+    numeric = re.compile(r"^[\s\d.eE+-]+$")
+    blocks = []
+    for part in re.split(r"^\s*(?:Structure|ROI)\s*:\s*", text, flags=re.IGNORECASE | re.MULTILINE)[1:]:
+        lines = part.splitlines()
+        total = re.search(r"^\s*Volume\s*\[(?:cm³|cm3|cc)\]\s*:\s*([\d.eE+-]+)", part, re.IGNORECASE | re.MULTILINE)
+        header = next(i for i, line in enumerate(lines) if "[" in line and
+                      re.search("dose", line, re.IGNORECASE) and re.search("volume", line, re.IGNORECASE)
+                      and ":" not in line)
+        # Every column header ends in its [unit], however the columns are spaced
+        columns = [c.strip() for c in re.findall(r"[^\[\]]+\[[^\]]*\]", lines[header])]
+        rows = []
+        for line in lines[header + 1:]:
+            if line.strip() and numeric.match(line):
+                values = line.split()
+                if len(values) != len(columns):
+                    raise ValueError(f"DVH row has {len(values)} values for {len(columns)} columns "
+                                     f"in '{lines[0].strip()}': {line.strip()}")
+                rows.append(values)
+            elif line.strip():
+                break
+        table = np.array(rows, dtype=np.float64).reshape(-1, len(columns))
+        dose_col, dose_scale, volume_col, relative = _dvh_table_columns(columns)
+        blocks.append((lines[0].strip(), table[:, dose_col] * dose_scale, table[:, volume_col], relative,
+                       float(total.group(1)) if total else np.nan, differential))
+    return blocks
+
+
+def _dvh_csv_blocks(path):
+    table = pd.read_csv(path)
+    lower = [str(c).strip().lower() for c in table.columns]
+    structure_col = next(c for c, name in zip(table.columns, lower) if "structure" in name or "roi" in name)
+    others = [c for c in table.columns if c != structure_col]
+    dose_col, dose_scale, volume_col, relative = _dvh_table_columns([str(c) for c in others])
+    type_col = next((c for c, name in zip(table.columns, lower) if name == "type"), None)
+    blocks = []
+    for name, group in table.groupby(structure_col, sort=False):
+        differential = str(group[type_col].iloc[0]).lower().startswith("diff") if type_col is not None else None
+        blocks.append((str(name), group[others[dose_col]].to_numpy(dtype=np.float64) * dose_scale,
+                       group[others[volume_col]].to_numpy(dtype=np.float64), relative, np.nan, differential))
+    return blocks
+
+
+def read_dvh_file(path):
+    """Cumulative DVHs {structure: {"dose_gy", "volume", "relative"}} from a TPS export.
+
+    Text exports are split at "Structure:" lines; each block's table header
+    names the dose ([Gy] or [cGy]) and volume ([cm³]/[cc] or [%]) columns,
+    and a "Volume [cm³]:" line turns relative volumes into cc. CSV exports
+    are long tables with structure, dose and volume columns (and optionally
+    "type"). Differential histograms - declared as such, or with volumes
+    that are not non-increasing - are accumulated from the top bin down.
+    "volume" is cc unless "relative" is True (% with no structure volume).
+    """
+    if path.lower().endswith(".csv"):
+        blocks = _dvh_csv_blocks(path)
+    else:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            blocks = _dvh_text_blocks(f.read())
+
+    dvhs = {}
+    for name, dose, volume, relative, total_cc, differential in blocks:
+        order = np.argsort(dose, kind="stable")
+        dose, volume = dose[order], volume[order]
+        if differential or (differential is None and (np.diff(volume) > 1e-9).any()):
+            volume = np.cumsum(volume[::-1])[::-1]
+        if relative and np.isfinite(total_cc):
+            volume = volume / 100.0 * total_cc
+            relative = False
+        dvhs[name] = {"dose_gy": dose, "volume": volume, "relative": relative}
+    return dvhs
+
+
+def dose_at_volume(dose_gy, volume, volumes):
+    """Minimum dose to the hottest given volumes of a cumulative DVH (volumes in its own unit)."""
+    # Cumulative volume falls as dose rises, so interpolate on the reversed curve
+    return np.interp(volumes, volume[::-1], dose_gy[::-1])
+
+
+def dvh_eqd2_summary(fraction_dvhs, ab_ratio, ebt_fractions, ebt_dose_per_fx, metrics=DVH_METRICS):
+    """DVH_METRICS of one structure per HDR fraction and summed in EQD2 with the EBT.
+
+    fraction_dvhs holds the structure's read_dvh_file() entry for each of N
+    HDR fractions. Every dose bin of every fraction is converted to EQD2 in
+    one lq_bed_eqd2() call; as EQD2 rises monotonically with dose, the EQD2
+    DVH keeps the physical volumes. Fraction parameters are then added (the
+    usual assumption that the same sub-volume receives every fraction's
+    dose) together with the EBT EQD2, taken as uniform over the structure.
+    Returns {"physical": (N, M), "eqd2": (N, M), "ebt_eqd2": float,
+    "total_eqd2": (M,)} in the order of metrics; cc metrics are NaN for
+    DVHs with relative volumes only.
+    """
+    counts = [len(dvh["dose_gy"]) for dvh in fraction_dvhs]
+    # Doses in Gy are percentages of a 1 Gy prescription
+    eqd2_bins = lq_bed_eqd2(np.concatenate([dvh["dose_gy"] for dvh in fraction_dvhs])[:, None] * 100.0,
+                            ab_ratio, 1.0, 0.0, 0.0)["fraction_eqd2"][:, 0]
+    physical = np.full((len(fraction_dvhs), len(metrics)), np.nan)
+    eqd2 = np.full_like(physical, np.nan)
+    for f, (dvh, bins) in enumerate(zip(fraction_dvhs, np.split(eqd2_bins, np.cumsum(counts)[:-1]))):
+        volume = dvh["volume"]
+        levels = np.array([value / 100.0 * volume[0] if relative else (np.nan if dvh["relative"] else value)
+                           for _, value, relative in metrics])
+        valid = np.isfinite(levels)
+        physical[f, valid] = dose_at_volume(dvh["dose_gy"], volume, levels[valid])
+        eqd2[f, valid] = dose_at_volume(bins, volume, levels[valid])
+    ebt_eqd2 = float(lq_bed_eqd2(np.zeros(1), ab_ratio, 1.0, ebt_fractions, ebt_dose_per_fx)["ebt_eqd2"])
+    return {"physical": physical, "eqd2": eqd2, "ebt_eqd2": ebt_eqd2, "total_eqd2": eqd2.sum(axis=0) + ebt_eqd2}
+
 
 class BEDEQD2Calculator:
+    # key, display name, default α/β and default %Rx of each HDR fraction column
+    STRUCTURES = (
+        ('point_A', 'Point A', "10", ("100.0", "0.0")),
+        ('point_B', 'Point B', "10", ("21.26", "0.0")),
+        ('bladder', 'Bladder', "3", ("61.3725", "0.0")),
+        ('rectum', 'Rectum', "3", ("68.24", "0.0"))
+    )
+    FRACTION_COLUMNS = 2
+    TOTAL_FIELDS = ('hdr_bed', 'hdr_eqd2', 'ebt_bed', 'ebt_eqd2', 'total_bed', 'total_eqd2')
+    # Total EQD2 contours drawn on the sensitivity heatmaps (EMBRACE II limits; Point A is the planning aim)
+    EQD2_LIMITS_GY = {'point_A': 85.0, 'bladder': 90.0, 'rectum': 75.0}
+    # DVH structure name fragments taking their α/β from a calculator row; other targets 10 Gy, other organs 3 Gy
+    DVH_STRUCTURE_ROWS = {'bladder': 'bladder', 'rect': 'rectum'}
+    DVH_TARGET_NAMES = ('ctv', 'gtv', 'ptv')
+    SWEEP_AB_RATIOS = np.round(np.linspace(1.0, 20.0, 191), 3)
+    SWEEP_DOSE_SCALES = np.round(np.linspace(0.5, 1.5, 201), 4)
+    SWEEP_EBT_REGIMENS = ((25, 1.8), (25, 2.0), (28, 1.8), (30, 1.8), (23, 2.0))
+    # Each sweep is several MB, so only the most recently used ones are kept
+    SWEEP_CACHE_SIZE = 3
+
     def __init__(self, root):
         self.root = root
         self.root.title("BED & EQD2 Calculator - Multiple Fractions")
@@ -124,7 +579,10 @@ class BEDEQD2Calculator:
         
         
         self.setup_variables()
+        # bed_eqd2_sweep() results per (nominal inputs, regimens), least recently used first
+        self.sweep_cache = {}
         self.create_interface()
+        self.bind_cell_graph()
     
     def setup_variables(self):
        
@@ -136,28 +594,11 @@ class BEDEQD2Calculator:
         self.hdr_prescription_dose = tk.StringVar(value="9.0")
         
        
-        self.structure_vars = {
-            'point_A': {
-                'ab_ratio': tk.StringVar(value="10"),
-                'fx1_percent': tk.StringVar(value="100.0"),
-                'fx2_percent': tk.StringVar(value="0.0")
-            },
-            'point_B': {
-                'ab_ratio': tk.StringVar(value="10"),
-                'fx1_percent': tk.StringVar(value="21.26"),
-                'fx2_percent': tk.StringVar(value="0.0")
-            },
-            'bladder': {
-                'ab_ratio': tk.StringVar(value="3"),
-                'fx1_percent': tk.StringVar(value="61.3725"),
-                'fx2_percent': tk.StringVar(value="0.0")
-            },
-            'rectum': {
-                'ab_ratio': tk.StringVar(value="3"),
-                'fx1_percent': tk.StringVar(value="68.24"),
-                'fx2_percent': tk.StringVar(value="0.0")
-            }
-        }
+        self.structure_vars = {}
+        for struct_key, _, ab_ratio, percents in self.STRUCTURES:
+            self.structure_vars[struct_key] = {'ab_ratio': tk.StringVar(value=ab_ratio)}
+            for n, percent in enumerate(percents, 1):
+                self.structure_vars[struct_key][f'fx{n}_percent'] = tk.StringVar(value=percent)
     
     def create_interface(self):
      
@@ -242,22 +683,19 @@ class BEDEQD2Calculator:
         struct_frame.grid(row=2, column=0, columnspan=12, sticky="ew", pady=(10, 10))
         
        
-        for i in range(6):
+        fraction_numbers = range(1, self.FRACTION_COLUMNS + 1)
+        for i in range(self.FRACTION_COLUMNS + 4):
             struct_frame.grid_columnconfigure(i, weight=1)
         
        
-        headers = ['Structure', 'α/β Ratio', 'Fx1 [%Rx]', 'Fx2 [%Rx]', 'Avg [%Rx]', 'Total Dose [Gy]']
+        headers = (['Structure', 'α/β Ratio'] + [f'Fx{n} [%Rx]' for n in fraction_numbers] +
+                   ['Avg [%Rx]', 'Total Dose [Gy]'])
         for col, header in enumerate(headers):
             tk.Label(struct_frame, text=header, font=('Arial', 9, 'bold'), 
                     bg="#f5f5f5", fg="#2c3e50").grid(row=0, column=col, padx=5, pady=5, sticky="w")
         
        
-        structures = [
-            ('point_A', 'Point A'),
-            ('point_B', 'Point B'),
-            ('bladder', 'Bladder'),
-            ('rectum', 'Rectum')
-        ]
+        structures = [(struct_key, display_name) for struct_key, display_name, _, _ in self.STRUCTURES]
         
         for row, (struct_key, display_name) in enumerate(structures, 1):
          
@@ -268,21 +706,18 @@ class BEDEQD2Calculator:
                     width=8, relief="solid", bd=1).grid(row=row, column=1, padx=5, pady=3, sticky="w")
             
            
-            tk.Entry(struct_frame, textvariable=self.structure_vars[struct_key]['fx1_percent'], 
-                    width=10, relief="solid", bd=1).grid(row=row, column=2, padx=5, pady=3, sticky="w")
-            
-            
-            tk.Entry(struct_frame, textvariable=self.structure_vars[struct_key]['fx2_percent'], 
-                    width=10, relief="solid", bd=1).grid(row=row, column=3, padx=5, pady=3, sticky="w")
+            for n in fraction_numbers:
+                tk.Entry(struct_frame, textvariable=self.structure_vars[struct_key][f'fx{n}_percent'], 
+                        width=10, relief="solid", bd=1).grid(row=row, column=1 + n, padx=5, pady=3, sticky="w")
             
             
             avg_percent_label = tk.Label(struct_frame, text="", width=10, bg="#f5f5f5", fg="#2c3e50")
-            avg_percent_label.grid(row=row, column=4, padx=5, pady=3, sticky="w")
+            avg_percent_label.grid(row=row, column=2 + self.FRACTION_COLUMNS, padx=5, pady=3, sticky="w")
             self.structure_vars[struct_key]['avg_percent'] = avg_percent_label
             
             
             total_dose_label = tk.Label(struct_frame, text="", width=10, bg="#f5f5f5", fg="#2c3e50")
-            total_dose_label.grid(row=row, column=5, padx=5, pady=3, sticky="w")
+            total_dose_label.grid(row=row, column=3 + self.FRACTION_COLUMNS, padx=5, pady=3, sticky="w")
             self.structure_vars[struct_key]['total_dose'] = total_dose_label
         
        
@@ -313,13 +748,11 @@ class BEDEQD2Calculator:
         canvas.configure(yscrollcommand=scrollbar.set)
         
     
-        headers = [
-            'Structure', 'α/β [Gy]', 
-            'Fx1 BED', 'Fx2 BED', 'Fx1 EQD2', 'Fx2 EQD2',
-            'HDR BED Total', 'HDR EQD2', 
-            'EBT BED', 'EBT EQD2',
-            'Total BED', 'Total EQD2'
-        ]
+        headers = (['Structure', 'α/β [Gy]'] +
+                   [f'Fx{n} BED' for n in fraction_numbers] + [f'Fx{n} EQD2' for n in fraction_numbers] +
+                   ['HDR BED Total', 'HDR EQD2', 
+                    'EBT BED', 'EBT EQD2',
+                    'Total BED', 'Total EQD2'])
         
         for col, header in enumerate(headers):
             tk.Label(scrollable_frame, text=header, font=('Arial', 8, 'bold'), 
@@ -339,28 +772,12 @@ class BEDEQD2Calculator:
             ab_label.grid(row=row, column=1, padx=2, sticky="w")
             
           
-            fx1_bed_label = self.create_clickable_label(scrollable_frame, row, 2)
-            fx2_bed_label = self.create_clickable_label(scrollable_frame, row, 3)
-            fx1_eqd2_label = self.create_clickable_label(scrollable_frame, row, 4)
-            fx2_eqd2_label = self.create_clickable_label(scrollable_frame, row, 5)
-            hdr_bed_label = self.create_clickable_label(scrollable_frame, row, 6)
-            hdr_eqd2_label = self.create_clickable_label(scrollable_frame, row, 7)
-            ebt_bed_label = self.create_clickable_label(scrollable_frame, row, 8)
-            ebt_eqd2_label = self.create_clickable_label(scrollable_frame, row, 9)
-            total_bed_label = self.create_clickable_label(scrollable_frame, row, 10)
-            total_eqd2_label = self.create_clickable_label(scrollable_frame, row, 11)
-            
+            # Same column order as the headers: fraction BEDs, fraction EQD2s, then the totals
+            label_keys = ([f'fx{n}_bed' for n in fraction_numbers] + [f'fx{n}_eqd2' for n in fraction_numbers] +
+                          list(self.TOTAL_FIELDS))
             self.structure_rows[struct_key] = {
-                'fx1_bed': fx1_bed_label,
-                'fx2_bed': fx2_bed_label,
-                'fx1_eqd2': fx1_eqd2_label,
-                'fx2_eqd2': fx2_eqd2_label,
-                'hdr_bed': hdr_bed_label,
-                'hdr_eqd2': hdr_eqd2_label,
-                'ebt_bed': ebt_bed_label,
-                'ebt_eqd2': ebt_eqd2_label,
-                'total_bed': total_bed_label,
-                'total_eqd2': total_eqd2_label
+                label_key: self.create_clickable_label(scrollable_frame, row, column)
+                for column, label_key in enumerate(label_keys, 2)
             }
         
        
@@ -373,6 +790,9 @@ class BEDEQD2Calculator:
         button_frame.grid_columnconfigure(0, weight=1)
         button_frame.grid_columnconfigure(1, weight=1)
         button_frame.grid_columnconfigure(2, weight=1)
+        button_frame.grid_columnconfigure(3, weight=1)
+        button_frame.grid_columnconfigure(4, weight=1)
+        button_frame.grid_columnconfigure(5, weight=1)
         
       
         calc_button = tk.Button(button_frame, text="Calculate All", 
@@ -398,9 +818,30 @@ class BEDEQD2Calculator:
                                  relief="raised", bd=2,
                                  width=15, height=1)
         export_button.grid(row=0, column=2, padx=5)
-        
-      
-        self.update_averages()
+
+        sweep_button = tk.Button(button_frame, text="Sensitivity Sweep", 
+                                command=self.open_sensitivity_sweep,
+                                bg="#8e44ad", fg="white",
+                                font=('Arial', 10, 'bold'),
+                                relief="raised", bd=2,
+                                width=15, height=1)
+        sweep_button.grid(row=0, column=3, padx=5)
+
+        batch_button = tk.Button(button_frame, text="Batch CSV...", 
+                                command=self.run_batch_csv,
+                                bg="#16a085", fg="white",
+                                font=('Arial', 10, 'bold'),
+                                relief="raised", bd=2,
+                                width=15, height=1)
+        batch_button.grid(row=0, column=4, padx=5)
+
+        dvh_button = tk.Button(button_frame, text="Import DVH...", 
+                              command=self.import_dvh,
+                              bg="#d35400", fg="white",
+                              font=('Arial', 10, 'bold'),
+                              relief="raised", bd=2,
+                              width=15, height=1)
+        dvh_button.grid(row=0, column=5, padx=5)
     
     def create_clickable_label(self, parent, row, column):
         """Create a label that can be clicked to copy its value"""
@@ -427,99 +868,104 @@ class BEDEQD2Calculator:
             label.pack()
             tooltip.after(1000, tooltip.destroy)
     
+    @staticmethod
+    def entry_value(var):
+        try:
+            return float(var.get())
+        except ValueError:
+            return np.nan
+
+    def bind_cell_graph(self):
+        """Live results: every Entry feeds an input cell of a CellGraph and every result label shows a derived cell"""
+        self.cells = bed_eqd2_cell_graph(list(self.structure_vars), self.FRACTION_COLUMNS)
+        self.cell_labels = {}
+        self.flush_pending = False
+        self.render_all_cells = False
+        entries = {'ebt_fractions': self.ebt_fractions, 'ebt_dose_per_fx': self.ebt_dose_per_fx,
+                   'hdr_rx_dose': self.hdr_prescription_dose}
+        for struct_key, vars_dict in self.structure_vars.items():
+            entries[f'{struct_key}.ab_ratio'] = vars_dict['ab_ratio']
+            for n in range(1, self.FRACTION_COLUMNS + 1):
+                entries[f'{struct_key}.fx{n}_percent'] = vars_dict[f'fx{n}_percent']
+            self.cell_labels[f'{struct_key}.avg_percent'] = vars_dict['avg_percent']
+            self.cell_labels[f'{struct_key}.total_dose'] = vars_dict['total_dose']
+            for label_key, label in self.structure_rows[struct_key].items():
+                self.cell_labels[f'{struct_key}.{label_key}'] = label
+
+        for cell, var in entries.items():
+            self.set_input_cell(cell, var)
+            var.trace_add("write", lambda *_, cell=cell, var=var: self.on_input_changed(cell, var))
+        self.flush_cells()
+
+    def set_input_cell(self, cell, var):
+        value = self.entry_value(var)
+        self.cells.set(cell, None if np.isnan(value) else value)
+
+    def on_input_changed(self, cell, var):
+        """Record a keystroke; the dependent labels are refreshed once per idle cycle"""
+        self.set_input_cell(cell, var)
+        if not self.flush_pending:
+            self.flush_pending = True
+            self.root.after_idle(self.flush_cells)
+
+    def flush_cells(self):
+        self.flush_pending = False
+        changed = self.cells.recompute()
+        if self.render_all_cells:
+            self.render_all_cells = False
+            changed = {cell: self.cells.values[cell] for cell in self.cell_labels}
+        for cell, value in changed.items():
+            label = self.cell_labels.get(cell)
+            if label is not None:
+                label.config(text="" if value is None else self.format_value(value))
+
+    def read_inputs(self):
+        """Entry values as lq_bed_eqd2() arguments, one row per structure; unparsable entries become NaN"""
+        value = self.entry_value
+        fraction_numbers = range(1, self.FRACTION_COLUMNS + 1)
+        return {
+            'hdr_percent': np.array([[value(vars_dict[f'fx{n}_percent']) for n in fraction_numbers]
+                                     for vars_dict in self.structure_vars.values()]),
+            'ab_ratio': np.array([value(vars_dict['ab_ratio']) for vars_dict in self.structure_vars.values()]),
+            'hdr_rx_dose': value(self.hdr_prescription_dose),
+            'ebt_fractions': value(self.ebt_fractions),
+            'ebt_dose_per_fx': value(self.ebt_dose_per_fx)
+        }
+
+    def result_columns(self, results):
+        """Per-structure arrays keyed like the result labels"""
+        columns = {}
+        for n in range(1, self.FRACTION_COLUMNS + 1):
+            columns[f'fx{n}_bed'] = results['fraction_bed'][:, n - 1]
+            columns[f'fx{n}_eqd2'] = results['fraction_eqd2'][:, n - 1]
+        for field in self.TOTAL_FIELDS:
+            columns[field] = results[field]
+        return columns
+
+    @staticmethod
+    def format_value(value):
+        return f"{value:.4f}" if np.isfinite(value) else ""
+
     def update_averages(self):
       
-        try:
-            hdr_rx_dose = float(self.hdr_prescription_dose.get())
-            
-            for struct_key in self.structure_vars:
-                try:
-                    fx1_percent = float(self.structure_vars[struct_key]['fx1_percent'].get())
-                    fx2_percent = float(self.structure_vars[struct_key]['fx2_percent'].get())
-                    
-                 
-                    avg_percent = (fx1_percent + fx2_percent) / 2
-                    self.structure_vars[struct_key]['avg_percent'].config(text=f"{avg_percent:.4f}")
-                    
-                   
-                    fx1_dose = (fx1_percent / 100) * hdr_rx_dose
-                    fx2_dose = (fx2_percent / 100) * hdr_rx_dose
-                    total_dose = fx1_dose + fx2_dose
-                    self.structure_vars[struct_key]['total_dose'].config(text=f"{total_dose:.4f}")
-                    
-                except:
-                    self.structure_vars[struct_key]['avg_percent'].config(text="")
-                    self.structure_vars[struct_key]['total_dose'].config(text="")
-        except:
-            pass
-    
-    def calculate_fraction_bed_eqd2(self, dose, ab_ratio):
-   
-        bed = dose * (1 + (dose / ab_ratio))
-        eqd2 = bed / (1 + (2 / ab_ratio))
-        return bed, eqd2
-    
-    def calculate_bed_eqd2(self, total_dose, dose_per_fraction, ab_ratio):
-        
-        bed = total_dose * (1 + (dose_per_fraction / ab_ratio))
-        eqd2 = bed / (1 + (2 / ab_ratio))
-        return bed, eqd2
+        inputs = self.read_inputs()
+        results = lq_bed_eqd2(**inputs)
+        for s, struct_key in enumerate(self.structure_vars):
+            self.structure_vars[struct_key]['avg_percent'].config(text=self.format_value(results['average_percent'][s]))
+            self.structure_vars[struct_key]['total_dose'].config(text=self.format_value(results['hdr_dose'][s]))
     
     def calculate_all(self):
        
-        try:
-       
-            self.update_averages()
-            
-           
-            ebt_fx = float(self.ebt_fractions.get())
-            ebt_dose_fx = float(self.ebt_dose_per_fx.get())
-            hdr_rx_dose = float(self.hdr_prescription_dose.get())
-            
-        
-            for struct_key, vars_dict in self.structure_vars.items():
-             
-                ab_ratio = float(vars_dict['ab_ratio'].get())
-                
-               
-                fx1_percent = float(vars_dict['fx1_percent'].get())
-                fx2_percent = float(vars_dict['fx2_percent'].get())
-                
-                fx1_dose = (fx1_percent / 100) * hdr_rx_dose
-                fx2_dose = (fx2_percent / 100) * hdr_rx_dose
-                total_hdr_dose = fx1_dose + fx2_dose
-                
-                
-                fx1_bed, fx1_eqd2 = self.calculate_fraction_bed_eqd2(fx1_dose, ab_ratio)
-                fx2_bed, fx2_eqd2 = self.calculate_fraction_bed_eqd2(fx2_dose, ab_ratio)
-                
-          
-                hdr_bed_total = fx1_bed + fx2_bed
-                hdr_eqd2 = hdr_bed_total / (1 + (2 / ab_ratio))
-                
-     
-                ebt_total_dose = ebt_fx * ebt_dose_fx
-                ebt_bed, ebt_eqd2 = self.calculate_bed_eqd2(ebt_total_dose, ebt_dose_fx, ab_ratio)
-                
-               
-                total_bed = ebt_bed + hdr_bed_total
-                total_eqd2 = total_bed / (1 + (2 / ab_ratio))
-                
-                
-                self.structure_rows[struct_key]['fx1_bed'].config(text=f"{fx1_bed:.4f}")
-                self.structure_rows[struct_key]['fx2_bed'].config(text=f"{fx2_bed:.4f}")
-                self.structure_rows[struct_key]['fx1_eqd2'].config(text=f"{fx1_eqd2:.4f}")
-                self.structure_rows[struct_key]['fx2_eqd2'].config(text=f"{fx2_eqd2:.4f}")
-                self.structure_rows[struct_key]['hdr_bed'].config(text=f"{hdr_bed_total:.4f}")
-                self.structure_rows[struct_key]['hdr_eqd2'].config(text=f"{hdr_eqd2:.4f}")
-                self.structure_rows[struct_key]['ebt_bed'].config(text=f"{ebt_bed:.4f}")
-                self.structure_rows[struct_key]['ebt_eqd2'].config(text=f"{ebt_eqd2:.4f}")
-                self.structure_rows[struct_key]['total_bed'].config(text=f"{total_bed:.4f}")
-                self.structure_rows[struct_key]['total_eqd2'].config(text=f"{total_eqd2:.4f}")
-        
-            
-        except ValueError as e:
+        self.update_averages()
+        inputs = self.read_inputs()
+        if any(np.isnan(values).any() for values in inputs.values()):
             messagebox.showerror("Input Error", "Please check all input values are valid numbers")
+            return
+
+        columns = self.result_columns(lq_bed_eqd2(**inputs))
+        for s, struct_key in enumerate(self.structure_rows):
+            for label_key, label in self.structure_rows[struct_key].items():
+                label.config(text=self.format_value(columns[label_key][s]))
     
     def clear_all(self):
        
@@ -527,66 +973,231 @@ class BEDEQD2Calculator:
             self.structure_vars[struct_key]['avg_percent'].config(text="")
             self.structure_vars[struct_key]['total_dose'].config(text="")
         
-        for struct_key in self.structure_rows:
-            self.structure_rows[struct_key]['fx1_bed'].config(text="")
-            self.structure_rows[struct_key]['fx2_bed'].config(text="")
-            self.structure_rows[struct_key]['fx1_eqd2'].config(text="")
-            self.structure_rows[struct_key]['fx2_eqd2'].config(text="")
-            self.structure_rows[struct_key]['hdr_bed'].config(text="")
-            self.structure_rows[struct_key]['hdr_eqd2'].config(text="")
-            self.structure_rows[struct_key]['ebt_bed'].config(text="")
-            self.structure_rows[struct_key]['ebt_eqd2'].config(text="")
-            self.structure_rows[struct_key]['total_bed'].config(text="")
-            self.structure_rows[struct_key]['total_eqd2'].config(text="")
-    
+        for labels in self.structure_rows.values():
+            for label in labels.values():
+                label.config(text="")
+        # Live updates would otherwise refill only the cells the next edit changes
+        self.render_all_cells = True
+    
+    def sweep_regimens(self, inputs):
+        """The entered EBT regimen followed by the standard ones"""
+        current = (inputs['ebt_fractions'], inputs['ebt_dose_per_fx'])
+        return [current] + [regimen for regimen in self.SWEEP_EBT_REGIMENS
+                            if not np.allclose(regimen, current)]
+
+    def sensitivity_sweep(self, inputs):
+        """(ab_ratios, dose_scales, regimens, total EQD2 (S, A, K, R)) for the given inputs, cached"""
+        regimens = self.sweep_regimens(inputs)
+        key = (inputs['hdr_percent'].tobytes(), inputs['hdr_rx_dose'], tuple(regimens))
+        sweep = self.sweep_cache.pop(key, None)
+        if sweep is None:
+            sweep = bed_eqd2_sweep(inputs['hdr_percent'], self.SWEEP_AB_RATIOS,
+                                   self.SWEEP_DOSE_SCALES, regimens, inputs['hdr_rx_dose'])
+        # Dicts keep insertion order: re-inserting marks the entry as most recently used
+        self.sweep_cache[key] = sweep
+        while len(self.sweep_cache) > self.SWEEP_CACHE_SIZE:
+            del self.sweep_cache[next(iter(self.sweep_cache))]
+        return self.SWEEP_AB_RATIOS, self.SWEEP_DOSE_SCALES, regimens, sweep
+
+    def open_sensitivity_sweep(self):
+        """Heatmaps of total EQD2 over α/β and HDR dose scale, one panel per structure"""
+        inputs = self.read_inputs()
+        if any(np.isnan(values).any() for values in inputs.values()):
+            messagebox.showerror("Input Error", "Please check all input values are valid numbers")
+            return
+        ab_ratios, scales, regimens, eqd2 = self.sensitivity_sweep(inputs)
+        names = [display_name for _, display_name, _, _ in self.STRUCTURES]
+        limits = [self.EQD2_LIMITS_GY.get(struct_key) for struct_key, _, _, _ in self.STRUCTURES]
+
+        window = tk.Toplevel(self.root)
+        window.title("BED & EQD2 Sensitivity Sweep")
+        window.geometry("1300x900")
+        controls = tk.Frame(window, bg="#f5f5f5")
+        controls.pack(fill=tk.X, padx=10, pady=5)
+        tk.Label(controls, text="EBT regimen:", bg="#f5f5f5", fg="#2c3e50").pack(side=tk.LEFT)
+        labels = [f"{n:g} x {d:g} Gy" for n, d in regimens]
+        regimen_var = tk.StringVar(value=labels[0])
+        ttk.Combobox(controls, textvariable=regimen_var, values=labels, state="readonly", width=15).pack(side=tk.LEFT, padx=5)
+        summary_label = tk.Label(window, text="", bg="#f5f5f5", fg="#2c3e50", font=('Courier', 9), justify=tk.LEFT)
+        summary_label.pack(fill=tk.X, padx=10)
+
+        fig = plt.figure(figsize=(12, 8))
+        canvas = FigureCanvasTkAgg(fig, window)
+        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        window.bind("<Destroy>", lambda e: plt.close(fig) if e.widget is window else None)
+
+        def draw(*_):
+            r = labels.index(regimen_var.get())
+            n, d = regimens[r]
+            crossing = eqd2_limit_scale(inputs['hdr_percent'], inputs['ab_ratio'], inputs['hdr_rx_dose'], n, d,
+                                        np.array([np.nan if limit is None else limit for limit in limits]))
+            fig.clf()
+            summary = [f"EBT {n:g} x {d:g} Gy - HDR dose factor reaching each EQD2 limit at the entered α/β:"]
+            for s, name in enumerate(names):
+                ax = fig.add_subplot(2, (len(names) + 1) // 2, s + 1)
+                mesh = ax.pcolormesh(ab_ratios, scales * 100, eqd2[s, :, :, r].T, shading="auto", cmap="viridis")
+                fig.colorbar(mesh, ax=ax, label="Total EQD2 [Gy]")
+                if limits[s] is not None:
+                    contour = ax.contour(ab_ratios, scales * 100, eqd2[s, :, :, r].T, levels=[limits[s]],
+                                         colors="red", linewidths=1.5)
+                    ax.clabel(contour, fmt=f"{limits[s]:g} Gy", fontsize=8)
+                    summary.append(f"  {name:<8} α/β {inputs['ab_ratio'][s]:g}: x{crossing[s]:.3f} "
+                                   f"of the entered HDR dose for {limits[s]:g} Gy")
+                ax.plot(inputs['ab_ratio'][s], 100, marker="o", color="white", markeredgecolor="black")
+                ax.set_title(name)
+                ax.set_xlabel("α/β [Gy]")
+                ax.set_ylabel("HDR dose [% of entered]")
+            fig.tight_layout()
+            canvas.draw()
+            summary_label.config(text="\n".join(summary))
+
+        regimen_var.trace_add("write", draw)
+        draw()
+
+    def run_batch_csv(self):
+        """Run stream_bed_eqd2_csv() on a chosen cohort CSV in a worker thread"""
+        input_path = filedialog.askopenfilename(title="Select cohort CSV",
+                                                filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+        if not input_path:
+            return
+        stem = os.path.splitext(os.path.basename(input_path))[0]
+        output_path = filedialog.asksaveasfilename(title="Save BED/EQD2 results as",
+                                                   initialdir=os.path.dirname(input_path),
+                                                   initialfile=f"{stem}_bed_eqd2.csv",
+                                                   defaultextension=".csv",
+                                                   filetypes=[("CSV files", "*.csv")])
+        if not output_path:
+            return
+
+        outcome = {}
+
+        def work():
+            started = time.perf_counter()
+            try:
+                outcome["path"], outcome["rows"] = stream_bed_eqd2_csv(input_path, output_path)
+                outcome["elapsed"] = time.perf_counter() - started
+            except Exception as e:
+                outcome["error"] = str(e)
+
+        worker = threading.Thread(target=work, name="bed-eqd2-batch", daemon=True)
+        worker.start()
+
+        def poll():
+            if worker.is_alive():
+                self.root.after(200, poll)
+            elif "error" in outcome:
+                print(f"❌ Batch BED/EQD2 failed: {outcome['error']}")
+                messagebox.showerror("Batch Error", f"Could not process {os.path.basename(input_path)}:\n{outcome['error']}")
+            else:
+                print(f"✅ Batch BED/EQD2: {outcome['rows']:,} rows -> {outcome['path']} ({outcome['elapsed']:.1f} s)")
+                messagebox.showinfo("Batch Complete", f"{outcome['rows']:,} rows written to\n{outcome['path']}")
+
+        poll()
+
+    def dvh_structure_row(self, name):
+        """Calculator structure key fed by a DVH structure, or None"""
+        lower = name.lower()
+        return next((row for fragment, row in self.DVH_STRUCTURE_ROWS.items() if fragment in lower), None)
+
+    def import_dvh(self):
+        """EQD2 dose-volume parameters from one DVH export per HDR fraction"""
+        paths = filedialog.askopenfilenames(title="Select DVH exports - one per HDR fraction",
+                                            filetypes=[("DVH exports", "*.txt *.csv"), ("All files", "*.*")])
+        if not paths:
+            return
+        # File names decide the fraction order
+        paths = sorted(paths)
+        try:
+            dvhs = [read_dvh_file(path) for path in paths]
+        except Exception as e:
+            print(f"❌ DVH import failed: {e}")
+            messagebox.showerror("DVH Import", f"Could not read the DVH files:\n{e}")
+            return
+        names = [name for name in dvhs[0] if all(name in dvh for dvh in dvhs[1:])]
+        if not names:
+            messagebox.showerror("DVH Import", "No structure appears in every selected DVH file")
+            return
+
+        inputs = self.read_inputs()
+        ab_by_row = dict(zip(self.structure_vars, inputs['ab_ratio']))
+        rx = inputs['hdr_rx_dose']
+        labels = [label for label, _, _ in DVH_METRICS]
+        lines = [f"{len(paths)} HDR fraction(s): " + ", ".join(os.path.basename(p) for p in paths),
+                 f"EBT {inputs['ebt_fractions']:g} x {inputs['ebt_dose_per_fx']:g} Gy; fraction parameters are "
+                 f"added in EQD2 (same sub-volume assumed in every fraction)", ""]
+        applied = {}
+        for name in names:
+            row = self.dvh_structure_row(name)
+            if row is not None:
+                ab = ab_by_row[row]
+            else:
+                ab = 10.0 if any(target in name.lower() for target in self.DVH_TARGET_NAMES) else 3.0
+            summary = dvh_eqd2_summary([dvh[name] for dvh in dvhs], ab,
+                                       inputs['ebt_fractions'], inputs['ebt_dose_per_fx'])
+            lines.append(f"{name} (α/β {ab:g} Gy)" + (f" -> {row}" if row else ""))
+            lines.append(f"    {'':<8}" + "".join(f"{label:>19}" for label in labels))
+            for f in range(len(paths)):
+                lines.append(f"    Fx{f + 1:<6}" + "".join(
+                    f"{summary['physical'][f, m]:>8.2f} Gy ({summary['eqd2'][f, m]:5.2f})"
+                    for m in range(len(labels))))
+            lines.append(f"    {'EQD2 total':<8}" + "".join(f"{summary['total_eqd2'][m]:>16.2f} Gy"
+                                                       for m in range(len(labels))))
+            lines.append(f"    (EBT contributes {summary['ebt_eqd2']:.2f} Gy EQD2)")
+            lines.append("")
+            d2cc = summary['physical'][:, 0]
+            if row is not None and row not in applied and np.isfinite(d2cc).all() and np.isfinite(rx) and rx > 0:
+                applied[row] = d2cc / rx * 100.0
+        lines = [line.replace("nan Gy", "n/a").replace("(  nan)", "") for line in lines]
+
+        window = tk.Toplevel(self.root)
+        window.title("DVH EQD2 Analysis")
+        window.geometry("1000x650")
+
+        def apply_d2cc():
+            for row, percents in applied.items():
+                for n, percent in enumerate(percents[:self.FRACTION_COLUMNS], 1):
+                    self.structure_vars[row][f'fx{n}_percent'].set(f"{percent:.4f}")
+            self.calculate_all()
+            if len(paths) > self.FRACTION_COLUMNS:
+                messagebox.showwarning("DVH Import", f"Only the first {self.FRACTION_COLUMNS} fractions fit the calculator "
+                                                     f"columns; the totals above include all {len(paths)}.")
+
+        if applied:
+            tk.Button(window, text="Use D2cc for " + ", ".join(applied), command=apply_d2cc,
+                      bg="#d35400", fg="white", font=('Arial', 10, 'bold')).pack(pady=5)
+        text_widget = tk.Text(window, wrap=tk.NONE, font=("Courier", 10), padx=15, pady=15)
+        scrollbar = tk.Scrollbar(window, orient=tk.VERTICAL, command=text_widget.yview)
+        text_widget.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        text_widget.pack(fill=tk.BOTH, expand=True)
+        text_widget.insert(tk.END, "\n".join(lines))
+        text_widget.config(state=tk.DISABLED)
+
     def export_to_csv(self):
         """Export results to CSV file with all fraction-wise details"""
         try:
+            inputs = self.read_inputs()
+            if any(np.isnan(values).any() for values in inputs.values()):
+                raise ValueError("Please check all input values are valid numbers")
+            results = lq_bed_eqd2(**inputs)
+            fraction_numbers = range(1, self.FRACTION_COLUMNS + 1)
+
             data = []
-            structures_display = {
-                'point_A': 'Point A',
-                'point_B': 'Point B',
-                'bladder': 'Bladder',
-                'rectum': 'Rectum'
-            }
-            
-            # Get EBT parameters for the export
-            ebt_fx = float(self.ebt_fractions.get())
-            ebt_dose_fx = float(self.ebt_dose_per_fx.get())
-            ebt_total_dose = ebt_fx * ebt_dose_fx
-            
-            hdr_rx_dose = float(self.hdr_prescription_dose.get())
-            
-            for struct_key, display_name in structures_display.items():
-                # Get fraction data
-                fx1_percent = float(self.structure_vars[struct_key]['fx1_percent'].get())
-                fx2_percent = float(self.structure_vars[struct_key]['fx2_percent'].get())
-                fx1_dose = (fx1_percent / 100) * hdr_rx_dose
-                fx2_dose = (fx2_percent / 100) * hdr_rx_dose
-                
-                # Calculate EBT components for this structure's α/β
-                ab_ratio = float(self.structure_vars[struct_key]['ab_ratio'].get())
-                ebt_bed, ebt_eqd2 = self.calculate_bed_eqd2(ebt_total_dose, ebt_dose_fx, ab_ratio)
-                
-                row_data = {
-                    'Structure': display_name,
-                    'α/β_Ratio': ab_ratio,
-                    'Fx1_%Rx': fx1_percent,
-                    'Fx2_%Rx': fx2_percent,
-                    'Fx1_Dose_Gy': f"{fx1_dose:.4f}",
-                    'Fx2_Dose_Gy': f"{fx2_dose:.4f}",
-                    'Total_HDR_Dose_Gy': self.structure_vars[struct_key]['total_dose'].cget('text'),
-                    'BED_Fx1': self.structure_rows[struct_key]['fx1_bed'].cget('text'),
-                    'BED_Fx2': self.structure_rows[struct_key]['fx2_bed'].cget('text'),
-                    'EQD2_Fx1': self.structure_rows[struct_key]['fx1_eqd2'].cget('text'),
-                    'EQD2_Fx2': self.structure_rows[struct_key]['fx2_eqd2'].cget('text'),
-                    'HDR_BED_Total': self.structure_rows[struct_key]['hdr_bed'].cget('text'),
-                    'HDR_EQD2': self.structure_rows[struct_key]['hdr_eqd2'].cget('text'),
-                    'EBT_BED': f"{ebt_bed:.4f}",
-                    'EBT_EQD2': f"{ebt_eqd2:.4f}",
-                    'Total_BED': self.structure_rows[struct_key]['total_bed'].cget('text'),
-                    'Total_EQD2': self.structure_rows[struct_key]['total_eqd2'].cget('text')
-                }
+            for s, (_, display_name, _, _) in enumerate(self.STRUCTURES):
+                row_data = {'Structure': display_name, 'α/β_Ratio': inputs['ab_ratio'][s]}
+                row_data.update({f'Fx{n}_%Rx': inputs['hdr_percent'][s, n - 1] for n in fraction_numbers})
+                row_data.update({f'Fx{n}_Dose_Gy': f"{results['fraction_dose'][s, n - 1]:.4f}" for n in fraction_numbers})
+                row_data['Total_HDR_Dose_Gy'] = f"{results['hdr_dose'][s]:.4f}"
+                row_data.update({f'BED_Fx{n}': f"{results['fraction_bed'][s, n - 1]:.4f}" for n in fraction_numbers})
+                row_data.update({f'EQD2_Fx{n}': f"{results['fraction_eqd2'][s, n - 1]:.4f}" for n in fraction_numbers})
+                row_data.update({
+                    'HDR_BED_Total': f"{results['hdr_bed'][s]:.4f}",
+                    'HDR_EQD2': f"{results['hdr_eqd2'][s]:.4f}",
+                    'EBT_BED': f"{results['ebt_bed'][s]:.4f}",
+                    'EBT_EQD2': f"{results['ebt_eqd2'][s]:.4f}",
+                    'Total_BED': f"{results['total_bed'][s]:.4f}",
+                    'Total_EQD2': f"{results['total_eqd2'][s]:.4f}"
+                })
                 data.append(row_data)
             
             df = pd.DataFrame(data)
@@ -615,10 +1226,21 @@ import numpy as np
 from datetime import datetime
 import json
 import os
+import glob
 import math
 import re
 import tempfile
+import shutil
 import sys
+import hashlib
+import io
+import queue
+import threading
+import socket
+import uuid
+import time
+import sqlite3
+from contextlib import closing
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
@@ -634,6 +1256,2148 @@ from reportlab.pdfbase.ttfonts import TTFont
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_pdf import PdfPages
 
+
+def _registration_gray(img):
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    img = img.astype(np.float32)
+    lo, hi = float(img.min()), float(img.max())
+    if hi > lo:
+        img = (img - lo) / (hi - lo)
+    return img
+
+
+def estimate_fraction_registration(moving_img, fixed_img, motion="rigid",
+                                   coarse_size=256, max_size=1024,
+                                   iterations=60, eps=1e-5):
+    """Estimate the 2x3 matrix mapping fraction-1 (moving) pixels onto fraction 2 (fixed).
+
+    Coarse-to-fine: phase correlation on the smallest pyramid level gives the
+    starting translation, then ECC refines a rigid ("rigid") or similarity
+    ("similarity") transform level by level up to ``max_size`` pixels.
+    Returns (matrix, ecc_score) in full-resolution pixel coordinates. Raises
+    RuntimeError when ECC converges at no level, rather than returning the
+    unchecked phase-correlation shift.
+    """
+    moving = _registration_gray(moving_img)
+    fixed = _registration_gray(fixed_img)
+
+    fh, fw = fixed.shape[:2]
+    mh, mw = moving.shape[:2]
+    # Bring fraction 1 onto the fraction 2 grid; undone by `pre` at the end
+    pre = np.array([[fw / mw, 0, 0], [0, fh / mh, 0], [0, 0, 1]], dtype=np.float64)
+    if (mh, mw) != (fh, fw):
+        moving = cv2.resize(moving, (fw, fh), interpolation=cv2.INTER_AREA)
+
+    moving_levels, fixed_levels = [moving], [fixed]
+    while max(moving_levels[-1].shape) > coarse_size:
+        moving_levels.append(cv2.pyrDown(moving_levels[-1]))
+        fixed_levels.append(cv2.pyrDown(fixed_levels[-1]))
+    finest = 0
+    while finest < len(fixed_levels) - 1 and max(fixed_levels[finest].shape) > max_size:
+        finest += 1
+
+    coarse_m, coarse_f = moving_levels[-1], fixed_levels[-1]
+    window = cv2.createHanningWindow(coarse_f.shape[::-1], cv2.CV_32F)
+    (tx, ty), _ = cv2.phaseCorrelate(coarse_m, coarse_f, window)
+    warp = np.array([[1, 0, tx], [0, 1, ty]], dtype=np.float32)
+
+    ecc_motion = cv2.MOTION_EUCLIDEAN if motion == "rigid" else cv2.MOTION_AFFINE
+    criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, iterations, eps)
+    score = None
+    for level in range(len(fixed_levels) - 1, finest - 1, -1):
+        if level != len(fixed_levels) - 1:
+            warp[:, 2] *= 2.0
+        try:
+            score, warp = cv2.findTransformECC(
+                moving_levels[level], fixed_levels[level], warp, ecc_motion, criteria, None, 5
+            )
+        except cv2.error as e:
+            print(f"ECC did not converge at pyramid level {level}: {e}")
+        if motion == "similarity":
+            a = (warp[0, 0] + warp[1, 1]) / 2.0
+            b = (warp[1, 0] - warp[0, 1]) / 2.0
+            warp[0, 0], warp[0, 1], warp[1, 0], warp[1, 1] = a, -b, b, a
+    if score is None:
+        raise RuntimeError("ECC did not converge at any pyramid level - align the anatomy manually")
+    warp[:, 2] *= 2.0 ** finest
+
+    matrix = np.vstack([warp.astype(np.float64), [0, 0, 1]]) @ pre
+    return matrix[:2], float(score)
+
+
+def registration_to_display(matrix, moving_scale, fixed_scale):
+    """Re-express a full-resolution registration matrix in display (canvas) pixels."""
+    to_full = np.diag([1.0 / moving_scale, 1.0 / moving_scale, 1.0])
+    to_display = np.diag([fixed_scale, fixed_scale, 1.0])
+    return (to_display @ np.vstack([matrix, [0, 0, 1]]) @ to_full)[:2]
+
+
+def transform_polylines(polylines, matrix):
+    """Apply a 2x3 matrix to a list of polylines, returning integer (x, y) tuples."""
+    transformed = []
+    for poly in polylines:
+        pts = np.asarray(poly, dtype=np.float64).reshape(-1, 2)
+        moved = pts @ matrix[:, :2].T + matrix[:, 2]
+        transformed.append([(int(round(x)), int(round(y))) for x, y in moved])
+    return transformed
+
+
+class FeatureSnapMap:
+    """Edge/ridge/corner response of an enhanced image, used to snap landmark clicks."""
+
+    _cache = {}
+    _cache_lock = threading.Lock()
+    _cache_size = 8
+
+    def __init__(self, radius=8, threshold=0.25):
+        self.radius = radius
+        self.threshold = threshold
+        self.response = None
+        self.ready = threading.Event()
+        yy, xx = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+        dist = np.sqrt(xx ** 2 + yy ** 2)
+        # Slight preference for nearer pixels when responses are similar
+        self._weight = np.where(dist <= radius, 1.0 - 0.3 * dist / radius, 0.0).astype(np.float32)
+
+    @classmethod
+    def for_image(cls, image, radius=8):
+        """Return the cached map for this image content, starting a background build on a miss."""
+        image = np.ascontiguousarray(image)
+        cache_key = (hashlib.sha1(image).hexdigest(), image.shape, radius)
+        with cls._cache_lock:
+            snap_map = cls._cache.get(cache_key)
+            if snap_map is not None:
+                return snap_map
+            snap_map = cls(radius=radius)
+            cls._cache[cache_key] = snap_map
+            while len(cls._cache) > cls._cache_size:
+                cls._cache.pop(next(iter(cls._cache)))
+        threading.Thread(target=snap_map.build, args=(image.copy(),), daemon=True).start()
+        return snap_map
+
+    @staticmethod
+    def _normalise(values):
+        top = float(np.percentile(values, 99.9))
+        if top <= 0:
+            return np.zeros_like(values, dtype=np.float32)
+        return np.clip(values / top, 0.0, 1.0).astype(np.float32)
+
+    def build(self, image):
+        try:
+            gray = image
+            if gray.ndim == 3:
+                gray = cv2.cvtColor(gray, cv2.COLOR_BGR2GRAY)
+            gray = cv2.GaussianBlur(gray.astype(np.float32) / 255.0, (5, 5), 1.2)
+
+            gx = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=3)
+            gy = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=3)
+            edge = self._normalise(cv2.magnitude(gx, gy))
+
+            # Largest Hessian eigenvalue picks out the tandem/ovoid tube ridges
+            dxx = cv2.Sobel(gray, cv2.CV_32F, 2, 0, ksize=5)
+            dyy = cv2.Sobel(gray, cv2.CV_32F, 0, 2, ksize=5)
+            dxy = cv2.Sobel(gray, cv2.CV_32F, 1, 1, ksize=5)
+            ridge = self._normalise(np.abs(0.5 * (dxx + dyy)) + np.sqrt(0.25 * (dxx - dyy) ** 2 + dxy ** 2))
+
+            corner = self._normalise(cv2.cornerMinEigenVal(gray, 5, 3))
+
+            response = np.maximum(np.maximum(edge, ridge), corner)
+            r = self.radius
+            self.response = cv2.copyMakeBorder(response, r, r, r, r, cv2.BORDER_CONSTANT, value=0)
+            self.ready.set()
+        except Exception as e:
+            print(f"❌ Snap map build failed: {e}")
+
+    def snap(self, x, y):
+        """Return the strongest feature within the snap radius of (x, y), or (x, y) itself."""
+        if not self.ready.is_set():
+            return x, y
+        r = self.radius
+        h, w = self.response.shape
+        if not (0 <= x < w - 2 * r and 0 <= y < h - 2 * r):
+            return x, y
+        window = self.response[y:y + 2 * r + 1, x:x + 2 * r + 1]
+        scored = window * self._weight
+        idx = int(np.argmax(scored))
+        wy, wx = divmod(idx, 2 * r + 1)
+        if window[wy, wx] < self.threshold:
+            return x, y
+        return x + wx - r, y + wy - r
+
+
+class PolylineGridIndex:
+    """Uniform-grid spatial index over polyline segments, for hit-testing and vertex edits."""
+
+    def __init__(self, polylines, cell_size=32):
+        self.cell_size = float(cell_size)
+        self.points = [np.asarray(poly, dtype=np.float64).reshape(-1, 2).copy() for poly in polylines]
+        self.cells = {}
+        for p, pts in enumerate(self.points):
+            for s in range(self._segment_count(p)):
+                self._insert_segment(p, s)
+
+    def _segment_count(self, p):
+        return max(len(self.points[p]) - 1, 1) if len(self.points[p]) else 0
+
+    def _segment(self, p, s):
+        pts = self.points[p]
+        return pts[s], pts[min(s + 1, len(pts) - 1)]
+
+    def _segment_cells(self, p, s):
+        a, b = self._segment(p, s)
+        x0, y0 = np.floor(np.minimum(a, b) / self.cell_size).astype(int)
+        x1, y1 = np.floor(np.maximum(a, b) / self.cell_size).astype(int)
+        return [(cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1)]
+
+    def _insert_segment(self, p, s):
+        for cell in self._segment_cells(p, s):
+            self.cells.setdefault(cell, set()).add((p, s))
+
+    def _remove_segment(self, p, s):
+        for cell in self._segment_cells(p, s):
+            bucket = self.cells.get(cell)
+            if bucket is not None:
+                bucket.discard((p, s))
+                if not bucket:
+                    del self.cells[cell]
+
+    def _candidates(self, x, y, radius):
+        x0, y0 = int(np.floor((x - radius) / self.cell_size)), int(np.floor((y - radius) / self.cell_size))
+        x1, y1 = int(np.floor((x + radius) / self.cell_size)), int(np.floor((y + radius) / self.cell_size))
+        found = set()
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                found.update(self.cells.get((cx, cy), ()))
+        return sorted(found)
+
+    def hit_test(self, x, y, tolerance=10):
+        """Nearest segment within tolerance as (polyline, segment, distance), else None."""
+        candidates = self._candidates(x, y, tolerance)
+        if not candidates:
+            return None
+        a = np.array([self._segment(p, s)[0] for p, s in candidates])
+        b = np.array([self._segment(p, s)[1] for p, s in candidates])
+        q = np.array([x, y], dtype=np.float64)
+        ab = b - a
+        denom = np.einsum("ij,ij->i", ab, ab)
+        t = np.clip(np.einsum("ij,ij->i", q - a, ab) / np.where(denom > 0, denom, 1.0), 0.0, 1.0)
+        dist = np.linalg.norm(a + t[:, None] * ab - q, axis=1)
+        best = int(np.argmin(dist))
+        if dist[best] > tolerance:
+            return None
+        p, s = candidates[best]
+        return p, s, float(dist[best])
+
+    def nearest_vertex(self, x, y, max_dist=8):
+        """Nearest vertex within max_dist as (polyline, vertex, distance), else None."""
+        vertices = sorted({(p, v) for p, s in self._candidates(x, y, max_dist)
+                           for v in (s, min(s + 1, len(self.points[p]) - 1))})
+        if not vertices:
+            return None
+        pts = np.array([self.points[p][v] for p, v in vertices])
+        dist = np.hypot(pts[:, 0] - x, pts[:, 1] - y)
+        best = int(np.argmin(dist))
+        if dist[best] > max_dist:
+            return None
+        p, v = vertices[best]
+        return p, v, float(dist[best])
+
+    def move_vertex(self, p, v, x, y):
+        """Move one vertex, re-indexing only the segments that touch it."""
+        touched = [s for s in (v - 1, v) if 0 <= s < self._segment_count(p)]
+        for s in touched:
+            self._remove_segment(p, s)
+        self.points[p][v] = (x, y)
+        for s in touched:
+            self._insert_segment(p, s)
+
+
+def apply_affine_points(points, matrix):
+    """Apply a 2x3 matrix to an (..., 2) array of points."""
+    pts = np.asarray(points, dtype=np.float64)
+    return pts @ np.asarray(matrix)[:, :2].T + np.asarray(matrix)[:, 2]
+
+
+def resample_polyline(points, n_samples=64):
+    """Resample a polyline to n_samples points spaced equally along its arc length."""
+    pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(pts) < 2:
+        return np.repeat(pts[:1], n_samples, axis=0)
+    arc = np.concatenate([[0.0], np.cumsum(np.linalg.norm(np.diff(pts, axis=0), axis=1))])
+    if arc[-1] == 0:
+        return np.repeat(pts[:1], n_samples, axis=0)
+    t = np.linspace(0.0, arc[-1], n_samples)
+    return np.column_stack([np.interp(t, arc, pts[:, 0]), np.interp(t, arc, pts[:, 1])])
+
+
+def fit_similarity_transform(src, dst, allow_scale=False):
+    """Least-squares rigid (or similarity) 2x3 matrix taking src points onto dst (Umeyama)."""
+    src = np.asarray(src, dtype=np.float64)
+    dst = np.asarray(dst, dtype=np.float64)
+    mu_src, mu_dst = src.mean(axis=0), dst.mean(axis=0)
+    src_c, dst_c = src - mu_src, dst - mu_dst
+    U, S, Vt = np.linalg.svd(dst_c.T @ src_c / len(src))
+    D = np.diag([1.0, np.sign(np.linalg.det(U @ Vt)) or 1.0])
+    R = U @ D @ Vt
+    s = 1.0
+    if allow_scale:
+        var_src = (src_c ** 2).sum() / len(src)
+        if var_src > 0:
+            s = float(np.trace(np.diag(S) @ D) / var_src)
+    t = mu_dst - s * R @ mu_src
+    return np.column_stack([s * R, t])
+
+
+def register_anatomy_polylines(fixed_polylines, moving_polylines, n_samples=64,
+                               allow_scale=False, max_iterations=30, tolerance=1e-4):
+    """Register the whole moving anatomy onto the fixed anatomy.
+
+    Each polyline is resampled to equal arc length; an index-wise Procrustes fit
+    (trying both drawing directions) seeds an ICP refinement. Returns a dict with
+    the 2x3 "matrix" mapping moving coordinates into the fixed frame and the
+    residual "rms" in pixels.
+    """
+    fixed = np.vstack([resample_polyline(p, n_samples) for p in fixed_polylines])
+    moving_parts = [resample_polyline(p, n_samples) for p in moving_polylines]
+    moving = np.vstack(moving_parts)
+
+    def rms_of(points, matrix, targets):
+        return float(np.sqrt(((apply_affine_points(points, matrix) - targets) ** 2).sum(axis=1).mean()))
+
+    if len(moving) == len(fixed):
+        reversed_moving = np.vstack([part[::-1] for part in moving_parts])
+        seeds = []
+        for candidate in (moving, reversed_moving):
+            seed = fit_similarity_transform(candidate, fixed, allow_scale)
+            seeds.append((rms_of(candidate, seed, fixed), seed))
+        matrix = min(seeds, key=lambda seed: seed[0])[1]
+    else:
+        matrix = np.column_stack([np.eye(2), fixed.mean(axis=0) - moving.mean(axis=0)])
+
+    previous = np.inf
+    rms = previous
+    for _ in range(max_iterations):
+        moved = apply_affine_points(moving, matrix)
+        nearest = np.argmin(((moved[:, None, :] - fixed[None, :, :]) ** 2).sum(axis=2), axis=1)
+        matrix = fit_similarity_transform(moving, fixed[nearest], allow_scale)
+        rms = rms_of(moving, matrix, fixed[nearest])
+        if previous - rms < tolerance:
+            break
+        previous = rms
+    return {"matrix": matrix, "rms": rms}
+
+
+def invert_affine(matrix):
+    """Inverse of a 2x3 affine matrix."""
+    return np.linalg.inv(np.vstack([matrix, [0, 0, 1]]))[:2]
+
+
+class AlignmentTransformStore:
+    """Alignment matrices per view and fraction pair, persisted in the workspace.
+
+    A record holds the 3x3 matrix taking source-fraction annotation pixels to
+    target-fraction annotation pixels, the display scale of each fraction and
+    fingerprints of the two edited images the annotations were drawn on. The
+    fingerprint hashes decoded pixels, so an image on disk and the same image
+    still held by an open window compare equal. Records whose images have
+    changed are dropped when read.
+    """
+
+    FILENAME = "alignment_transforms.json"
+
+    def __init__(self, workspace):
+        self.path = os.path.join(workspace, self.FILENAME)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(view, source_fraction, target_fraction):
+        return f"{view}_frac{source_fraction}_to_frac{target_fraction}"
+
+    @staticmethod
+    def _pixel_digest(pixels):
+        pixels = np.ascontiguousarray(pixels)
+        digest = hashlib.sha1(f"{pixels.dtype}{pixels.shape}".encode())
+        digest.update(pixels.data)
+        return digest.hexdigest()
+
+    @classmethod
+    def fingerprint(cls, image):
+        """Pixel hash of an image file path or in-memory array, plus path/size/mtime for files."""
+        if isinstance(image, np.ndarray):
+            return {"path": None, "sha1": cls._pixel_digest(image)}
+        if not image or not os.path.exists(image):
+            return None
+        pixels = cv2.imread(image, cv2.IMREAD_UNCHANGED)
+        if pixels is None:
+            return None
+        stat = os.stat(image)
+        return {"path": os.path.abspath(image), "size": stat.st_size,
+                "mtime": stat.st_mtime, "sha1": cls._pixel_digest(pixels)}
+
+    @classmethod
+    def _image_unchanged(cls, stored, image):
+        if not stored:
+            return False
+        if not isinstance(image, np.ndarray):
+            if not image or not os.path.exists(image):
+                return False
+            stat = os.stat(image)
+            if (os.path.abspath(image) == stored.get("path") and
+                    stat.st_size == stored.get("size") and stat.st_mtime == stored.get("mtime")):
+                return True
+        # Touched, moved or held in memory - compare the pixels
+        current = cls.fingerprint(image)
+        return current is not None and current["sha1"] == stored["sha1"]
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"❌ Could not read alignment transforms: {e}")
+            return {}
+
+    def _write(self, records):
+        atomic_write(self.path, json.dumps(records, indent=2))
+
+    def save(self, view, source_fraction, target_fraction, matrix, source_image, target_image,
+             source_scale=1.0, target_scale=1.0):
+        matrix = np.asarray(matrix, dtype=np.float64)
+        if matrix.shape == (2, 3):
+            matrix = np.vstack([matrix, [0, 0, 1]])
+        record = {
+            "matrix": matrix.tolist(),
+            "source_scale": float(source_scale),
+            "target_scale": float(target_scale),
+            "source_image": self.fingerprint(source_image),
+            "target_image": self.fingerprint(target_image),
+            "saved": datetime.now().isoformat(timespec="seconds")
+        }
+        with self._lock:
+            records = self._read()
+            records[self.key(view, source_fraction, target_fraction)] = record
+            self._write(records)
+        return record
+
+    def load(self, view, source_fraction, target_fraction, source_image, target_image):
+        """The stored record with a 2x3 "matrix", or None if missing or stale."""
+        key = self.key(view, source_fraction, target_fraction)
+        with self._lock:
+            records = self._read()
+            record = records.get(key)
+            if record is None:
+                return None
+            if not (self._image_unchanged(record["source_image"], source_image) and
+                    self._image_unchanged(record["target_image"], target_image)):
+                print(f"Alignment {key} is stale (source image changed) - discarded")
+                del records[key]
+                self._write(records)
+                return None
+        record = dict(record)
+        record["matrix"] = np.asarray(record["matrix"], dtype=np.float64)[:2]
+        return record
+
+    def invalidate(self, view=None):
+        with self._lock:
+            records = self._read()
+            kept = {k: v for k, v in records.items() if view is not None and not k.startswith(f"{view}_")}
+            if kept != records:
+                self._write(kept)
+
+    @staticmethod
+    def full_resolution_matrix(record):
+        """Re-express a record's annotation-pixel matrix in original image pixels."""
+        return registration_to_display(record["matrix"], 1.0 / record["source_scale"], 1.0 / record["target_scale"])
+
+    @classmethod
+    def display_matrix(cls, record, source_scale, target_scale):
+        """A record's matrix for annotations shown at the given display scales."""
+        return registration_to_display(cls.full_resolution_matrix(record), source_scale, target_scale)
+
+    @staticmethod
+    def apply_to_annotations(annotations, matrix):
+        """Map every structure of an annotation dict (either JSON layout) through matrix."""
+        mapped = {}
+        for label, value in annotations.items():
+            if label == "anatomy":
+                mapped[label] = transform_polylines([p for p in value if p], matrix)
+            elif isinstance(value, dict):
+                mapped[label] = {k: (transform_polylines([[pt]], matrix)[0][0] if pt else pt)
+                                 for k, pt in value.items()}
+            elif isinstance(value, list):
+                mapped[label] = transform_polylines([p for p in value if p], matrix)
+            else:
+                mapped[label] = value
+        return mapped
+
+    @staticmethod
+    def apply_to_masks(masks, matrix, output_shape):
+        """Warp a dict of label masks (original resolution) with nearest-neighbour sampling."""
+        out_h, out_w = output_shape[:2]
+        m = np.asarray(matrix, dtype=np.float64)[:2]
+        return {name: cv2.warpAffine(mask, m, (out_w, out_h), flags=cv2.INTER_NEAREST,
+                                     borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+                for name, mask in masks.items()}
+
+
+MASK_LABELS = {
+    "anatomy": 1,
+    "applicator_tandem": 2,
+    "left_ovoid": 3,
+    "right_ovoid": 4
+}
+
+
+def atomic_write(path, data, mode="w", encoding="utf-8"):
+    """Write data beside path, fsync, then os.replace - readers never see a partial file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, mode, encoding=None if "b" in mode else encoding) as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class BackgroundFileWriter:
+    """Write-behind queue that runs file writes on one worker thread, off the Tk event loop.
+
+    Queued writes to the same path are coalesced (the newest content wins) and
+    land atomically through atomic_write. With a Tk root, completion and failure
+    callbacks are delivered on the Tk thread by polling, never from the worker.
+    """
+
+    def __init__(self, name="file-writer", root=None, poll_ms=100):
+        self._jobs = queue.Queue()
+        self._pending = {}
+        self._active = None
+        self._cond = threading.Condition()
+        self._results = queue.Queue()
+        self.root = root
+        self.poll_ms = poll_ms
+        # Called as done_handler(description) / error_handler(description, error) for jobs
+        # queued without their own on_done / on_error
+        self.done_handler = None
+        self.error_handler = None
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        if root is not None:
+            root.after(poll_ms, self._poll)
+
+    def submit(self, func, *args, description="", key=None, on_done=None, on_error=None):
+        """Queue func(*args); on_done(description) or on_error(description, error) follow it."""
+        key = object() if key is None else key
+        with self._cond:
+            coalesced = key in self._pending
+            self._pending[key] = (func, args, description, on_done, on_error)
+        if not coalesced:
+            self._jobs.put(key)
+
+    def write_text(self, path, text, description="", on_done=None, on_error=None):
+        self.submit(atomic_write, path, text, description=description or os.path.basename(path),
+                    key=os.path.abspath(path), on_done=on_done, on_error=on_error)
+
+    def write_json(self, path, data, description="", on_done=None, on_error=None, indent=None):
+        # Serialised now so later edits to data cannot leak into the queued write
+        self.write_text(path, json.dumps(data, indent=indent), description, on_done, on_error)
+
+    def write_bytes(self, path, data, description="", on_done=None, on_error=None):
+        self.submit(atomic_write, path, bytes(data), "wb", description=description or os.path.basename(path),
+                    key=os.path.abspath(path), on_done=on_done, on_error=on_error)
+
+    def wait(self):
+        """Block until every queued job has run."""
+        self._jobs.join()
+
+    def wait_for(self, path):
+        """Block until no write to path is queued or running."""
+        key = os.path.abspath(path)
+        with self._cond:
+            while key in self._pending or self._active == key:
+                self._cond.wait()
+
+    def _run(self):
+        while True:
+            key = self._jobs.get()
+            with self._cond:
+                func, args, description, on_done, on_error = self._pending.pop(key)
+                self._active = key
+            try:
+                func(*args)
+                self._report(on_done or self.done_handler, description)
+            except Exception as e:
+                print(f"❌ Background write failed {description}: {e}")
+                if on_error is not None:
+                    self._report(on_error, description, e)
+                elif self.error_handler is not None:
+                    self._report(self.error_handler, description, e)
+            finally:
+                with self._cond:
+                    self._active = None
+                    self._cond.notify_all()
+                self._jobs.task_done()
+
+    def _report(self, callback, *args):
+        if callback is None:
+            return
+        if self.root is None:
+            callback(*args)
+        else:
+            self._results.put((callback, args))
+
+    def _poll(self):
+        try:
+            while True:
+                callback, args = self._results.get_nowait()
+                try:
+                    callback(*args)
+                except Exception as e:
+                    print(f"❌ Save callback failed: {e}")
+        except queue.Empty:
+            pass
+        try:
+            self.root.after(self.poll_ms, self._poll)
+        except tk.TclError:
+            pass
+
+
+def image_shape_from_header(image_path):
+    """(height, width) read from the image header without decoding pixels."""
+    with PILImage.open(image_path) as img:
+        width, height = img.size
+    return height, width
+
+
+def _annotation_shapes(value):
+    """Yield point lists from either annotation JSON layout."""
+    if isinstance(value, dict):
+        if value.get("tip") and value.get("base"):
+            yield [value["tip"], value["base"]]
+        return
+    for shape in value or []:
+        if isinstance(shape, dict):
+            yield from _annotation_shapes(shape)
+        elif shape:
+            yield shape
+
+
+def rasterize_structure_masks(annotations, shape, scale_xy, labels=MASK_LABELS, line_thickness=3, end_radius=5):
+    """Rasterize every structure into its own uint8 0/1 mask at the given (height, width).
+
+    All vertices are scaled from display to original pixels in a single array
+    operation; anatomy is filled, applicators are drawn as tip-base lines with
+    end markers. Each structure is drawn on its own, so an applicator crossing
+    the anatomy leaves no hole in the anatomy mask.
+    """
+    masks = {structure: np.zeros(shape[:2], dtype=np.uint8) for structure in labels}
+
+    owners, arrays = [], []
+    for structure, value in annotations.items():
+        if structure not in labels:
+            continue
+        for pts in _annotation_shapes(value):
+            arr = np.asarray(pts, dtype=np.float64).reshape(-1, 2)
+            if len(arr):
+                owners.append(structure)
+                arrays.append(arr)
+    if not arrays:
+        return masks
+
+    counts = [len(a) for a in arrays]
+    scaled = (np.concatenate(arrays) * np.asarray(scale_xy, dtype=np.float64)).astype(np.int32)
+    shapes = np.split(scaled, np.cumsum(counts)[:-1])
+
+    for structure in labels:
+        polys = [s for s, owner in zip(shapes, owners) if owner == structure]
+        if not polys:
+            continue
+        mask = masks[structure]
+        if structure == "anatomy":
+            cv2.fillPoly(mask, [p for p in polys if len(p) >= 2], 1)
+        else:
+            cv2.polylines(mask, [p for p in polys if len(p) >= 2], False, 1, line_thickness)
+            for p in polys:
+                for x, y in (p[0], p[-1]):
+                    cv2.circle(mask, (int(x), int(y)), end_radius, 1, -1)
+    return masks
+
+
+def combine_label_map(masks, shape, labels=MASK_LABELS):
+    """One uint8 label map of the structure masks; later labels overwrite earlier ones where they overlap."""
+    label_map = np.zeros(shape[:2], dtype=np.uint8)
+    for structure, value in sorted(labels.items(), key=lambda item: item[1]):
+        if structure in masks:
+            label_map[masks[structure] > 0] = value
+    return label_map
+
+
+def write_mask_pngs(masks, shape, output_dir, base_name, labels=MASK_LABELS):
+    """Write the per-structure and combined mask PNGs (values x63, as before)."""
+    def write_png(path, image):
+        atomic_write(path, cv2.imencode(".png", image)[1].tobytes(), "wb")
+
+    for structure, value in labels.items():
+        structure_mask = np.zeros(shape[:2], dtype=np.uint8)
+        if structure in masks:
+            structure_mask[masks[structure] > 0] = value * 63
+        write_png(os.path.join(output_dir, f"{base_name}_{structure}_mask.png"), structure_mask)
+    write_png(os.path.join(output_dir, f"{base_name}_combined_mask.png"),
+              (combine_label_map(masks, shape, labels) * 63).astype(np.uint8))
+
+
+class RunLengthMaskSet:
+    """Run-length encoded structure masks with per-structure bounding boxes.
+
+    Each structure keeps the bounding box of its pixels and the row-major runs
+    inside that box, so mostly-empty full-resolution masks cost a few KB and
+    encode/decode with a handful of array operations. Dense arrays are only
+    built on request.
+    """
+
+    SUFFIX = "_masks.rle.npz"
+
+    def __init__(self, shape, structures):
+        self.shape = tuple(int(v) for v in shape[:2])
+        self.structures = structures
+
+    @classmethod
+    def from_masks(cls, masks, shape, labels=MASK_LABELS):
+        structures = {}
+        for name, value in labels.items():
+            if name not in masks:
+                continue
+            selected = (masks[name] > 0).view(np.uint8)
+            x0, y0, w, h = cv2.boundingRect(selected)
+            if w == 0 or h == 0:
+                continue
+            y1, x1 = y0 + h, x0 + w
+            flat = (selected[y0:y1, x0:x1].ravel() > 0).view(np.int8)
+            edges = np.flatnonzero(np.diff(np.concatenate(([0], flat, [0]))))
+            starts, ends = edges[0::2], edges[1::2]
+            structures[name] = {
+                "value": int(value),
+                "bbox": np.array([y0, x0, y1, x1], dtype=np.int32),
+                "starts": starts.astype(np.int32),
+                "lengths": (ends - starts).astype(np.int32)
+            }
+        return cls(shape, structures)
+
+    @classmethod
+    def write_masks(cls, masks, shape, path, labels=MASK_LABELS):
+        cls.from_masks(masks, shape, labels).save(path)
+
+    def save(self, path):
+        arrays = {"shape": np.array(self.shape, dtype=np.int32),
+                  "names": np.array(list(self.structures), dtype=str)}
+        for i, (name, entry) in enumerate(self.structures.items()):
+            arrays[f"value_{i}"] = np.array(entry["value"], dtype=np.int32)
+            arrays[f"bbox_{i}"] = entry["bbox"]
+            arrays[f"starts_{i}"] = entry["starts"]
+            arrays[f"lengths_{i}"] = entry["lengths"]
+        # The run arrays deflate well; serialise to memory since np.savez* appends .npz to names
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **arrays)
+        atomic_write(path, buffer.getvalue(), "wb")
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            structures = {}
+            for i, name in enumerate(data["names"]):
+                structures[str(name)] = {
+                    "value": int(data[f"value_{i}"]),
+                    "bbox": data[f"bbox_{i}"],
+                    "starts": data[f"starts_{i}"],
+                    "lengths": data[f"lengths_{i}"]
+                }
+            return cls(data["shape"], structures)
+
+    def bounding_box(self, name):
+        """(y0, x0, y1, x1) of a structure, or None if it has no pixels."""
+        entry = self.structures.get(name)
+        return None if entry is None else tuple(int(v) for v in entry["bbox"])
+
+    def structure_mask(self, name):
+        """Dense boolean mask of one structure at full resolution."""
+        mask = np.zeros(self.shape, dtype=bool)
+        entry = self.structures.get(name)
+        if entry is None:
+            return mask
+        y0, x0, y1, x1 = (int(v) for v in entry["bbox"])
+        size = (y1 - y0) * (x1 - x0)
+        # Runs never touch, so starts and ends are distinct indices
+        delta = np.zeros(size + 1, dtype=np.int8)
+        delta[entry["starts"]] = 1
+        delta[entry["starts"] + entry["lengths"]] = -1
+        mask[y0:y1, x0:x1] = (np.cumsum(delta[:-1]) > 0).reshape(y1 - y0, x1 - x0)
+        return mask
+
+    def label_map(self):
+        """Dense uint8 label map with every structure painted in label order."""
+        label_map = np.zeros(self.shape, dtype=np.uint8)
+        for name, entry in sorted(self.structures.items(), key=lambda item: item[1]["value"]):
+            label_map[self.structure_mask(name)] = entry["value"]
+        return label_map
+
+    def export_pngs(self, output_dir, base_name):
+        write_mask_pngs({name: self.structure_mask(name) for name in self.structures}, self.shape,
+                        output_dir, base_name)
+
+
+FRACTION_KEY_PATTERN = re.compile(r"(?<![A-Za-z])(AP|LAT)_frac(\d+)(?!\d)")
+
+
+def fraction_key(view, fraction):
+    """Key used for image paths, pixel spacing and file names, e.g. "AP_frac3"."""
+    return f"{view}_frac{int(fraction)}"
+
+
+def parse_fraction_key(key):
+    """(view, fraction) from a key or file name containing one, or None."""
+    match = FRACTION_KEY_PATTERN.search(key or "")
+    return (match.group(1), int(match.group(2))) if match else None
+
+
+class Landmark:
+    """One applicator's tip/base, a view into its LandmarkSet's array."""
+
+    __slots__ = ("landmarks", "index")
+
+    def __init__(self, landmarks, index):
+        self.landmarks = landmarks
+        self.index = index
+
+    @property
+    def applicator(self):
+        return LandmarkSet.APPLICATORS[self.index]
+
+    @property
+    def coords(self):
+        """(2, 2) array: rows tip, base; NaN where not annotated."""
+        return self.landmarks.coords[self.index]
+
+    @property
+    def tip(self):
+        return self.landmarks.point(self.index, 0)
+
+    @property
+    def base(self):
+        return self.landmarks.point(self.index, 1)
+
+    @property
+    def complete(self):
+        return bool(self.landmarks.complete[self.index])
+
+    def __repr__(self):
+        return f"Landmark({self.applicator!r}, tip={self.tip}, base={self.base})"
+
+
+class LandmarkSet:
+    """Applicator tip/base landmarks of one fraction and view in one contiguous array.
+
+    coords has shape (applicator, tip/base, x/y) in image pixels with NaN for
+    points that were not annotated. Reads every annotation JSON layout: the
+    explicit {"tip", "base"} dicts, [[tip, base]] polygon lists and lists of
+    such dicts.
+    """
+
+    __slots__ = ("view", "fraction", "coords")
+
+    APPLICATORS = ("applicator_tandem", "left_ovoid", "right_ovoid")
+    POINTS = ("tip", "base")
+
+    def __init__(self, coords=None, view=None, fraction=None):
+        self.view = view
+        self.fraction = fraction
+        if coords is None:
+            coords = np.full((len(self.APPLICATORS), len(self.POINTS), 2), np.nan)
+        self.coords = np.ascontiguousarray(coords, dtype=np.float64)
+
+    @classmethod
+    def from_json(cls, data, view=None, fraction=None):
+        landmarks = cls(view=view, fraction=fraction)
+        if isinstance(data, list):
+            merged = {}
+            for item in data:
+                if isinstance(item, dict):
+                    merged.update(item)
+            data = merged
+        if not isinstance(data, dict):
+            return landmarks
+        for i, applicator in enumerate(cls.APPLICATORS):
+            entry = data.get(applicator)
+            if isinstance(entry, dict):
+                points = (entry.get("tip"), entry.get("base"))
+            elif isinstance(entry, list) and entry and isinstance(entry[0], (list, tuple)) and len(entry[0]) >= 2:
+                points = (entry[0][0], entry[0][1])
+            else:
+                continue
+            for j, point in enumerate(points):
+                if point is not None and len(point) >= 2:
+                    landmarks.coords[i, j] = point[:2]
+        return landmarks
+
+    def to_json(self, layout="explicit"):
+        """{"applicator": {"tip", "base"}} ("explicit") or {"applicator": [[tip, base]]} ("polygons")."""
+        data = {}
+        for i, applicator in enumerate(self.APPLICATORS):
+            tip, base = self.point(i, 0), self.point(i, 1)
+            if layout == "polygons":
+                data[applicator] = [[list(tip), list(base)]] if tip and base else []
+            else:
+                data[applicator] = {"tip": list(tip) if tip else None, "base": list(base) if base else None}
+        return data
+
+    @property
+    def complete(self):
+        """Boolean per applicator: both tip and base annotated."""
+        return ~np.isnan(self.coords).any(axis=(1, 2))
+
+    def point(self, index, point_index):
+        xy = self.coords[index, point_index]
+        return None if np.isnan(xy).any() else (float(xy[0]), float(xy[1]))
+
+    def __getitem__(self, applicator):
+        return Landmark(self, self.APPLICATORS.index(applicator))
+
+    def __iter__(self):
+        return (Landmark(self, i) for i in range(len(self.APPLICATORS)))
+
+    def __bool__(self):
+        return bool(self.complete.any())
+
+    def tip_base(self, applicator):
+        landmark = self[applicator]
+        return landmark.tip, landmark.base
+
+
+LANDMARK_POINTS = ("tip", "base", "centroid")
+
+
+def _landmark_coords(landmarks):
+    """(..., applicator, tip/base/centroid, axis) array from a LandmarkSet or a (..., A, 2, D) array."""
+    coords = landmarks.coords if isinstance(landmarks, LandmarkSet) else np.asarray(landmarks, dtype=np.float64)
+    return np.concatenate([coords, coords.mean(axis=-2, keepdims=True)], axis=-2)
+
+
+def landmark_geometry(first, second=None, references=(), mm_per_px=1.0, matrix=None,
+                      applicators=LandmarkSet.APPLICATORS):
+    """Every landmark-to-reference distance and inter-fraction shift in one broadcast.
+
+    first and second are LandmarkSets (or (applicator, tip/base, axis) arrays in
+    any number of axes); a centroid row is added to each applicator. references
+    is an (R, axis) array of fixed points in the first fraction's frame and the
+    optional 2x3 matrix carries second-fraction pixels into that frame. Without
+    a second set the first is measured alone and every shift is zero.
+
+    Returns a structured array of shape (applicator, tip/base/centroid) with
+    fields applicator, point, valid, delta (mm per axis), direct_shift_mm,
+    anatomy_shift_mm and distance1, distance2, difference (mm, one column per
+    reference). NaN propagates from missing points; valid marks rows where
+    both fractions have the point.
+    """
+    coords1 = _landmark_coords(first)
+    coords2 = coords1 if second is None else _landmark_coords(second)
+    mapped2 = coords2 if matrix is None else apply_affine_points(coords2, matrix)
+    refs = np.asarray(references, dtype=np.float64).reshape(-1, coords1.shape[-1])
+    n_app, n_pts, n_axes = coords1.shape
+
+    geometry = np.zeros((n_app, n_pts), dtype=[
+        ("applicator", "U32"), ("point", "U16"), ("valid", "?"),
+        ("delta", "f8", (n_axes,)),
+        ("direct_shift_mm", "f8"), ("anatomy_shift_mm", "f8"),
+        ("distance1", "f8", (len(refs),)), ("distance2", "f8", (len(refs),)),
+        ("difference", "f8", (len(refs),))
+    ])
+    geometry["applicator"] = np.asarray(applicators)[:, None]
+    geometry["point"] = np.asarray(LANDMARK_POINTS[:n_pts])[None, :]
+    geometry["valid"] = ~(np.isnan(coords1).any(axis=-1) | np.isnan(coords2).any(axis=-1))
+
+    geometry["delta"] = (mapped2 - coords1) * mm_per_px
+    geometry["direct_shift_mm"] = np.linalg.norm(coords2 - coords1, axis=-1) * mm_per_px
+    geometry["anatomy_shift_mm"] = np.linalg.norm(mapped2 - coords1, axis=-1) * mm_per_px
+    # (applicator, point, reference)
+    geometry["distance1"] = np.linalg.norm(coords1[:, :, None, :] - refs, axis=-1) * mm_per_px
+    geometry["distance2"] = np.linalg.norm(mapped2[:, :, None, :] - refs, axis=-1) * mm_per_px
+    geometry["difference"] = geometry["distance2"] - geometry["distance1"]
+    return geometry
+
+
+def pairwise_displacements(coords, fractions=None):
+    """Displacements between every pair of fractions in one broadcast.
+
+    coords is a (..., fraction, applicator, tip/base, axis) array already in a
+    common frame and in mm, NaN where a point is missing; a centroid row is
+    added. Returns a dict with "fractions", "delta" (..., F, F, A, P, axis)
+    where delta[i, j] is fraction j minus fraction i, its "magnitude"
+    (..., F, F, A, P), and the cumulative "drift" of every fraction from the
+    first (..., F, A, P, axis) with "drift_mm" (..., F, A, P).
+    """
+    points = _landmark_coords(coords)
+    delta = points[..., None, :, :, :, :] - points[..., :, None, :, :, :]
+    magnitude = np.linalg.norm(delta, axis=-1)
+    return {
+        "fractions": list(fractions) if fractions is not None else list(range(1, points.shape[-4] + 1)),
+        "delta": delta,
+        "magnitude": magnitude,
+        "drift": delta[..., 0, :, :, :, :],
+        "drift_mm": magnitude[..., 0, :, :, :]
+    }
+
+
+def fit_rigid_transforms(source, target):
+    """Batched Kabsch fit of the rotation and translation taking source onto target.
+
+    source and target are (..., K, D) landmark arrays (NaN where missing);
+    only landmarks present in both enter each fit. Returns a dict with
+    "rotation" (..., D, D), "translation" (..., D) so that
+    target ~ source @ rotation.T + translation, the per-landmark "residual"
+    (..., K) left after the rigid motion (NaN for missing landmarks) and its
+    "rms" (...).
+    """
+    source = np.asarray(source, dtype=np.float64)
+    target = np.asarray(target, dtype=np.float64)
+    source, target = np.broadcast_arrays(source, target)
+    weight = ~(np.isnan(source).any(axis=-1) | np.isnan(target).any(axis=-1))
+    w = weight[..., None].astype(np.float64)
+    count = np.maximum(w.sum(axis=-2, keepdims=True), 1.0)
+    src = np.where(w > 0, source, 0.0)
+    tgt = np.where(w > 0, target, 0.0)
+    mu_src = (src * w).sum(axis=-2, keepdims=True) / count
+    mu_tgt = (tgt * w).sum(axis=-2, keepdims=True) / count
+    src_c = (src - mu_src) * w
+    tgt_c = (tgt - mu_tgt) * w
+
+    # Cross-covariance per problem, (..., D, D)
+    U, _, Vt = np.linalg.svd(np.swapaxes(tgt_c, -1, -2) @ src_c)
+    # Flip the weakest axis where the best orthogonal fit is a reflection
+    d = np.sign(np.linalg.det(U @ Vt))
+    d = np.where(d == 0, 1.0, d)
+    D = np.broadcast_to(np.eye(source.shape[-1]), U.shape).copy()
+    D[..., -1, -1] = d
+    rotation = U @ D @ Vt
+    translation = mu_tgt[..., 0, :] - (mu_src @ np.swapaxes(rotation, -1, -2))[..., 0, :]
+
+    moved = source @ np.swapaxes(rotation, -1, -2) + translation[..., None, :]
+    residual = np.where(weight, np.linalg.norm(moved - target, axis=-1), np.nan)
+    rms = np.sqrt((np.where(weight, residual, 0.0) ** 2).sum(axis=-1) / count[..., 0, 0])
+    return {"rotation": rotation, "translation": translation, "residual": residual, "rms": rms}
+
+
+def rotation_angles(rotation):
+    """Rotations about x, y and z in degrees for R = Rz @ Ry @ Rx, batched over leading axes."""
+    r = np.asarray(rotation, dtype=np.float64)
+    about_y = np.arcsin(np.clip(-r[..., 2, 0], -1.0, 1.0))
+    about_x = np.arctan2(r[..., 2, 1], r[..., 2, 2])
+    about_z = np.arctan2(r[..., 1, 0], r[..., 0, 0])
+    return np.degrees(np.stack([about_x, about_y, about_z], axis=-1))
+
+
+def reconstruct_orthogonal_films(ap_points, lat_points, ap_sigma=1.0, lat_sigma=1.0, offset_sigma=1e3):
+    """Least-squares 3D landmarks from an orthogonal AP / lateral film pair.
+
+    ap_points holds (x, y) and lat_points (z, y) per landmark in mm, both
+    relative to the same anatomical reference with y superior; shape
+    (..., K, 2) with NaN for missing points. Leading axes (fractions, say)
+    are independent problems solved in one batched call.
+
+    Both films see the superior-inferior axis. The unknowns of each problem
+    are the K shared y values plus one offset between the films' y origins,
+    fitted by weighted normal equations (sigmas are the per-view measurement
+    errors in mm; offset_sigma is a weak prior keeping the offset defined when
+    no landmark is seen on both films). x comes from the AP film and z from
+    the lateral one.
+
+    Returns a dict with "points" (..., K, 3), the lateral "offset" (...) and
+    the per-landmark y "residual" (..., K) as the RMS of both films' misfit.
+    """
+    ap = np.asarray(ap_points, dtype=np.float64)
+    lat = np.asarray(lat_points, dtype=np.float64)
+    seen_ap = ~np.isnan(ap).any(axis=-1)
+    seen_lat = ~np.isnan(lat).any(axis=-1)
+    w_ap = seen_ap / ap_sigma ** 2
+    w_lat = seen_lat / lat_sigma ** 2
+    y_ap = np.where(seen_ap, ap[..., 1], 0.0)
+    y_lat = np.where(seen_lat, lat[..., 1], 0.0)
+
+    # Normal equations for [y_1 .. y_K, offset], lateral rows read y_k + offset. The matrix
+    # is diagonal plus the offset row and column, so eliminating the y's leaves one scalar
+    # equation per problem (Schur complement) - exact, and far cheaper than a dense solve.
+    diagonal = w_ap + w_lat
+    unseen = diagonal == 0
+    diagonal = np.where(unseen, 1.0, diagonal)
+    rhs = w_ap * y_ap + w_lat * y_lat
+    schur = (w_lat.sum(axis=-1) + 1.0 / offset_sigma ** 2) - (w_lat ** 2 / diagonal).sum(axis=-1)
+    offset = ((w_lat * y_lat).sum(axis=-1) - (w_lat * rhs / diagonal).sum(axis=-1)) / schur
+    y = np.where(unseen, np.nan, (rhs - w_lat * offset[..., None]) / diagonal)
+    misfit = np.where(seen_ap, y_ap - y, 0.0) ** 2 + np.where(seen_lat, y_lat - y - offset[..., None], 0.0) ** 2
+    observed = seen_ap.astype(int) + seen_lat
+    residual = np.sqrt(misfit / np.where(unseen, 1, observed))
+    residual[unseen] = np.nan
+    points = np.stack([ap[..., 0], y, lat[..., 0]], axis=-1)
+    return {"points": points, "offset": offset, "residual": residual}
+
+
+class ImagingGeometry:
+    """Source-detector geometry of one view for divergent-beam magnification correction.
+
+    sid_mm is the source-to-detector and sod_mm the source-to-isocentre
+    distance; detector_spacing_mm is the pixel pitch on the detector, taken
+    only from DICOM ImagerPixelSpacing or the profile. The app's calibrated
+    pixel spacing is already measured at the isocentre plane, so without a
+    true pitch it is scaled up to the detector and object_mm_per_px gives it
+    back unchanged rather than dividing it by the magnification again. A point
+    at depth d (mm from the isocentre plane towards the detector) is
+    magnified by sid / (sod + d). central_axis_px is where the central ray
+    hits the image; when unknown the measurement origin is taken to be on it.
+    depth_sign maps the orthogonal film's horizontal axis onto depth towards
+    this view's detector. Without SID/SOD the geometry is an identity scale.
+
+    The calibration profile is JSON keyed by view, e.g.
+    {"AP": {"sid_mm": 1000, "sod_mm": 800, "detector_spacing_mm": 0.2979}}.
+    """
+
+    __slots__ = ("view", "sid_mm", "sod_mm", "detector_spacing_mm", "central_axis_px", "depth_sign", "source")
+
+    def __init__(self, view, detector_spacing_mm, sid_mm=None, sod_mm=None, central_axis_px=None,
+                 depth_sign=1.0, source="default"):
+        self.view = view
+        self.detector_spacing_mm = float(detector_spacing_mm)
+        self.sid_mm = float(sid_mm) if sid_mm else None
+        self.sod_mm = float(sod_mm) if sod_mm else None
+        self.central_axis_px = None if central_axis_px is None else np.asarray(central_axis_px, dtype=np.float64)
+        self.depth_sign = float(depth_sign)
+        self.source = source
+
+    @staticmethod
+    def default_profile_path():
+        return os.path.join(os.path.expanduser("~"), "BrachyApp", "imaging_geometry.json")
+
+    @classmethod
+    def load_profile(cls, path=None):
+        """The calibration profile dict, {} if there is none."""
+        path = path or cls.default_profile_path()
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"❌ Could not read imaging geometry profile {path}: {e}")
+            return {}
+
+    @staticmethod
+    def _detector_pitch(pitch_mm, calibrated_spacing_mm, sid_mm, sod_mm):
+        if pitch_mm:
+            return float(pitch_mm)
+        if sid_mm and sod_mm:
+            return float(calibrated_spacing_mm) * float(sid_mm) / float(sod_mm)
+        return float(calibrated_spacing_mm)
+
+    @classmethod
+    def from_profile(cls, view, profile, calibrated_spacing_mm):
+        entry = profile.get(view)
+        if not entry:
+            return None
+        pitch = cls._detector_pitch(entry.get("detector_spacing_mm"), calibrated_spacing_mm,
+                                    entry.get("sid_mm"), entry.get("sod_mm"))
+        return cls(view, pitch, entry.get("sid_mm"), entry.get("sod_mm"), entry.get("central_axis_px"),
+                   entry.get("depth_sign", 1.0), "profile")
+
+    @classmethod
+    def from_dicom(cls, view, image_path, calibrated_spacing_mm):
+        """Geometry from DistanceSourceToDetector / DistanceSourceToPatient, or None if absent."""
+        if not image_path or not image_path.lower().endswith((".dcm", ".dicom")):
+            return None
+        try:
+            import pydicom
+            ds = pydicom.dcmread(image_path, stop_before_pixels=True)
+        except ImportError:
+            print("pydicom not available, no DICOM imaging geometry")
+            return None
+        except Exception as e:
+            print(f"Could not read DICOM geometry: {e}")
+            return None
+        sid = getattr(ds, "DistanceSourceToDetector", None)
+        sod = getattr(ds, "DistanceSourceToPatient", None)
+        if not sid or not sod:
+            return None
+        # ImagerPixelSpacing is the detector pitch; PixelSpacing may already be scaled to the patient
+        spacing = getattr(ds, "ImagerPixelSpacing", None)
+        pitch = cls._detector_pitch(spacing[0] if spacing else None, calibrated_spacing_mm, sid, sod)
+        return cls(view, pitch, sid, sod, source="dicom")
+
+    @property
+    def magnification(self):
+        """Isocentre magnification SID/SOD (1.0 without geometry)."""
+        return self.sid_mm / self.sod_mm if self.sid_mm and self.sod_mm else 1.0
+
+    @property
+    def divergent(self):
+        return self.sid_mm is not None and self.sod_mm is not None
+
+    @property
+    def object_mm_per_px(self):
+        """Pixel size projected back to the isocentre plane."""
+        return self.detector_spacing_mm / self.magnification
+
+    def to_object_mm(self, pixels, origin_px, depth_mm=0.0):
+        """Pixel points (..., 2) to object-plane mm relative to origin_px, per point.
+
+        depth_mm broadcasts against the points' leading axes; the origin is
+        taken at the isocentre depth.
+        """
+        pixels = np.asarray(pixels, dtype=np.float64)
+        origin = np.asarray(origin_px, dtype=np.float64)
+        axis = origin if self.central_axis_px is None else self.central_axis_px
+        if not self.divergent:
+            return (pixels - origin) * self.detector_spacing_mm
+        scale = self.detector_spacing_mm * (self.sod_mm + np.asarray(depth_mm, dtype=np.float64)) / self.sid_mm
+        return (pixels - axis) * scale[..., None] - (origin - axis) * self.object_mm_per_px
+
+
+def film_coordinates(pixels, origins, scales, geometry=None, depth_mm=0.0):
+    """Film pixels (..., 2) to mm from origins, superior up.
+
+    With a divergent ImagingGeometry every point gets its own magnification at
+    depth_mm; otherwise the per-record scales (mm per pixel) apply.
+    """
+    if geometry is None or not geometry.divergent:
+        coords = (pixels - origins) * scales
+    else:
+        coords = geometry.to_object_mm(pixels, origins, np.broadcast_to(depth_mm, np.shape(pixels)[:-1]))
+    # Image y grows downwards
+    return coords * np.array([1.0, -1.0])
+
+
+def reconstruct_from_films(ap_film, lat_film, ap_geometry, lat_geometry, iterations=4):
+    """3D landmarks from AP and lateral (pixels, origins, scales) film tuples.
+
+    pixels are (..., fraction, applicator, tip/base, 2); any leading axes are
+    solved in the same batch. With divergent-beam geometry each point's
+    magnification depends on its depth, which the other film provides, so the
+    solve is repeated with the previous pass's depths (AP depth from z,
+    lateral depth from x). Returns reconstruct_orthogonal_films()'s dict with
+    "points" (..., F, A, 2, 3) and "residual" (..., F, A, 2) reshaped.
+    """
+    shape = np.shape(ap_film[0])[:-1]
+    batch = shape[:-2]
+    ap_depth = lat_depth = 0.0
+    for _ in range(iterations if ap_geometry.divergent or lat_geometry.divergent else 1):
+        ap = film_coordinates(*ap_film, geometry=ap_geometry, depth_mm=ap_depth)
+        lat = film_coordinates(*lat_film, geometry=lat_geometry, depth_mm=lat_depth)
+        # Each view is as precise as its pixel pitch
+        solved = reconstruct_orthogonal_films(ap.reshape(batch + (-1, 2)), lat.reshape(batch + (-1, 2)),
+                                              ap_sigma=ap_geometry.object_mm_per_px,
+                                              lat_sigma=lat_geometry.object_mm_per_px)
+        solved["points"] = solved["points"].reshape(shape + (3,))
+        solved["residual"] = solved["residual"].reshape(shape)
+        points = np.nan_to_num(solved["points"])
+        ap_depth = ap_geometry.depth_sign * points[..., 2]
+        lat_depth = lat_geometry.depth_sign * points[..., 0]
+    return solved
+
+
+class ClickUncertainty:
+    """Error model of a landmark click, in stored annotation pixels.
+
+    A click is off by a Gaussian observer error of sigma_px plus the int()
+    truncation of the canvas position divided by the window zoom: the stored
+    pixel lies up to one step before the clicked point, a one-sided uniform
+    error on [0, step) per axis. The step is 1 / zoom stored pixels when
+    zoomed out and one pixel otherwise (step_for_zoom). quantization_px is
+    used for measurements saved without their zoom; sample() takes per-record
+    steps that broadcast against the sampled shape.
+    """
+
+    def __init__(self, sigma_px=1.0, quantization_px=1.0):
+        self.sigma_px = float(sigma_px)
+        self.quantization_px = float(quantization_px)
+
+    @staticmethod
+    def step_for_zoom(zoom):
+        return max(1.0, 1.0 / float(zoom))
+
+    def sample(self, rng, shape, quantization_px=None):
+        noise = rng.standard_normal(shape) * self.sigma_px
+        step = self.quantization_px if quantization_px is None else quantization_px
+        # The true point is at or after the truncated one, never before it
+        noise += rng.random(shape) * step
+        return noise
+
+
+def monte_carlo_film_uncertainty(ap_film, lat_film, ap_geometry, lat_geometry, uncertainty,
+                                 samples=100000, chunk_size=8192, confidence=0.95, seed=None,
+                                 quantization_px=(None, None)):
+    """Confidence intervals of every distance and displacement under click noise.
+
+    ap_film and lat_film are (pixels, origins, scales, ends) for
+    (fraction, applicator, tip/base) landmarks; every landmark and both
+    anatomy references are perturbed independently by uncertainty.sample(),
+    with the (AP, lateral) truncation steps of quantization_px (per fraction,
+    broadcastable against the films; None for the model's default). Samples are drawn and pushed through the film conversion, orthogonal
+    reconstruction and pairwise displacements in chunks of chunk_size, so
+    memory stays bounded while each chunk is one vectorized batch.
+
+    Returns a dict of {"mean", "std", "low", "high"} arrays for
+    "displacement_mm" (F, F, A, tip/base/centroid) and "distance_mm"
+    (view, F, A, tip/base, start/end), plus "samples" and "confidence".
+    """
+    rng = np.random.default_rng(seed)
+    n_fractions, n_applicators = np.shape(ap_film[0])[:2]
+    shape_disp = (n_fractions, n_fractions, n_applicators, len(LANDMARK_POINTS))
+    shape_dist = (2, n_fractions, n_applicators, 2, 2)
+    displacement = np.empty((samples,) + shape_disp, dtype=np.float32)
+    distance = np.empty((samples,) + shape_dist, dtype=np.float32)
+
+    def perturb(film, n, step):
+        pixels, origins, scales, ends = (np.asarray(a, dtype=np.float64) for a in film)
+        return (pixels + uncertainty.sample(rng, (n,) + pixels.shape, step),
+                origins + uncertainty.sample(rng, (n,) + origins.shape, step),
+                scales,
+                ends + uncertainty.sample(rng, (n,) + ends.shape, step))
+
+    ap_step, lat_step = quantization_px
+    for start in range(0, samples, chunk_size):
+        n = min(chunk_size, samples - start)
+        ap = perturb(ap_film, n, ap_step)
+        lat = perturb(lat_film, n, lat_step)
+        solved = reconstruct_from_films(ap[:3], lat[:3], ap_geometry, lat_geometry)
+        displacement[start:start + n] = pairwise_displacements(solved["points"])["magnitude"]
+        for v, (pixels, origins, scales, ends) in enumerate((ap, lat)):
+            references = np.stack([origins, ends], axis=-2)
+            distance[start:start + n, v] = np.linalg.norm(pixels[..., None, :] - references, axis=-1) * scales
+
+    tail = (1.0 - confidence) / 2 * 100
+    summary = {"samples": samples, "confidence": confidence}
+    for name, values in (("displacement_mm", displacement), ("distance_mm", distance)):
+        low, high = np.nanpercentile(values, [tail, 100 - tail], axis=0)
+        summary[name] = {"mean": np.nanmean(values, axis=0), "std": np.nanstd(values, axis=0),
+                         "low": low, "high": high}
+    return summary
+
+
+class TG43Source:
+    """TG-43 line-source dosimetry data of an HDR source, with cached lookup grids.
+
+    radial_dose is (r_cm, g_L) and anisotropy (r_cm, theta_deg, F[r, theta]).
+    At construction both are resampled onto fine regular grids, so every
+    later evaluation is an index computation and a gather over whole arrays.
+    The built-in Co-60 data are approximate values for a BEBIG Co0.A86-type
+    source (after Granero et al. 2007); load the commissioned consensus data
+    of the unit's source with from_json() for clinical work.
+    """
+
+    CO60_DEFAULT = {
+        "name": "Co-60 (Co0.A86-type, approximate)",
+        "dose_rate_constant": 1.087,
+        "active_length_cm": 0.35,
+        "radial_dose": {
+            "r_cm": [0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 4.0, 5.0, 6.0, 8.0, 10.0],
+            "g": [1.102, 1.037, 1.014, 1.000, 0.988, 0.982, 0.970, 0.958, 0.945, 0.932, 0.904, 0.874]
+        },
+        "anisotropy": {
+            "r_cm": [0.25, 1.0, 5.0, 10.0],
+            "theta_deg": [0, 5, 10, 20, 30, 45, 60, 90, 120, 135, 150, 160, 170, 175, 180],
+            "F": [[0.92, 0.93, 0.96, 0.99, 1.00, 1.00, 1.00, 1.00, 1.00, 1.00, 0.99, 0.98, 0.94, 0.91, 0.89],
+                  [0.94, 0.95, 0.97, 0.99, 1.00, 1.00, 1.00, 1.00, 1.00, 1.00, 0.99, 0.98, 0.95, 0.93, 0.91],
+                  [0.95, 0.96, 0.98, 0.99, 1.00, 1.00, 1.00, 1.00, 1.00, 1.00, 1.00, 0.99, 0.96, 0.94, 0.93],
+                  [0.96, 0.97, 0.98, 0.99, 1.00, 1.00, 1.00, 1.00, 1.00, 1.00, 1.00, 0.99, 0.97, 0.95, 0.94]]
+        }
+    }
+    R_STEP_CM = 0.01
+    THETA_STEP_DEG = 0.5
+    R_MIN_CM = 0.1
+    _default = None
+
+    def __init__(self, name, dose_rate_constant, active_length_cm, radial_dose, anisotropy):
+        self.name = name
+        self.dose_rate_constant = float(dose_rate_constant)
+        self.active_length_cm = float(active_length_cm)
+
+        r = np.asarray(radial_dose["r_cm"], dtype=np.float64)
+        self.r_max_cm = float(r[-1])
+        self.r_grid = np.arange(0.0, self.r_max_cm + self.R_STEP_CM, self.R_STEP_CM)
+        self.g_table = self._extrapolated_interp(self.r_grid, r, np.asarray(radial_dose["g"], dtype=np.float64))
+
+        f_r = np.asarray(anisotropy["r_cm"], dtype=np.float64)
+        f_theta = np.asarray(anisotropy["theta_deg"], dtype=np.float64)
+        f = np.asarray(anisotropy["F"], dtype=np.float64)
+        self.theta_grid = np.arange(0.0, 180.0 + self.THETA_STEP_DEG, self.THETA_STEP_DEG)
+        # Bilinear resampling: theta first for every tabulated radius, then radius for every angle
+        by_theta = np.stack([np.interp(self.theta_grid, f_theta, row) for row in f])
+        self.f_table = np.stack([np.interp(self.r_grid, f_r, column) for column in by_theta.T], axis=1)
+
+        self.reference_geometry = float(self.geometry_factor(np.array(1.0), np.array(np.pi / 2)))
+
+    @staticmethod
+    def _extrapolated_interp(x, xp, fp):
+        """np.interp with linear extrapolation below the first and above the last point."""
+        y = np.interp(x, xp, fp)
+        below, above = x < xp[0], x > xp[-1]
+        y[below] = fp[0] + (x[below] - xp[0]) * (fp[1] - fp[0]) / (xp[1] - xp[0])
+        y[above] = fp[-1] + (x[above] - xp[-1]) * (fp[-1] - fp[-2]) / (xp[-1] - xp[-2])
+        return y
+
+    @classmethod
+    def co60_default(cls):
+        if cls._default is None:
+            data = cls.CO60_DEFAULT
+            cls._default = cls(data["name"], data["dose_rate_constant"], data["active_length_cm"],
+                               data["radial_dose"], data["anisotropy"])
+        return cls._default
+
+    @staticmethod
+    def default_path():
+        return os.path.join(os.path.expanduser("~"), "BrachyApp", "tg43_source.json")
+
+    @classmethod
+    def load(cls, path=None):
+        """The source in the JSON file (same layout as CO60_DEFAULT) if present, else co60_default()."""
+        path = path or cls.default_path()
+        if os.path.exists(path):
+            try:
+                return cls.from_json(path)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"❌ Could not read TG-43 source data {path}: {e}")
+        return cls.co60_default()
+
+    @classmethod
+    def from_json(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data.get("name", os.path.basename(path)), data["dose_rate_constant"], data["active_length_cm"],
+                   data["radial_dose"], data["anisotropy"])
+
+    def geometry_factor(self, r, theta):
+        """Line-source G_L(r, theta), r in cm (already clipped away from zero)."""
+        half = self.active_length_cm / 2
+        z = r * np.cos(theta)
+        rho = r * np.sin(theta)
+        on_axis = rho < 1e-9
+        beta = np.arctan2(rho, z - half) - np.arctan2(rho, z + half)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            off_axis = beta / (self.active_length_cm * np.where(on_axis, 1.0, rho))
+            along_axis = 1.0 / np.maximum(r ** 2 - half ** 2, 1e-6)
+        return np.where(on_axis, along_axis, off_axis)
+
+    def dose_rate(self, points_cm, positions_cm, directions):
+        """Dose rate per unit air-kerma strength (cGy h^-1 U^-1), shape (..., D).
+
+        points_cm (..., 3) are broadcast against D dwell positions (D, 3) whose
+        source axes are the unit vectors directions (D, 3).
+        """
+        d = np.asarray(points_cm, dtype=np.float64)[..., None, :] - positions_cm
+        r = np.maximum(np.linalg.norm(d, axis=-1), self.R_MIN_CM)
+        cos_theta = np.clip((d * directions).sum(axis=-1) / r, -1.0, 1.0)
+        theta = np.arccos(cos_theta)
+        # Beyond the tables g and F hold their last values
+        r_index = np.minimum(np.rint(r / self.R_STEP_CM).astype(np.intp), len(self.r_grid) - 1)
+        theta_index = np.rint(np.degrees(theta) / self.THETA_STEP_DEG).astype(np.intp)
+        return (self.dose_rate_constant * self.geometry_factor(r, theta) / self.reference_geometry *
+                self.g_table[r_index] * self.f_table[r_index, theta_index])
+
+
+class DwellPlan:
+    """Dwell positions along the reconstructed tandem and ovoids.
+
+    Each applicator gets dwells every step_mm from its tip towards its base
+    over its active length; the source axis of every dwell is the
+    applicator's tip-base direction. Coordinates are mm in the anatomy frame
+    of the 3D reconstruction.
+    """
+
+    ACTIVE_LENGTH_MM = {"applicator_tandem": 60.0, "left_ovoid": 15.0, "right_ovoid": 15.0}
+
+    def __init__(self, positions_mm, directions, applicator_index):
+        self.positions_mm = positions_mm
+        self.directions = directions
+        self.applicator_index = applicator_index
+
+    @classmethod
+    def from_landmarks(cls, points_3d, step_mm=5.0, active_length_mm=None):
+        """points_3d is (applicator, tip/base, x/y/z) in mm; applicators with missing points get no dwells."""
+        active_length_mm = active_length_mm or cls.ACTIVE_LENGTH_MM
+        points_3d = np.asarray(points_3d, dtype=np.float64)
+        positions, directions, owners = [], [], []
+        for a, key in enumerate(LandmarkSet.APPLICATORS):
+            tip, base = points_3d[a]
+            if np.isnan(tip).any() or np.isnan(base).any():
+                continue
+            axis = base - tip
+            length = np.linalg.norm(axis)
+            if length == 0:
+                continue
+            axis /= length
+            offsets = np.arange(0.0, min(active_length_mm[key], length) + 1e-9, step_mm)
+            positions.append(tip + offsets[:, None] * axis)
+            directions.append(np.repeat(axis[None], len(offsets), axis=0))
+            owners.append(np.full(len(offsets), a))
+        if not positions:
+            return cls(np.empty((0, 3)), np.empty((0, 3)), np.empty(0, dtype=int))
+        return cls(np.vstack(positions), np.vstack(directions), np.concatenate(owners))
+
+    def moved_to(self, points_3d_before, points_3d_after):
+        """The same dwells carried rigidly with each applicator to its displaced landmarks."""
+        fit = fit_rigid_transforms(points_3d_before, points_3d_after)
+        rotation = fit["rotation"][self.applicator_index]
+        positions = np.einsum("dij,dj->di", rotation, self.positions_mm) + fit["translation"][self.applicator_index]
+        directions = np.einsum("dij,dj->di", rotation, self.directions)
+        return DwellPlan(positions, directions, self.applicator_index.copy())
+
+    def dose_gy(self, source, points_mm, dwell_times, air_kerma_strength_U=1.0, chunk_size=65536):
+        """Dose (Gy) at points_mm (N, 3) from dwell_times (D,) in hours, evaluated in point chunks."""
+        points_cm = np.asarray(points_mm, dtype=np.float64).reshape(-1, 3) / 10.0
+        dose = np.empty(len(points_cm))
+        for start in range(0, len(points_cm), chunk_size):
+            rate = source.dose_rate(points_cm[start:start + chunk_size], self.positions_mm / 10.0, self.directions)
+            dose[start:start + chunk_size] = rate @ dwell_times * air_kerma_strength_U / 100.0
+        return dose.reshape(np.shape(points_mm)[:-1])
+
+
+def manchester_points(points_3d, a_offset_mm=20.0, b_offset_mm=50.0):
+    """Points A and B (left, right) from reconstructed tip/base landmarks, mm.
+
+    The os is taken where the tandem passes the ovoids' mid-point; Points A lie
+    a_offset_mm up the tandem from it and a_offset_mm to either side in the
+    plane of the ovoids, Points B at b_offset_mm to the side on the same level.
+    With one ovoid missing, the lateral direction is the present ovoid's offset
+    from the tandem. Raises ValueError when the tandem or both ovoids are
+    missing, as the points cannot be placed.
+    """
+    points_3d = np.asarray(points_3d, dtype=np.float64)
+    if np.isnan(points_3d[0]).any():
+        raise ValueError("Points A/B need the tandem tip and base")
+    tandem_tip, tandem_base = points_3d[0]
+    axis = tandem_tip - tandem_base
+    axis /= np.linalg.norm(axis)
+    # Mean of each ovoid's present landmarks, None for a missing ovoid
+    present = [ovoid[~np.isnan(ovoid).any(axis=1)] for ovoid in points_3d[1:3]]
+    left, right = (ovoid.mean(axis=0) if len(ovoid) else None for ovoid in present)
+    if left is None and right is None:
+        raise ValueError("Points A/B need at least one ovoid")
+    ovoid_mid = np.concatenate(present).mean(axis=0)
+    os_point = tandem_base + np.dot(ovoid_mid - tandem_base, axis) * axis
+    if left is not None and right is not None:
+        lateral = left - right
+    elif left is not None:
+        lateral = left - os_point
+    else:
+        lateral = os_point - right
+    lateral -= np.dot(lateral, axis) * axis
+    if np.linalg.norm(lateral) < 1e-6:
+        raise ValueError("Points A/B need an ovoid off the tandem axis")
+    lateral /= np.linalg.norm(lateral)
+    level = os_point + a_offset_mm * axis
+    return {
+        "Point A (L)": level + a_offset_mm * lateral,
+        "Point A (R)": level - a_offset_mm * lateral,
+        "Point B (L)": level + b_offset_mm * lateral,
+        "Point B (R)": level - b_offset_mm * lateral
+    }
+
+
+def dose_grid(points_3d, margin_mm=30.0, spacing_mm=2.5):
+    """Regular grid (nx, ny, nz, 3) in mm enclosing the landmarks with a margin."""
+    flat = np.asarray(points_3d, dtype=np.float64).reshape(-1, 3)
+    low = np.nanmin(flat, axis=0) - margin_mm
+    high = np.nanmax(flat, axis=0) + margin_mm
+    axes = [np.arange(lo, hi + spacing_mm / 2, spacing_mm) for lo, hi in zip(low, high)]
+    return np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1)
+
+
+class MeasurementStore:
+    """Anatomy-referenced applicator distances, one JSON line per saved measurement.
+
+    Records are appended to measurements.jsonl in the workspace; the newest
+    record for a (view, fraction) pair wins. The *_distances_from_anatomy.txt
+    files are rendered from these records for reading only.
+    """
+
+    FILENAME = "measurements.jsonl"
+    APPLICATORS = {
+        "applicator_tandem": "Tandem Applicator",
+        "left_ovoid": "Left Ovoid",
+        "right_ovoid": "Right Ovoid"
+    }
+    MEASUREMENTS = ("tip_to_start", "base_to_start", "tip_to_end", "base_to_end")
+    VIEW_LABELS = {"AP": "AP", "LAT": "Lateral"}
+    # Shared by every instance: the app builds a store per call against the current workspace
+    _lock = threading.Lock()
+
+    def __init__(self, workspace):
+        self.path = os.path.join(workspace, self.FILENAME)
+
+    @classmethod
+    def measure(cls, view, fraction, anatomy_start, anatomy_end, explicit_points, mm_per_px, zoom=1.0):
+        """Build a record from tip/base points (LandmarkSet or explicit-points dict) and the
+        two anatomy references, all in pixels, clicked at the window's display zoom."""
+        landmarks = explicit_points if isinstance(explicit_points, LandmarkSet) else LandmarkSet.from_json(explicit_points)
+        # (applicator, tip/base, start/end)
+        dist = landmark_geometry(landmarks, references=[anatomy_start, anatomy_end],
+                                 mm_per_px=mm_per_px)["distance1"][:, :2]
+        # Superior-inferior offset from the anatomy start (image y grows downwards)
+        height = (float(anatomy_start[1]) - landmarks.coords[:, :, 1]) * mm_per_px
+
+        applicators = {}
+        for i, key in enumerate(LandmarkSet.APPLICATORS):
+            if not landmarks.complete[i]:
+                applicators[key] = None
+                continue
+            applicators[key] = {
+                "tip": landmarks.coords[i, 0].tolist(),
+                "base": landmarks.coords[i, 1].tolist(),
+                "tip_to_start": float(dist[i, 0, 0]),
+                "base_to_start": float(dist[i, 1, 0]),
+                "tip_to_end": float(dist[i, 0, 1]),
+                "base_to_end": float(dist[i, 1, 1]),
+                "tip_height": float(height[i, 0]),
+                "base_height": float(height[i, 1])
+            }
+        return {
+            "view": view,
+            "fraction": int(fraction),
+            "mm_per_px": float(mm_per_px),
+            "zoom": float(zoom),
+            "anatomy_start": [float(v) for v in anatomy_start],
+            "anatomy_end": [float(v) for v in anatomy_end],
+            "applicators": applicators,
+            "saved": datetime.now().isoformat(timespec="seconds")
+        }
+
+    def append(self, record):
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        return record
+
+    def records(self):
+        if not os.path.exists(self.path):
+            return []
+        records = []
+        with self._lock:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line_number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # A torn final line from an interrupted write; earlier records still count
+                        print(f"❌ Skipping unreadable measurement record {line_number} in {self.path}")
+        return records
+
+    def latest(self, view, fraction):
+        for record in reversed(self.records()):
+            if record["view"] == view and record["fraction"] == int(fraction):
+                return record
+        return None
+
+    def has(self, view, fraction):
+        return self.latest(view, fraction) is not None
+
+    def distances(self, view, fraction):
+        """{applicator name: {"tip_to_start": mm, ...}} for the latest record, {} if none."""
+        record = self.latest(view, fraction)
+        if record is None:
+            return {}
+        return {self.APPLICATORS[key]: {m: entry[m] for m in self.MEASUREMENTS}
+                for key, entry in record["applicators"].items() if entry}
+
+    def comparison(self, view, source_fraction=1, target_fraction=2):
+        """{applicator name: {"tip_to_start": {"fraction1", "fraction2", "shift"}}} for both fractions."""
+        first = self.distances(view, source_fraction)
+        second = self.distances(view, target_fraction)
+        return {name: {m: {"fraction1": first[name][m],
+                           "fraction2": second[name][m],
+                           "shift": second[name][m] - first[name][m]}
+                       for m in self.MEASUREMENTS}
+                for name in first if name in second}
+
+    def fractions(self, view):
+        """Sorted fraction numbers with at least one record for the view."""
+        return sorted({record["fraction"] for record in self.records() if record["view"] == view})
+
+    @staticmethod
+    def landmark_array(records):
+        """(fraction, applicator, tip/base, x/y) in mm, every fraction in the first one's frame.
+
+        Each later fraction is carried into the first fraction's frame by the
+        rigid fit of its anatomy start/end references onto the first's.
+        """
+        first = records[0]
+        coords = np.full((len(records), len(LandmarkSet.APPLICATORS), 2, 2), np.nan)
+        for f, record in enumerate(records):
+            matrix = fit_similarity_transform([record["anatomy_start"], record["anatomy_end"]],
+                                              [first["anatomy_start"], first["anatomy_end"]])
+            for a, key in enumerate(LandmarkSet.APPLICATORS):
+                entry = record["applicators"].get(key)
+                if entry:
+                    coords[f, a] = apply_affine_points([entry["tip"], entry["base"]], matrix)
+        return coords * first["mm_per_px"]
+
+    def film_pixels(self, view, fractions):
+        """(pixels, origins, scales, ends) of the latest record of each fraction.
+
+        pixels is (fraction, applicator, tip/base, x/y) with NaN where missing;
+        origins and ends are the anatomy start and end broadcastable against
+        it, scales the records' mm_per_px.
+        """
+        pixels = np.full((len(fractions), len(LandmarkSet.APPLICATORS), 2, 2), np.nan)
+        origins = np.zeros((len(fractions), 1, 1, 2))
+        ends = np.zeros((len(fractions), 1, 1, 2))
+        scales = np.ones((len(fractions), 1, 1, 1))
+        for f, fraction in enumerate(fractions):
+            record = self.latest(view, fraction)
+            if record is None:
+                continue
+            origins[f] = record["anatomy_start"]
+            ends[f] = record["anatomy_end"]
+            scales[f] = record["mm_per_px"]
+            for a, key in enumerate(LandmarkSet.APPLICATORS):
+                entry = record["applicators"].get(key)
+                if entry:
+                    pixels[f, a] = [entry["tip"], entry["base"]]
+        return pixels, origins, scales, ends
+
+    def click_quantization(self, view, fractions, default=1.0):
+        """(fraction, 1, 1, 1) click truncation steps in pixels from each record's zoom, broadcastable like film_pixels()."""
+        steps = np.full((len(fractions), 1, 1, 1), float(default))
+        for f, fraction in enumerate(fractions):
+            record = self.latest(view, fraction)
+            if record is not None and record.get("zoom"):
+                steps[f] = ClickUncertainty.step_for_zoom(record["zoom"])
+        return steps
+
+    def displacement_matrix(self, view, fractions=None):
+        """pairwise_displacements() over the latest record of every fraction, or None if fewer than two."""
+        fractions = self.fractions(view) if fractions is None else list(fractions)
+        records = [self.latest(view, fraction) for fraction in fractions]
+        present = [(fraction, record) for fraction, record in zip(fractions, records) if record]
+        if len(present) < 2:
+            return None
+        return pairwise_displacements(self.landmark_array([record for _, record in present]),
+                                      [fraction for fraction, _ in present])
+
+    @staticmethod
+    def measurement_label(measurement):
+        point, _, reference = measurement.split("_")
+        return f"{point.title()} to Anatomy {reference.title()}"
+
+    @classmethod
+    def render_text(cls, record):
+        """The human-readable distances report for one record."""
+        def point(values):
+            return str(tuple(int(round(v)) for v in values))
+
+        lines = [f"=== {cls.VIEW_LABELS.get(record['view'], record['view'])} View - Fraction {record['fraction']} ===",
+                 f"Anatomy start point: {point(record['anatomy_start'])}",
+                 f"Anatomy end point: {point(record['anatomy_end'])}",
+                 ""]
+        for key, name in cls.APPLICATORS.items():
+            entry = record["applicators"].get(key)
+            if not entry:
+                lines.append(f"{name}: Tip or base missing")
+                continue
+            for measurement in cls.MEASUREMENTS:
+                lines.append(f"{name} {cls.measurement_label(measurement)}: {entry[measurement]:.2f} mm")
+        return lines
+
+    def save(self, record, txt_path, writer=None):
+        """Append the record and refresh its rendered TXT view (queued on writer when given)."""
+        self.append(record)
+        text = "".join(line + "\n" for line in self.render_text(record))
+        if writer is None:
+            atomic_write(txt_path, text)
+        else:
+            writer.write_text(txt_path, text, description=f"distances view {os.path.basename(txt_path)}")
+        return record
+
+
+class CohortDatabase:
+    """Indexed SQLite store of measurements and displacements across patients.
+
+    Patients own fractions, fractions own views (AP / LAT film with its pixel
+    spacing), views own landmarks and distances. Displacements are stored per
+    patient, fraction pair, view, applicator and point, with the treatment date
+    of the later fraction copied in so date-bounded queries use one index.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS patients (
+            id INTEGER PRIMARY KEY,
+            admission_number TEXT NOT NULL UNIQUE,
+            name TEXT,
+            created TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS fractions (
+            id INTEGER PRIMARY KEY,
+            patient_id INTEGER NOT NULL REFERENCES patients(id) ON DELETE CASCADE,
+            fraction_number INTEGER NOT NULL,
+            treatment_date TEXT,
+            session_id TEXT,
+            UNIQUE (patient_id, fraction_number)
+        );
+        CREATE TABLE IF NOT EXISTS views (
+            id INTEGER PRIMARY KEY,
+            fraction_id INTEGER NOT NULL REFERENCES fractions(id) ON DELETE CASCADE,
+            view TEXT NOT NULL,
+            mm_per_px REAL,
+            UNIQUE (fraction_id, view)
+        );
+        CREATE TABLE IF NOT EXISTS landmarks (
+            id INTEGER PRIMARY KEY,
+            view_id INTEGER NOT NULL REFERENCES views(id) ON DELETE CASCADE,
+            structure TEXT NOT NULL,
+            point TEXT NOT NULL,
+            x_px REAL NOT NULL,
+            y_px REAL NOT NULL,
+            UNIQUE (view_id, structure, point)
+        );
+        CREATE TABLE IF NOT EXISTS distances (
+            id INTEGER PRIMARY KEY,
+            view_id INTEGER NOT NULL REFERENCES views(id) ON DELETE CASCADE,
+            applicator TEXT NOT NULL,
+            measurement TEXT NOT NULL,
+            distance_mm REAL NOT NULL,
+            UNIQUE (view_id, applicator, measurement)
+        );
+        CREATE TABLE IF NOT EXISTS displacements (
+            id INTEGER PRIMARY KEY,
+            patient_id INTEGER NOT NULL REFERENCES patients(id) ON DELETE CASCADE,
+            source_fraction INTEGER NOT NULL,
+            target_fraction INTEGER NOT NULL,
+            view TEXT NOT NULL,
+            applicator TEXT NOT NULL,
+            point TEXT NOT NULL,
+            dx_mm REAL,
+            dy_mm REAL,
+            dz_mm REAL,
+            magnitude_mm REAL NOT NULL,
+            treatment_date TEXT,
+            UNIQUE (patient_id, source_fraction, target_fraction, view, applicator, point)
+        );
+        CREATE INDEX IF NOT EXISTS idx_fractions_date ON fractions (treatment_date);
+        CREATE INDEX IF NOT EXISTS idx_distances_measurement ON distances (applicator, measurement, distance_mm);
+        CREATE INDEX IF NOT EXISTS idx_displacements_lookup
+            ON displacements (applicator, point, treatment_date, magnitude_mm);
+        CREATE INDEX IF NOT EXISTS idx_displacements_magnitude ON displacements (magnitude_mm);
+        CREATE INDEX IF NOT EXISTS idx_displacements_patient ON displacements (patient_id);
+    """
+
+    def __init__(self, path=None):
+        self.path = path or self.default_path()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(self.SCHEMA)
+
+    @staticmethod
+    def default_path():
+        # Outside the temp workspaces: the cohort outlives every session
+        return os.path.join(os.path.expanduser("~"), "BrachyApp", "cohort.sqlite")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    @staticmethod
+    def _upsert_patient(conn, admission_number, name):
+        conn.execute("INSERT INTO patients (admission_number, name, created) VALUES (?, ?, ?) "
+                     "ON CONFLICT (admission_number) DO UPDATE SET name = excluded.name",
+                     (admission_number, name, datetime.now().isoformat(timespec="seconds")))
+        return conn.execute("SELECT id FROM patients WHERE admission_number = ?", (admission_number,)).fetchone()[0]
+
+    @staticmethod
+    def _upsert_fraction(conn, patient_id, fraction_number, treatment_date, session_id):
+        conn.execute("INSERT INTO fractions (patient_id, fraction_number, treatment_date, session_id) VALUES (?, ?, ?, ?) "
+                     "ON CONFLICT (patient_id, fraction_number) DO UPDATE SET "
+                     "treatment_date = excluded.treatment_date, session_id = excluded.session_id",
+                     (patient_id, fraction_number, treatment_date, session_id))
+        return conn.execute("SELECT id FROM fractions WHERE patient_id = ? AND fraction_number = ?",
+                            (patient_id, fraction_number)).fetchone()[0]
+
+    @staticmethod
+    def _insert_measurement(conn, fraction_id, record):
+        conn.execute("INSERT INTO views (fraction_id, view, mm_per_px) VALUES (?, ?, ?) "
+                     "ON CONFLICT (fraction_id, view) DO UPDATE SET mm_per_px = excluded.mm_per_px",
+                     (fraction_id, record["view"], record["mm_per_px"]))
+        view_id = conn.execute("SELECT id FROM views WHERE fraction_id = ? AND view = ?",
+                               (fraction_id, record["view"])).fetchone()[0]
+        # A re-run replaces the view's landmarks and distances wholesale
+        conn.execute("DELETE FROM landmarks WHERE view_id = ?", (view_id,))
+        conn.execute("DELETE FROM distances WHERE view_id = ?", (view_id,))
+
+        landmarks = [(view_id, "anatomy", "start", *record["anatomy_start"]),
+                     (view_id, "anatomy", "end", *record["anatomy_end"])]
+        distances = []
+        for applicator, entry in record["applicators"].items():
+            if not entry:
+                continue
+            landmarks.append((view_id, applicator, "tip", *entry["tip"]))
+            landmarks.append((view_id, applicator, "base", *entry["base"]))
+            distances.extend((view_id, applicator, m, entry[m]) for m in MeasurementStore.MEASUREMENTS)
+        conn.executemany("INSERT INTO landmarks (view_id, structure, point, x_px, y_px) VALUES (?, ?, ?, ?, ?)", landmarks)
+        conn.executemany("INSERT INTO distances (view_id, applicator, measurement, distance_mm) VALUES (?, ?, ?, ?)", distances)
+
+    def bulk_insert(self, patient, fractions=(), measurements=(), displacements=()):
+        """Insert one patient's results in a single transaction.
+
+        patient: {"admission_number", "name"}
+        fractions: [{"fraction_number", "treatment_date", "session_id"}]
+        measurements: MeasurementStore records (each names its view and fraction)
+        displacements: [{"source_fraction", "target_fraction", "view", "applicator", "point",
+                         "dx_mm", "dy_mm", "dz_mm", "magnitude_mm"}]
+        Returns the patient id.
+        """
+        with closing(self._connect()) as conn, conn:
+            patient_id = self._upsert_patient(conn, patient["admission_number"], patient.get("name"))
+            fraction_ids, dates = {}, {}
+            for fraction in fractions:
+                number = int(fraction["fraction_number"])
+                fraction_ids[number] = self._upsert_fraction(conn, patient_id, number, fraction.get("treatment_date"),
+                                                             fraction.get("session_id"))
+                dates[number] = fraction.get("treatment_date")
+            for record in measurements:
+                number = int(record["fraction"])
+                if number not in fraction_ids:
+                    fraction_ids[number] = self._upsert_fraction(conn, patient_id, number, None, None)
+                self._insert_measurement(conn, fraction_ids[number], record)
+            conn.executemany(
+                "INSERT INTO displacements (patient_id, source_fraction, target_fraction, view, applicator, point, "
+                "dx_mm, dy_mm, dz_mm, magnitude_mm, treatment_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (patient_id, source_fraction, target_fraction, view, applicator, point) DO UPDATE SET "
+                "dx_mm = excluded.dx_mm, dy_mm = excluded.dy_mm, dz_mm = excluded.dz_mm, "
+                "magnitude_mm = excluded.magnitude_mm, treatment_date = excluded.treatment_date",
+                [(patient_id, int(row["source_fraction"]), int(row["target_fraction"]), row["view"],
+                  row["applicator"], row["point"], row.get("dx_mm"), row.get("dy_mm"), row.get("dz_mm"),
+                  float(row["magnitude_mm"]), row.get("treatment_date", dates.get(int(row["target_fraction"]))))
+                 for row in displacements])
+        return patient_id
+
+    def query_displacements(self, applicator=None, point=None, min_magnitude=None, since=None, until=None, view=None):
+        """Displacement rows joined with the patient, e.g. tandem tips over 5 mm since a date."""
+        clauses, params = [], []
+        for column, value in (("d.applicator = ?", applicator), ("d.point = ?", point), ("d.view = ?", view),
+                              ("d.treatment_date >= ?", since), ("d.treatment_date <= ?", until),
+                              ("d.magnitude_mm > ?", min_magnitude)):
+            if value is not None:
+                clauses.append(column)
+                params.append(value)
+        sql = ("SELECT p.admission_number, p.name, d.* FROM displacements d "
+               "JOIN patients p ON p.id = d.patient_id")
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY d.magnitude_mm DESC"
+        with closing(self._connect()) as conn:
+            return [dict(row) for row in conn.execute(sql, params)]
+
+
+class AnnotationRepository:
+    """Parsed annotation JSON served from memory, re-read only when the file changes.
+
+    A cached entry is reused while the file's size and mtime are unchanged. If
+    they differ, the file is re-hashed and re-parsed only when the content did
+    change. Files modified within RACY_SECONDS of being cached are always
+    re-hashed, since coarse filesystem timestamps cannot tell a quick same-size
+    rewrite apart. Returned objects are shared and must be treated as read-only.
+    """
+
+    RACY_SECONDS = 2.0
+
+    def __init__(self, before_read=None):
+        self._entries = {}
+        self._derived = {}
+        self._lock = threading.Lock()
+        # e.g. BackgroundFileWriter.wait_for, so a queued write is never read stale
+        self.before_read = before_read
+
+    def _version(self, path):
+        """(size, mtime_ns, sha1) of the current file contents, refreshing the cache as needed."""
+        if self.before_read is not None:
+            self.before_read(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self._entries.pop(path, None)
+            return None
+        entry = self._entries.get(path)
+        if entry and not entry["racy"] and (entry["size"], entry["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+            return entry["version"]
+
+        with open(path, "rb") as f:
+            raw = f.read()
+        digest = hashlib.sha1(raw).hexdigest()
+        if entry is None or entry["sha1"] != digest:
+            entry = {"sha1": digest, "data": json.loads(raw.decode("utf-8"))}
+        entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns,
+                     racy=time.time() - stat.st_mtime < self.RACY_SECONDS,
+                     version=(stat.st_size, stat.st_mtime_ns, digest))
+        self._entries[path] = entry
+        return entry["version"]
+
+    def load(self, path):
+        """Parsed JSON at path, or None if the file is missing."""
+        with self._lock:
+            if self._version(path) is None:
+                return None
+            return self._entries[path]["data"]
+
+    def derived(self, key, paths, compute):
+        """compute() memoised on the current contents of every file in paths."""
+        with self._lock:
+            versions = tuple(self._version(path) for path in paths)
+            cached = self._derived.get(key)
+            if cached and cached[0] == versions:
+                return cached[1]
+        value = compute()
+        with self._lock:
+            self._derived[key] = (versions, value)
+        return value
+
+
+class SessionWorkspace:
+    """Per-patient, per-session working directory with a small manifest.
+
+    Layout is <root>/BrachyApp/<patient>/<session id>/, so concurrent app
+    instances and batch workers never share artifact paths. The manifest
+    records who owns the session and which patient it belongs to. Sessions
+    that end empty or without a patient are discarded; empty ones left by
+    instances that never closed are pruned when a new session is created.
+    """
+
+    MANIFEST = "manifest.json"
+    UNASSIGNED = "unassigned"
+    # Empty sessions untouched for this long belong to instances that crashed or were killed
+    STALE_HOURS = 24
+
+    def __init__(self, path, manifest):
+        self.path = path
+        self.manifest = manifest
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def patient_slug(name=None, admission=None):
+        """Filesystem-safe folder name; the admission number wins when present."""
+        label = (admission or "").strip() or (name or "").strip()
+        slug = re.sub(r"[^A-Za-z0-9._-]+", "_", label).strip("._")
+        return slug[:64] or SessionWorkspace.UNASSIGNED
+
+    @staticmethod
+    def new_session_id():
+        return f"{datetime.now():%Y%m%d-%H%M%S}_{os.getpid()}_{uuid.uuid4().hex[:6]}"
+
+    @classmethod
+    def prune(cls, base_dir, max_age_hours=None):
+        """Remove stale sessions that hold nothing but their manifest; returns how many."""
+        cutoff = time.time() - 3600 * (cls.STALE_HOURS if max_age_hours is None else max_age_hours)
+        removed = 0
+        for manifest_path in glob.glob(os.path.join(base_dir, "*", "*", cls.MANIFEST)):
+            try:
+                if os.path.getmtime(manifest_path) >= cutoff:
+                    continue
+                workspace = cls.load(os.path.dirname(manifest_path))
+            except (OSError, ValueError):
+                continue
+            if workspace.is_empty():
+                workspace.discard()
+                removed += 1
+        return removed
+
+    @classmethod
+    def create(cls, base_dir, name=None, admission=None):
+        cls.prune(base_dir)
+        session_id = cls.new_session_id()
+        path = os.path.join(base_dir, cls.patient_slug(name, admission), session_id)
+        os.makedirs(path)
+        manifest = {
+            "session_id": session_id,
+            "patient": {"name": name or "", "admission_number": admission or ""},
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "updated": None,
+            "host": socket.gethostname(),
+            "pid": os.getpid()
+        }
+        workspace = cls(path, manifest)
+        workspace.write_manifest()
+        return workspace
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, cls.MANIFEST), "r") as f:
+            return cls(path, json.load(f))
+
+    def write_manifest(self):
+        with self._lock:
+            self.manifest["updated"] = datetime.now().isoformat(timespec="seconds")
+            manifest_path = os.path.join(self.path, self.MANIFEST)
+            tmp_path = manifest_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.manifest, f, indent=2)
+            os.replace(tmp_path, manifest_path)
+
+    def is_empty(self):
+        return all(entry in (self.MANIFEST, self.MANIFEST + ".tmp") for entry in os.listdir(self.path))
+
+    def is_bound(self):
+        return any(self.manifest.get("patient", {}).values())
+
+    def discard(self):
+        """Delete the session folder, and its patient folder once no session is left in it."""
+        shutil.rmtree(self.path, ignore_errors=True)
+        try:
+            os.rmdir(os.path.dirname(self.path))
+        except OSError:
+            pass
+
+    def close(self):
+        """End the session: an empty or unbound session is deleted. Returns True if it was."""
+        if os.path.isdir(self.path) and (self.is_empty() or not self.is_bound()):
+            self.discard()
+            return True
+        return False
+
+    def bind_patient(self, name, admission):
+        """Record the patient; an unassigned session with no artifacts yet moves into the patient folder.
+
+        Sessions that already hold files stay where they are (stored paths and
+        image fingerprints point into them) and only the manifest is updated.
+        Returns the workspace path, which may have changed.
+        """
+        patient = {"name": name or "", "admission_number": admission or ""}
+        if patient == self.manifest.get("patient"):
+            return self.path
+        self.manifest["patient"] = patient
+
+        patient_dir = os.path.join(os.path.dirname(os.path.dirname(self.path)), self.patient_slug(name, admission))
+        current_patient_dir = os.path.dirname(self.path)
+        if (os.path.basename(current_patient_dir) == self.UNASSIGNED and
+                os.path.normcase(patient_dir) != os.path.normcase(current_patient_dir) and self.is_empty()):
+            target = os.path.join(patient_dir, self.manifest["session_id"])
+            try:
+                os.makedirs(patient_dir, exist_ok=True)
+                os.rename(self.path, target)
+                self.path = target
+            except OSError as e:
+                print(f"❌ Could not move workspace to patient folder: {e}")
+        self.write_manifest()
+        return self.path
+
+
 class BrachyApp:
     def __init__(self, root):
         self.root = root
@@ -644,6 +3408,11 @@ class BrachyApp:
         
       
         self.temp_dir = self.create_temp_directory()
+        self.file_writer = BackgroundFileWriter(root=self.root)
+        self.file_writer.done_handler = self.report_write_done
+        self.file_writer.error_handler = self.report_write_failure
+        self.annotations = AnnotationRepository(before_read=self.file_writer.wait_for)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
         
         self.patient_info = {}
@@ -663,6 +3432,15 @@ class BrachyApp:
         }
 
         
+        # ImagingGeometry per (image key, path, spacing); DICOM headers are read once
+        self.geometry_cache = {}
+        # Landmark click error used by the Monte Carlo uncertainty of displacement results
+        self.click_uncertainty = ClickUncertainty(sigma_px=1.0, quantization_px=1.0)
+        # TG-43 source data and plan normalisation used by the dosimetric impact of displacements
+        self.tg43_source = TG43Source.load()
+        self.dose_prescription_gy = 9.0
+        self.dwell_step_mm = 5.0
+
         self.current_window = "main"  
         self.ap_window = None
         self.lat_window = None
@@ -875,18 +3653,12 @@ class BrachyApp:
 
     def validate_images_for_analysis(self, view_type):
     
-        if view_type == "AP":
-            required = ["AP_frac1"]
-            if self.fractions_entry.get() == "2":
-                required.append("AP_frac2")
-        else:  
-            required = ["LAT_frac1"]
-            if self.fractions_entry.get() == "2":
-                required.append("LAT_frac2")
+        # The annotation windows pair fraction 1 with one comparison fraction
+        required = [fraction_key(view_type, n) for n in range(1, min(self.fraction_count(default=1), 2) + 1)]
         
         missing = []
         for key in required:
-            if not self.image_paths[key]:
+            if not self.image_paths.get(key):
                 missing.append(key.replace('_', ' ').title())
         
         if missing:
@@ -946,17 +3718,48 @@ class BrachyApp:
             )
             sys.exit(1)
     
-    def create_temp_directory(self):
+    def create_temp_directory(self, name=None, admission=None):
     
-        temp_dir = os.path.join(tempfile.gettempdir(), "BrachyApp")
+        # Each session gets its own <patient>/<session id> folder under the shared root
+        base_dir = os.path.join(tempfile.gettempdir(), "BrachyApp")
         try:
-            os.makedirs(temp_dir, exist_ok=True)
-            return temp_dir
+            self.workspace = SessionWorkspace.create(base_dir, name, admission)
         except (OSError, PermissionError) as e:
             
-            temp_dir = os.path.join(os.getcwd(), "BrachyApp_Temp")
-            os.makedirs(temp_dir, exist_ok=True)
-            return temp_dir
+            base_dir = os.path.join(os.getcwd(), "BrachyApp_Temp")
+            self.workspace = SessionWorkspace.create(base_dir, name, admission)
+        print(f"Workspace: {self.workspace.path}")
+        return self.workspace.path
+
+    def bind_workspace_to_patient(self):
+        name = self.name_entry.get().strip()
+        admission = self.admission_entry.get().strip()
+        if name or admission:
+            self.temp_dir = self.workspace.bind_patient(name, admission)
+
+    def measurement_store(self):
+        return MeasurementStore(self.temp_dir)
+
+    def report_write_done(self, description):
+        print(f"✅ Saved {description}")
+        if hasattr(self, "status_var"):
+            self.status_var.set(f"Saved {description}")
+
+    def report_write_failure(self, description, error):
+        if hasattr(self, "status_var"):
+            self.status_var.set(f"Save failed: {description}")
+        messagebox.showerror("Save Failed", f"Could not write {description}:\n{error}")
+
+    def close_workspace(self):
+        self.bind_workspace_to_patient()
+        if self.workspace.close():
+            print(f"Discarded workspace without a patient: {self.workspace.path}")
+
+    def on_close(self):
+        # Let queued writes land before the worker thread dies with the process
+        self.file_writer.wait()
+        self.close_workspace()
+        self.root.destroy()
     
     def get_safe_window_size(self, parent):
      
@@ -1352,6 +4155,10 @@ class BrachyApp:
                   bg="#8e44ad", fg="white", font=self.get_scaled_font(10), 
                   width=20, height=1).grid(row=0, column=4, padx=int(4 * screen_info['scale']), pady=int(8 * screen_info['scale']))
 
+        self.create_scaled_button(buttons_frame, text="🗄 Save to Cohort Database", command=self.export_to_cohort_database,
+                  bg="#16a085", fg="white", font=self.get_scaled_font(10), 
+                  width=25, height=1).grid(row=1, column=0, columnspan=2, padx=int(4 * screen_info['scale']), pady=int(8 * screen_info['scale']))
+
         
         status_frame = tk.Frame(main_container, bg="#34495e", height=int(25 * screen_info['scale']))
         status_frame.grid(row=6, column=0, sticky="ew", pady=(int(10 * screen_info['scale']), 0))
@@ -1398,10 +4205,9 @@ class BrachyApp:
             lat_spacing = float(self.lat_spacing_entry.get())
             
        
-            self.pixel_spacing["AP_frac1"] = ap_spacing
-            self.pixel_spacing["AP_frac2"] = ap_spacing
-            self.pixel_spacing["LAT_frac1"] = lat_spacing
-            self.pixel_spacing["LAT_frac2"] = lat_spacing
+            self.ensure_fraction_slots()
+            for key in self.pixel_spacing:
+                self.pixel_spacing[key] = ap_spacing if parse_fraction_key(key)[0] == "AP" else lat_spacing
             
             messagebox.showinfo("Calibration Applied", 
                               f"AP Images: {ap_spacing:.4f} mm/pixel\n"
@@ -1425,6 +4231,11 @@ class BrachyApp:
             lbl.config(image='', text=key)
             lbl.image = None
 
+        # Pending writes still target the old workspace; let them land before switching
+        self.file_writer.wait()
+        self.close_workspace()
+        self.temp_dir = self.create_temp_directory()
+
         print("New patient data cleared.")
 
     def upload_image(self, key):
@@ -1435,6 +4246,10 @@ class BrachyApp:
         )
     
         if filepath:
+            if filepath != self.image_paths.get(key):
+                # Stored alignments of this view were fitted to the previous image
+                self.file_writer.wait()
+                AlignmentTransformStore(self.temp_dir).invalidate(parse_fraction_key(key)[0])
             self.image_paths[key] = filepath
 
             try:
@@ -1473,6 +4288,7 @@ class BrachyApp:
                 self.image_paths[key] = Nonee
 
     def show_info(self):
+        self.bind_workspace_to_patient()
         self.patient_info = {
             "Name": self.name_entry.get(),
             "Admission Number": self.admission_entry.get(),
@@ -1502,6 +4318,102 @@ class BrachyApp:
      
         messagebox.showinfo("Patient Information", info_text)
 
+    def fraction_count(self, default=2):
+        """Planned number of fractions from the patient form"""
+        try:
+            return max(1, int(self.fractions_entry.get()))
+        except (ValueError, AttributeError):
+            return default
+
+    def ensure_fraction_slots(self, count=None):
+        """Image path and pixel spacing entries for every planned fraction of both views"""
+        for view in ("AP", "LAT"):
+            for n in range(1, (count or self.fraction_count()) + 1):
+                key = fraction_key(view, n)
+                self.image_paths.setdefault(key, None)
+                self.pixel_spacing.setdefault(key, self.pixel_spacing[fraction_key(view, 1)])
+
+    def fraction_date(self, fraction_number):
+        """Treatment date of a fraction, or None when the form has no date for it"""
+        date_entry = getattr(self, f"date_frac{int(fraction_number)}", None)
+        if date_entry is None:
+            return None
+        try:
+            return date_entry.get_date().isoformat()
+        except Exception:
+            return date_entry.get()
+
+    def export_to_cohort_database(self, database=None):
+        """Push this session's measurements and anatomy-frame displacements into the cohort database"""
+        name = self.name_entry.get().strip()
+        admission = self.admission_entry.get().strip()
+        if not admission:
+            messagebox.showerror("Missing Patient", "Enter the admission number before saving to the cohort database.")
+            return None
+
+        store = self.measurement_store()
+        numbers = sorted(set(store.fractions("AP")) | set(store.fractions("LAT")))
+        measurements = [record for record in (store.latest(view, n) for view in ("AP", "LAT") for n in numbers) if record]
+        if not measurements:
+            messagebox.showerror("No Measurements", "No distance measurements have been saved in this session yet.")
+            return None
+
+        displacements = []
+        for view in ("AP", "LAT"):
+            matrix = store.displacement_matrix(view)
+            if matrix is None:
+                continue
+            # Every ordered pair i < j of the N x N matrix; tip and base only, as before
+            for i, j in zip(*np.triu_indices(len(matrix["fractions"]), k=1)):
+                for a, applicator in enumerate(LandmarkSet.APPLICATORS):
+                    for p, point in enumerate(LandmarkSet.POINTS):
+                        dx, dy = matrix["delta"][i, j, a, p]
+                        if np.isnan(dx) or np.isnan(dy):
+                            continue
+                        displacements.append({"source_fraction": matrix["fractions"][i],
+                                              "target_fraction": matrix["fractions"][j], "view": view,
+                                              "applicator": applicator, "point": point,
+                                              "dx_mm": float(dx), "dy_mm": float(dy), "dz_mm": None,
+                                              "magnitude_mm": float(matrix["magnitude"][i, j, a, p])})
+
+        fractions = [{"fraction_number": n, "treatment_date": self.fraction_date(n),
+                      "session_id": self.workspace.manifest["session_id"]} for n in numbers]
+        try:
+            database = database or CohortDatabase()
+            database.bulk_insert({"admission_number": admission, "name": name}, fractions, measurements, displacements)
+        except (sqlite3.Error, OSError) as e:
+            print(f"❌ Cohort database update failed: {e}")
+            messagebox.showerror("Database Error", f"Could not save to the cohort database:\n{e}")
+            return None
+
+        print(f"✅ Cohort database updated: {database.path} "
+              f"({len(measurements)} measurement sets, {len(displacements)} displacements)")
+        messagebox.showinfo("Cohort Database",
+                            f"Saved {len(measurements)} measurement sets and {len(displacements)} displacements "
+                            f"for {admission}.\n\n{database.path}")
+        return database
+
+    def imaging_geometry(self, image_key):
+        """ImagingGeometry of an image: DICOM tags first, then the calibration profile, else pixel spacing only"""
+        view = parse_fraction_key(image_key)[0]
+        spacing = self.pixel_spacing.get(image_key, 0.2979)
+        image_path = self.image_paths.get(image_key)
+        cache_key = (image_key, image_path, spacing)
+        cache = self.geometry_cache
+        if cache_key not in cache:
+            geometry = (ImagingGeometry.from_dicom(view, image_path, spacing) or
+                        ImagingGeometry.from_profile(view, ImagingGeometry.load_profile(), spacing) or
+                        ImagingGeometry(view, spacing))
+            if geometry.divergent:
+                print(f"{image_key}: SID {geometry.sid_mm:.0f} mm, SOD {geometry.sod_mm:.0f} mm "
+                      f"({geometry.source}), magnification {geometry.magnification:.3f}")
+            cache[cache_key] = geometry
+        return cache[cache_key]
+
+    def object_mm_per_px(self, image_key):
+        """Pixel spacing corrected to the isocentre plane"""
+        return self.imaging_geometry(image_key).object_mm_per_px
+
     def get_pixel_spacing(self, image_key):
         
         return self.pixel_spacing.get(image_key, 0.2979) 
@@ -1538,42 +4450,23 @@ class BrachyApp:
         lut = np.array([((i/255.0)**(1/gamma))*255 for i in np.arange(0,256)]).astype("uint8")
         return cv2.LUT(unsharp, lut)
 
-    def euclidean_distance(self, p1, p2):
-      
-        return math.sqrt((p2[0]-p1[0])**2 + (p2[1]-p1[1])**2)
-
-    def load_applicator_points(self, json_filename):
-        import os
-        import json
+    def load_annotation_json(self, json_filename):
+        """Parsed annotation file from the in-memory repository (read-only), or None"""
+        return self.annotations.load(os.path.join(self.temp_dir, json_filename))
 
+    def load_applicator_points(self, json_filename, view="AP", fraction=None):
+        """LandmarkSet parsed from an annotation file (any layout), or None if the file is missing"""
         json_path = os.path.join(self.temp_dir, json_filename)
-        if not os.path.exists(json_path):
-            print(f"File not found: {json_path}")
-            return None
-
-        try:
-            with open(json_path, 'r') as f:
-                data = json.load(f)
 
-            print(f"DEBUG: Loaded {json_filename} - Type: {type(data)}")
-        
-            
-            if isinstance(data, dict):
-                print(f"DEBUG: Dictionary format with keys: {list(data.keys())}")
-                return data
-            elif isinstance(data, list):
-                print(f"DEBUG: List format with {len(data)} items")
-              
-                converted_data = {}
-                for item in data:
-                    if isinstance(item, dict):
-                        converted_data.update(item)
-                print(f"DEBUG: Converted to dictionary with keys: {list(converted_data.keys())}")
-                return converted_data
-            else:
-                print(f"Unexpected data format in {json_filename}: {type(data)}")
+        def parse():
+            data = self.annotations.load(json_path)
+            if data is None:
+                print(f"File not found: {json_path}")
                 return None
-        
+            return LandmarkSet.from_json(data, view, fraction)
+
+        try:
+            return self.annotations.derived(("landmarks", json_path, view, fraction), [json_path], parse)
         except Exception as e:
             print(f"Error loading applicator points: {e}")
             return None
@@ -1634,38 +4527,27 @@ class BrachyApp:
     def calculate_direct_shifts_between_fractions(self):
      
        
-        frac1_points = self.load_applicator_points("AP_frac1_annotations.json")
+        frac1_points = self.load_applicator_points("AP_frac1_annotations.json", "AP", 1)
         if not frac1_points:
             messagebox.showerror("Error", "Could not load Fraction 1 applicator points")
             return None
     
        
-        frac2_points = self.load_applicator_points("AP_frac2_annotations.json")
+        frac2_points = self.load_applicator_points("AP_frac2_annotations.json", "AP", 2)
         if not frac2_points:
             messagebox.showerror("Error", "Could not load Fraction 2 applicator points")
             return None
     
         shifts = {}
-        mm_per_px = self.pixel_spacing["AP_frac1"]  
+        mm_per_px = self.object_mm_per_px("AP_frac1")  
+        geometry = landmark_geometry(frac1_points, frac2_points, mm_per_px=mm_per_px)
     
-        for applicator in ["applicator_tandem", "left_ovoid", "right_ovoid"]:
-            if applicator not in frac1_points or applicator not in frac2_points:
+        for applicator, (tip, base, _) in zip(LandmarkSet.APPLICATORS, geometry):
+            if not (tip["valid"] and base["valid"]):
                 continue
-            
-            tip1 = frac1_points[applicator].get("tip")
-            base1 = frac1_points[applicator].get("base")
-            tip2 = frac2_points[applicator].get("tip") 
-            base2 = frac2_points[applicator].get("base")
         
-            if not all([tip1, base1, tip2, base2]):
-                continue
-        
-            
-            tip_shift_px = self.euclidean_distance(tip1, tip2)
-            base_shift_px = self.euclidean_distance(base1, base2)
-        
-            tip_shift_mm = tip_shift_px * mm_per_px
-            base_shift_mm = base_shift_px * mm_per_px
+            tip_shift_mm = float(tip["direct_shift_mm"])
+            base_shift_mm = float(base["direct_shift_mm"])
         
             applicator_name = applicator.replace('applicator_', '').replace('_', ' ').title()
         
@@ -1716,112 +4598,62 @@ class BrachyApp:
     
         output_file = os.path.join(self.temp_dir, "direct_applicator_shifts.txt")
     
-        try:
-            with open(output_file, "w", encoding="utf-8") as f:
-                f.write("DIRECT APPLICATOR SHIFTS BETWEEN FRACTIONS\n")
-                f.write("=" * 50 + "\n\n")
-                f.write(f"Calculation performed: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-            
-                for applicator, data in shifts.items():
-                    f.write(f"{applicator}:\n")
-                    f.write(f"  Tip shifted: {data['tip_shift_mm']:.2f} mm\n")
-                    f.write(f"  Base shifted: {data['base_shift_mm']:.2f} mm\n")
-                    f.write(f"  Average shift: {data['average_shift_mm']:.2f} mm\n\n")
+        lines = ["DIRECT APPLICATOR SHIFTS BETWEEN FRACTIONS\n",
+                 "=" * 50 + "\n\n",
+                 f"Calculation performed: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"]
+        for applicator, data in shifts.items():
+            lines.append(f"{applicator}:\n")
+            lines.append(f"  Tip shifted: {data['tip_shift_mm']:.2f} mm\n")
+            lines.append(f"  Base shifted: {data['base_shift_mm']:.2f} mm\n")
+            lines.append(f"  Average shift: {data['average_shift_mm']:.2f} mm\n\n")
         
-            messagebox.showinfo("Success", f"Results saved to:\n{output_file}")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to save results: {str(e)}")
+        self.file_writer.write_text(
+            output_file, "".join(lines), description="shift results",
+            on_done=lambda description: messagebox.showinfo("Success", f"Results saved to:\n{output_file}"),
+            on_error=lambda description, e: messagebox.showerror("Error", f"Failed to save results: {str(e)}"))
 
     
-    def save_masks_at_original_resolution(self, image_path, annotations, output_dir):
-     
-        
-        import cv2
-        import numpy as np
-        import os
-    
-        
-        original_img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-        if original_img is None:
-            print(f"Could not load original image: {image_path}")
-            return
-    
-        original_height, original_width = original_img.shape
-    
-        
-        screen_w, screen_h = 1400, 900 
-        scale = min(screen_w / original_width, screen_h / original_height, 1.0)
-        display_width = int(original_width * scale)
-        display_height = int(original_height * scale)
-    
-        
-        scale_x = original_width / display_width
-        scale_y = original_height / display_height
-    
-        
-        color_map = {
-            "anatomy": 1,
-            "applicator_tandem": 2,
-            "left_ovoid": 3,
-            "right_ovoid": 4
-        }
-    
-        
-        combined_mask = np.zeros((original_height, original_width), dtype=np.uint8)
-        
-        for structure_type, polygons in annotations.items():
-            if structure_type not in color_map:
+    def save_masks_at_original_resolution(self, image_path, annotations, output_dir, display_scale=None):
+        """Rasterize each structure at original resolution, saved run-length encoded in the background"""
+        try:
+            original_height, original_width = image_shape_from_header(image_path)
+        except Exception as e:
+            print(f"Could not read image size: {image_path} ({e})")
+            return None
+
+        if display_scale is None:
+            screen_w, screen_h = 1400, 900
+            display_scale = min(screen_w / original_width, screen_h / original_height, 1.0)
+        display_width = int(original_width * display_scale)
+        display_height = int(original_height * display_scale)
+
+        scale_xy = (original_width / display_width, original_height / display_height)
+        shape = (original_height, original_width)
+        masks = rasterize_structure_masks(annotations, shape, scale_xy)
+
+        base_name = os.path.basename(image_path).split('.')[0]
+        mask_path = os.path.join(output_dir, base_name + RunLengthMaskSet.SUFFIX)
+        self.file_writer.submit(RunLengthMaskSet.write_masks, masks, shape, mask_path,
+                                description=f"masks for {base_name}")
+        print(f"Masks queued for: {mask_path}")
+        return masks
+
+    def export_masks_to_png(self, output_dir=None):
+        """Expand every run-length mask file in the workspace to the per-structure/combined PNGs"""
+        output_dir = output_dir or self.temp_dir
+        exported = []
+        self.file_writer.wait()
+        for mask_path in glob.glob(os.path.join(self.temp_dir, "*" + RunLengthMaskSet.SUFFIX)):
+            base_name = os.path.basename(mask_path)[:-len(RunLengthMaskSet.SUFFIX)]
+            combined_path = os.path.join(output_dir, f"{base_name}_combined_mask.png")
+            if os.path.exists(combined_path) and os.path.getmtime(combined_path) >= os.path.getmtime(mask_path):
                 continue
-            
-            
-            individual_mask = np.zeros((original_height, original_width), dtype=np.uint8)
-        
-            for polygon in polygons:
-                
-                original_points = []
-                for point in polygon:
-                    if isinstance(point, list) and len(point) == 2:
-                       
-                        x_display, y_display = point
-                        x_original = int(x_display * scale_x)
-                        y_original = int(y_display * scale_y)
-                        original_points.append([x_original, y_original])
-                    elif isinstance(point, dict) and "tip" in point and "base" in point:
-                        
-                        tip = point["tip"]
-                        base = point["base"]
-                        if tip and base:
-                            x_tip_orig = int(tip[0] * scale_x)
-                            y_tip_orig = int(tip[1] * scale_y)
-                            x_base_orig = int(base[0] * scale_x)
-                            y_base_orig = int(base[1] * scale_y)
-                         
-                            cv2.line(individual_mask, 
-                                    (x_tip_orig, y_tip_orig), 
-                                    (x_base_orig, y_base_orig), 
-                                    color_map[structure_type], 3)
-                           
-                            cv2.circle(individual_mask, (x_tip_orig, y_tip_orig), 5, color_map[structure_type], -1)
-                            cv2.circle(individual_mask, (x_base_orig, y_base_orig), 5, color_map[structure_type], -1)
-            
-               
-                if original_points and len(original_points) >= 2:
-                    points_array = np.array(original_points, dtype=np.int32)
-                    cv2.fillPoly(individual_mask, [points_array], color_map[structure_type])
-        
-           
-            mask_filename = f"{os.path.basename(image_path).split('.')[0]}_{structure_type}_mask.png"
-            mask_path = os.path.join(output_dir, mask_filename)
-            cv2.imwrite(mask_path, individual_mask * 63)  
-        
-          
-            combined_mask[individual_mask > 0] = color_map[structure_type]
-    
-        
-        combined_mask_path = os.path.join(output_dir, f"{os.path.basename(image_path).split('.')[0]}_combined_mask.png")
-        cv2.imwrite(combined_mask_path, combined_mask * 63)  
-    
-        print(f"Masks saved to: {output_dir}")
+            try:
+                RunLengthMaskSet.load(mask_path).export_pngs(output_dir, base_name)
+                exported.append(combined_path)
+            except Exception as e:
+                print(f"❌ Could not export masks from {mask_path}: {e}")
+        return exported
 
   
     def save_explicit_points(self, polygons, file_path):
@@ -1908,6 +4740,8 @@ class BrachyApp:
 
     def show_ap_images(self):
        
+        # Edited images are written from this window on; an unassigned session can only move while empty
+        self.bind_workspace_to_patient()
         screen_info = self.get_screen_info()
         
        
@@ -2246,6 +5080,9 @@ class BrachyApp:
                               align_win.destroy()
                               return
 
+                          # A stored transform that still matches both images refreshes the mapped annotations and masks
+                          self.apply_saved_alignment("AP", 1, 2)
+
                           img_h, img_w = img.shape[:2]
                           screen_w, screen_h = align_win.winfo_screenwidth(), align_win.winfo_screenheight()
                           scale = min(screen_w / img_w, screen_h / img_h, 1.0)
@@ -2317,6 +5154,28 @@ class BrachyApp:
                          
                           anatomy_offset = {"x": 0, "y": 0}
 
+                          anatomy_index = {"index": None, "source": None}
+                          anatomy_items = {"lines": {}, "vertices": {}}
+
+                          def get_anatomy_index():
+                              # Rebuilt only when a new anatomy list is imported or registered
+                              if anatomy_index["source"] is not imported_anatomy_current:
+                                  anatomy_index["index"] = PolylineGridIndex(imported_anatomy_current)
+                                  anatomy_index["source"] = imported_anatomy_current
+                              return anatomy_index["index"]
+
+                          def fraction1_display_scale():
+                              try:
+                                  with PILImage.open(os.path.join(self.temp_dir, "AP_frac1_edited.png")) as frac1_img:
+                                      frac1_w, frac1_h = frac1_img.size
+                                  return min(screen_w / frac1_w, screen_h / frac1_h, 1.0)
+                              except Exception:
+                                  return scale
+
+                          def placed_anatomy():
+                              return [[(int(round(x + anatomy_offset["x"])), int(round(y + anatomy_offset["y"]))) for x, y in poly]
+                                      for poly in imported_anatomy_current]
+
                           
                           alignment_saved = False
                           
@@ -2347,14 +5206,18 @@ class BrachyApp:
                               canvas.image = img_tk_scaled
 
                               
-                              for poly in imported_anatomy_current:
+                              anatomy_items["lines"].clear()
+                              anatomy_items["vertices"].clear()
+                              for p, poly in enumerate(imported_anatomy_current):
                                   scaled_poly = [(int((x + anatomy_offset["x"]) * zoom[0]), int((y + anatomy_offset["y"]) * zoom[0])) for x, y in poly]
                                   if len(scaled_poly) > 1:
                                       item = canvas.create_line(scaled_poly, fill=color_map["anatomy"], width=2, tags="imported_anatomy")
                                       canvas_items["anatomy"].append(item)
-                                  for x, y in scaled_poly:
+                                      anatomy_items["lines"][p] = item
+                                  for v, (x, y) in enumerate(scaled_poly):
                                       item = canvas.create_oval(x-3, y-3, x+3, y+3, fill='yellow', tags="imported_anatomy")
                                       canvas_items["anatomy"].append(item)
+                                      anatomy_items["vertices"][(p, v)] = item
 
                            
                               for label in ["applicator_tandem", "left_ovoid", "right_ovoid"]:
@@ -2389,6 +5252,18 @@ class BrachyApp:
                                       canvas_items[label]["line"] = item
 
                           
+                          snap_map = FeatureSnapMap.for_image(img_resized)
+                          snap_enabled = [False]
+
+                          def toggle_snap():
+                              snap_enabled[0] = not snap_enabled[0]
+                              if not snap_enabled[0]:
+                                  status_var.set("Snap to edges OFF - points are placed exactly where you click")
+                              elif snap_map.ready.is_set():
+                                  status_var.set("Snap to edges ON - clicks snap to the strongest nearby edge or end point")
+                              else:
+                                  status_var.set("Snap to edges ON - edge map still building, clicks are unsnapped until it is ready")
+
                           def on_click(event):
                               
                               if not in_annotation_mode or not alignment_saved:
@@ -2396,6 +5271,8 @@ class BrachyApp:
                                   return
         
                               x, y = int(event.x / zoom[0]), int(event.y / zoom[0])
+                              if snap_enabled[0]:
+                                  x, y = snap_map.snap(x, y)
             
                               current_mode = mode.get()
                               print(f"Click at ({x}, {y}) - Mode: {current_mode}, Point Type: {point_type.get()}")
@@ -2438,39 +5315,65 @@ class BrachyApp:
                               status_var.set(status_text)
                                     
                          
-                          drag_data = {"x": 0, "y": 0, "item": None}
+                          drag_data = {"x": 0, "y": 0, "item": None, "vertex": None}
 
                           def start_move(event):
-                          
-                              if alignment_saved:
+                              # Plain drag moves the whole anatomy; Shift+drag edits the nearest vertex
+                              if alignment_saved or not imported_anatomy_current:
+                                  return
+
+                              index = get_anatomy_index()
+                              ax = event.x / zoom[0] - anatomy_offset["x"]
+                              ay = event.y / zoom[0] - anatomy_offset["y"]
+                              tolerance = 10 / zoom[0]
+
+                              if event.state & 0x0001:
+                                  hit = index.nearest_vertex(ax, ay, tolerance)
+                                  if hit is not None:
+                                      drag_data["vertex"] = hit[:2]
+                                      drag_data["item"] = anatomy_items["vertices"].get(hit[:2])
+                                      drag_data["x"] = event.x
+                                      drag_data["y"] = event.y
                                   return
-                          
-                             
-                              items = canvas.find_withtag("imported_anatomy")
-                              for item in items:
-                                  if canvas.type(item) == 'line':
-                                      coords = canvas.coords(item)
-                                      x_vals = coords[::2]
-                                      y_vals = coords[1::2]
-                                      if min(x_vals) - 10 <= event.x <= max(x_vals) + 10 and min(y_vals) - 10 <= event.y <= max(y_vals) + 10:
-                                          drag_data["item"] = item
-                                          drag_data["x"] = event.x
-                                          drag_data["y"] = event.y
-                                          break
+
+                              hit = index.hit_test(ax, ay, tolerance)
+                              if hit is not None:
+                                  drag_data["item"] = anatomy_items["lines"].get(hit[0]) or "imported_anatomy"
+                                  drag_data["x"] = event.x
+                                  drag_data["y"] = event.y
+
+                          def move_anatomy_vertex(event):
+                              p, v = drag_data["vertex"]
+                              x = event.x / zoom[0] - anatomy_offset["x"]
+                              y = event.y / zoom[0] - anatomy_offset["y"]
+                              get_anatomy_index().move_vertex(p, v, x, y)
+                              poly = list(imported_anatomy_current[p])
+                              poly[v] = (int(round(x)), int(round(y)))
+                              imported_anatomy_current[p] = poly
+
+                              cx, cy = event.x, event.y
+                              if drag_data["item"] is not None:
+                                  canvas.coords(drag_data["item"], cx - 3, cy - 3, cx + 3, cy + 3)
+                              line_item = anatomy_items["lines"].get(p)
+                              if line_item is not None:
+                                  scaled_poly = [(int((px + anatomy_offset["x"]) * zoom[0]), int((py + anatomy_offset["y"]) * zoom[0])) for px, py in poly]
+                                  canvas.coords(line_item, *[c for pt in scaled_poly for c in pt])
 
                           def on_move(event):
-                              
-                              if alignment_saved or drag_data["item"] is None:
+                              if alignment_saved:
                                   return
-        
+                              if drag_data["vertex"] is not None:
+                                  move_anatomy_vertex(event)
+                                  return
+                              if drag_data["item"] is None:
+                                  return
+
                               dx = event.x - drag_data["x"]
                               dy = event.y - drag_data["y"]
 
-                          
                               anatomy_offset["x"] += dx / zoom[0]
                               anatomy_offset["y"] += dy / zoom[0]
 
-                            
                               for item in canvas.find_withtag("imported_anatomy"):
                                   canvas.move(item, dx, dy)
                               drag_data["x"] = event.x
@@ -2478,6 +5381,7 @@ class BrachyApp:
 
                           def stop_move(event):
                               drag_data["item"] = None
+                              drag_data["vertex"] = None
 
                           def undo_last_point():
                            
@@ -2521,6 +5425,8 @@ class BrachyApp:
                           def import_fraction1_anatomy():
                               nonlocal imported_anatomy_original, imported_anatomy_current
                               path = os.path.join(self.temp_dir, "AP_frac1_annotations.json")
+                              # Annotation and transform saves may still be queued on the writer thread
+                              self.file_writer.wait()
                               if not os.path.exists(path):
                                   print("Fraction 1 anatomy annotations not found")
                                   status_var.set("Error: Fraction 1 anatomy annotations not found")
@@ -2531,19 +5437,67 @@ class BrachyApp:
 
                               if "anatomy" in all_polygons:
                                   imported_anatomy_original = all_polygons["anatomy"]
-                                  imported_anatomy_current = all_polygons["anatomy"].copy()  
+                                  saved = AlignmentTransformStore(self.temp_dir).load(
+                                      "AP", 1, 2, os.path.join(self.temp_dir, "AP_frac1_edited.png"), img)
+                                  if saved is not None:
+                                      imported_anatomy_current = transform_polylines(
+                                          imported_anatomy_original,
+                                          AlignmentTransformStore.display_matrix(saved, fraction1_display_scale(), scale))
+                                      print(f"✅ Restored saved AP alignment from {saved['saved']}")
+                                  else:
+                                      imported_anatomy_current = all_polygons["anatomy"].copy()
                               
                                   anatomy_offset["x"] = 0
                                   anatomy_offset["y"] = 0
                                   redraw_canvas()
                                   print("Imported Fraction 1 anatomy")
-                                  status_var.set("Anatomy imported. Drag to position, then click 'Save Alignment' when done.")
+                                  status_var.set("Anatomy imported. Drag to position (Shift+drag moves a single point), then click 'Save Alignment' when done.")
+                                  if saved is not None:
+                                      status_var.set("Saved alignment restored for these images. Check it, adjust if needed, then click 'Save Alignment'.")
+
+                          def auto_register_anatomy(motion="rigid"):
+                              nonlocal imported_anatomy_current
+                              if alignment_saved:
+                                  status_var.set("Alignment already saved - auto registration is disabled")
+                                  return
+                              if not imported_anatomy_original:
+                                  import_fraction1_anatomy()
+                                  if not imported_anatomy_original:
+                                      return
+
+                              frac1_path = os.path.join(self.temp_dir, "AP_frac1_edited.png")
+                              frac1_img = cv2.imread(frac1_path, cv2.IMREAD_GRAYSCALE)
+                              if frac1_img is None:
+                                  messagebox.showerror("Error", "Fraction 1 edited image not found. Please annotate Fraction 1 first.")
+                                  return
+
+                              status_var.set("Registering Fraction 1 to Fraction 2...")
+                              align_win.update_idletasks()
+                              try:
+                                  matrix, score = estimate_fraction_registration(frac1_img, get_img(), motion=motion)
+                              except Exception as e:
+                                  messagebox.showerror("Error", f"Automatic registration failed: {str(e)}")
+                                  print(f"❌ Auto registration failed: {e}")
+                                  return
+
+                              frac1_h, frac1_w = frac1_img.shape[:2]
+                              frac1_scale = min(screen_w / frac1_w, screen_h / frac1_h, 1.0)
+                              display_matrix = registration_to_display(matrix, frac1_scale, scale)
+                              imported_anatomy_current = transform_polylines(imported_anatomy_original, display_matrix)
+                              anatomy_offset["x"] = 0
+                              anatomy_offset["y"] = 0
+                              redraw_canvas()
+
+                              angle = math.degrees(math.atan2(matrix[1, 0], matrix[0, 0]))
+                              print(f"✅ Auto registration ({motion}): angle {angle:.2f}°, "
+                                    f"shift ({matrix[0, 2]:.1f}, {matrix[1, 2]:.1f}) px, ECC {score:.3f}")
+                              status_var.set(f"Auto registration applied (ECC {score:.3f}). Check the overlay, drag to fine-tune, then click 'Save Alignment'.")
 
                           def save_alignment():
                               nonlocal alignment_saved, in_annotation_mode
                              
                               polygons = {
-                                  "anatomy": imported_anatomy_current,  
+                                  "anatomy": placed_anatomy(),  
                                   "applicator_tandem": [],
                                   "left_ovoid": [],
                                   "right_ovoid": []
@@ -2558,18 +5512,16 @@ class BrachyApp:
                                       polygons[label].append([tip, base])
 
                               json_path = os.path.join(self.temp_dir, "AP_frac1_aligned_to_frac2.json")
-                              with open(json_path, 'w') as f:
-                                  json.dump(polygons, f)
+                              self.file_writer.write_json(json_path, polygons)
 
                              
                               explicit_path = os.path.join(self.temp_dir, "AP_frac1_aligned_to_frac2_explicit_points.json")
-                              with open(explicit_path, 'w') as f:
-                                  json.dump(explicit_points, f)
+                              self.file_writer.write_json(explicit_path, explicit_points)
 
                              
                               edited_img_path = os.path.join(self.temp_dir, "AP_frac2_edited.png")
-                              if os.path.exists(edited_img_path):
-                                  self.save_masks_at_original_resolution(edited_img_path, polygons, self.temp_dir)
+                              cv2.imwrite(edited_img_path, img)
+                              self.save_masks_at_original_resolution(edited_img_path, polygons, self.temp_dir, display_scale=scale)
 
                               
                               alignment_saved = True
@@ -2583,6 +5535,15 @@ class BrachyApp:
                               
                               canvas.bind("<Button-1>", on_click)
 
+                              if imported_anatomy_original:
+                                  transform = register_anatomy_polylines(placed_anatomy(), imported_anatomy_original, allow_scale=True)
+                                  # Fingerprinting hashes both images, so the store write runs on the writer thread
+                                  self.file_writer.submit(
+                                      AlignmentTransformStore(self.temp_dir).save,
+                                      "AP", 1, 2, transform["matrix"], os.path.join(self.temp_dir, "AP_frac1_edited.png"), edited_img_path,
+                                      fraction1_display_scale(), scale,
+                                      description=f"AP fraction 1 -> 2 transform (residual {transform['rms']:.2f} px)")
+
                               print(f"Alignment saved to {json_path}")
                               status_var.set("Alignment saved! Anatomy is now fixed. Select an applicator button to start annotation.")
 
@@ -2630,56 +5591,21 @@ class BrachyApp:
                                   messagebox.showerror("Error", "Anatomy line is incomplete. Please ensure anatomy has at least 2 points.")
                                   return
 
-                              anatomy_poly = imported_anatomy_current[0]
-                              anatomy_start = anatomy_poly[0]
-                              anatomy_end = anatomy_poly[-1]
-
-                              mm_per_px = self.pixel_spacing["AP_frac1"] 
-
-                              
-                              dist_results = []
-                              dist_results.append("=== AP View - Fraction 2 ===")
-                              dist_results.append(f"Anatomy start point: {anatomy_start}")
-                              dist_results.append(f"Anatomy end point: {anatomy_end}")
-                              dist_results.append("")
-
-                              structures = {
-                                  "applicator_tandem": "Tandem Applicator",
-                                  "left_ovoid": "Left Ovoid", 
-                                  "right_ovoid": "Right Ovoid"
-                              }
-
-                              for applicator_key, applicator_name in structures.items():
-                                  tip = explicit_points[applicator_key]["tip"]
-                                  base = explicit_points[applicator_key]["base"]
-
-                                  if not tip or not base:
-                                      
-                                      dist_results.append(f"{applicator_name} Tip to Anatomy Start: ")
-                                      dist_results.append(f"{applicator_name} Base to Anatomy Start: ")
-                                      dist_results.append(f"{applicator_name} Tip to Anatomy End: ")
-                                      dist_results.append(f"{applicator_name} Base to Anatomy End: ")
-                                      continue
+                              # The placed anatomy already carries the registration (including any scale),
+                              # so its first and last vertices are the fraction-2 references
+                              placed = placed_anatomy()
+                              anatomy_start, anatomy_end = placed[0][0], placed[0][-1]
 
-                                  # Calculate distances
-                                  tip_to_start = self.euclidean_distance(tip, anatomy_start) * mm_per_px
-                                  base_to_start = self.euclidean_distance(base, anatomy_start) * mm_per_px
-                                  tip_to_end = self.euclidean_distance(tip, anatomy_end) * mm_per_px
-                                  base_to_end = self.euclidean_distance(base, anatomy_end) * mm_per_px
+                              mm_per_px = self.object_mm_per_px("AP_frac1") 
 
-                                  dist_results.append(f"{applicator_name} Tip to Anatomy Start: {tip_to_start:.2f} mm")
-                                  dist_results.append(f"{applicator_name} Base to Anatomy Start: {base_to_start:.2f} mm")
-                                  dist_results.append(f"{applicator_name} Tip to Anatomy End: {tip_to_end:.2f} mm")
-                                  dist_results.append(f"{applicator_name} Base to Anatomy End: {base_to_end:.2f} mm")
+                              record = MeasurementStore.measure("AP", 2, anatomy_start, anatomy_end, explicit_points, mm_per_px,
+                                                               zoom=zoom[0])
 
-                            
                               txt_filename = "AP_frac2_distances_from_anatomy.txt"
                               txt_path = os.path.join(self.temp_dir, txt_filename)
 
                               try:
-                                  with open(txt_path, "w", encoding="utf-8") as f:
-                                      for line in dist_results:
-                                          f.write(line + "\n")
+                                  self.measurement_store().save(record, txt_path, writer=self.file_writer)
 
                                  
                                   messagebox.showinfo("Success", 
@@ -2690,7 +5616,7 @@ class BrachyApp:
 
                                   
                                   print(f"✅ DISTANCES SAVED: {txt_path}")
-                                  for line in dist_results:
+                                  for line in MeasurementStore.render_text(record):
                                       print(f"   {line}")
 
                                  
@@ -2749,6 +5675,8 @@ class BrachyApp:
                           sections = [
                               ("Movement & Import Tools", [
                                   ("📥 Import Fraction 1 Anatomy", import_fraction1_anatomy),
+                                  ("🎯 Auto Register Anatomy (Rigid)", lambda: auto_register_anatomy("rigid")),
+                                  ("🎯 Auto Register Anatomy (Similarity)", lambda: auto_register_anatomy("similarity")),
                                   ("💾 Save Alignment Position", save_alignment)
                               ]),
                               ("Annotation Mode Selection", [
@@ -2769,6 +5697,9 @@ class BrachyApp:
                                   ("🔍 Zoom Out Image View", zoom_out),
                                   ("🔄 Reset Zoom Level", reset_zoom)
                               ]),
+                              ("Placement Assist", [
+                                  ("🧲 Toggle Snap to Edges", toggle_snap)
+                              ]),
                               ("Session Tools", [
                                   ("💾 Save & End Session", save_and_end_session)
                               ])
@@ -2860,67 +5791,30 @@ class BrachyApp:
 
         
 
-
-    def compare_fraction_distances_direct_euclidean(self):
-        
-        import os
-        import re
-        from datetime import datetime
-    
-   
-        file1 = os.path.join(self.temp_dir, "AP_frac1_distances_from_anatomy.txt")
-        file2 = os.path.join(self.temp_dir, "AP_frac2_distances_from_anatomy.txt")
-    
-    
-        if not os.path.exists(file1) or not os.path.exists(file2):
-            messagebox.showerror("Error", 
-                               "Cannot perform comparison. Missing distance files.\n\n"
-                               f"Fraction 1: {'Found' if os.path.exists(file1) else 'Missing'}\n"
-                               f"Fraction 2: {'Found' if os.path.exists(file2) else 'Missing'}\n\n"
-                               "Please complete annotation for both fractions first.")
-            return
-    
-        def extract_structured_distances(file_path):
-         
-            distances = {}
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    current_applicator = None
-                    for line in f:
-                        line = line.strip()
-                    
-                      
-                        if not line or "===" in line or "Anatomy" in line:
-                            continue
-                        
-                 
-                        match = re.match(r"(.+?)\s+(Tip|Base)\s+to\s+Anatomy\s+(Start|End):\s*([\d.]+)\s*mm", line)
-                        if match:
-                            applicator = match.group(1).strip()
-                            point_type = match.group(2).lower()  # tip or base
-                            anatomy_point = match.group(3).lower()  # start or end
-                            value = float(match.group(4))
-                        
-                          
-                            if applicator not in distances:
-                                distances[applicator] = {}
-                        
-                        
-                            key = f"{point_type}_to_{anatomy_point}"
-                            distances[applicator][key] = value
-                        
-            except Exception as e:
-                print(f"Error reading file {file_path}: {e}")
-            return distances
+
+    def compare_fraction_distances_direct_euclidean(self):
+        
+        import os
+        from datetime import datetime
+    
+   
+        file1 = os.path.join(self.temp_dir, "AP_frac1_distances_from_anatomy.txt")
+        file2 = os.path.join(self.temp_dir, "AP_frac2_distances_from_anatomy.txt")
+        store = self.measurement_store()
+        dist1 = store.distances("AP", 1)
+        dist2 = store.distances("AP", 2)
     
-       
-        dist1 = extract_structured_distances(file1)
-        dist2 = extract_structured_distances(file2)
     
         if not dist1 or not dist2:
-            messagebox.showerror("Error", "No valid distance data found in one or both files")
+            messagebox.showerror("Error", 
+                               "Cannot perform comparison. Missing distance measurements.\n\n"
+                               f"Fraction 1: {'Found' if dist1 else 'Missing'}\n"
+                               f"Fraction 2: {'Found' if dist2 else 'Missing'}\n\n"
+                               "Please complete annotation for both fractions first.")
             return
     
+    
+    
        
         shifts = {}
     
@@ -3131,6 +6025,47 @@ class BrachyApp:
         except Exception as e:
             messagebox.showerror("Error", f"Failed to save report: {str(e)}")
 
+    def apply_saved_alignment(self, view="AP", source_fraction=1, target_fraction=2):
+        """Map a fraction's annotations onto another fraction with the stored transform, no UI.
+
+        The result goes to <view>_frac<s>_mapped_to_frac<t>.json, in the target
+        fraction's annotation pixels. It carries the source fraction's applicators
+        moved by the registration only, so it must never stand in for the target
+        fraction's placed applicator points. The source structures are also
+        rasterized at full resolution and warped onto the target image as a
+        run-length mask set.
+        """
+        folder = self.temp_dir if view == "AP" else os.path.join(self.temp_dir, view)
+        source_json = os.path.join(folder, f"{view}_frac{source_fraction}_annotations.json")
+        source_image = os.path.join(folder, f"{view}_frac{source_fraction}_edited.png")
+        target_image = os.path.join(folder, f"{view}_frac{target_fraction}_edited.png")
+        self.file_writer.wait()
+        if not os.path.exists(source_json):
+            return None
+
+        record = AlignmentTransformStore(self.temp_dir).load(
+            view, source_fraction, target_fraction, source_image, target_image)
+        if record is None:
+            return None
+
+        annotations = self.annotations.load(source_json)
+        aligned = AlignmentTransformStore.apply_to_annotations(annotations, record["matrix"])
+
+        base_name = f"{view}_frac{source_fraction}_mapped_to_frac{target_fraction}"
+        aligned_json = os.path.join(folder, base_name + ".json")
+        self.file_writer.write_json(aligned_json, aligned)
+
+        source_shape = image_shape_from_header(source_image)
+        target_shape = image_shape_from_header(target_image)
+        masks = rasterize_structure_masks(annotations, source_shape, (1.0 / record["source_scale"],) * 2)
+        warped = AlignmentTransformStore.apply_to_masks(
+            masks, AlignmentTransformStore.full_resolution_matrix(record), target_shape)
+        self.file_writer.submit(RunLengthMaskSet.write_masks, warped, target_shape,
+                                os.path.join(self.temp_dir, base_name + RunLengthMaskSet.SUFFIX),
+                                description=f"masks for {base_name}")
+        print(f"✅ Applied stored {view} alignment: {aligned_json}")
+        return aligned
+
     def update_frac2_from_alignment(self):
     
         try:
@@ -3183,8 +6118,9 @@ class BrachyApp:
     def check_annotation_completeness(self, file_path):
         
         try:
-            with open(file_path, 'r') as f:
-                data = json.load(f)
+            data = self.annotations.load(file_path)
+            if data is None:
+                raise FileNotFoundError(file_path)
         
             filename = os.path.basename(file_path)
             print(f"Checking completeness of {filename}:")
@@ -3219,94 +6155,52 @@ class BrachyApp:
     def calculate_anatomy_referenced_shifts(self):
        
         import os
-        import json
 
        
-        frac1_points = self.load_applicator_points("AP_frac1_annotations.json")
+        frac1_points = self.load_applicator_points("AP_frac1_annotations.json", "AP", 1)
         if not frac1_points:
             messagebox.showerror("Error", "Could not load Fraction 1 applicator points")
             return None
 
        
-        frac2_file_options = [
-            "AP_frac1_aligned_to_frac2.json",  
-            "AP_frac2_annotations.json"        
-        ]
-
-        frac2_points = None
-        for file_option in frac2_file_options:
-            points = self.load_applicator_points(file_option)
-            if points:
-                frac2_points = points
-                print(f"✅ Loaded Fraction 2 points from: {file_option}")
-                break
-
+        # Only the applicators placed on fraction 2 measure displacement
+        frac2_points = self.load_applicator_points("AP_frac2_annotations.json", "AP", 2)
         if not frac2_points:
-            messagebox.showerror("Error", "Could not load Fraction 2 applicator points from any file")
+            messagebox.showerror("Error", "Could not load Fraction 2 applicator points from AP_frac2_annotations.json")
             return None
 
-        
-        frac1_anatomy = self.load_anatomy_points("AP_frac1_annotations.json")
-        frac2_anatomy = self.load_anatomy_points(frac2_file_options[0] if frac2_points else None)
-
-        mm_per_px = self.pixel_spacing["AP_frac1"]
+        # Anatomy as aligned on the fraction 2 image, else as stored with the fraction 2 annotations
+        frac2_anatomy_file = "AP_frac1_aligned_to_frac2.json"
+        if not os.path.exists(os.path.join(self.temp_dir, frac2_anatomy_file)):
+            frac2_anatomy_file = "AP_frac2_annotations.json"
+        frac1_anatomy = self.load_anatomy_polylines("AP_frac1_annotations.json")
+        frac2_anatomy = self.load_anatomy_polylines(frac2_anatomy_file)
+
+        # Whole-anatomy registration puts fraction 2 in the fraction 1 anatomical frame
+        anatomy_matrix = None
+        if frac1_anatomy and frac2_anatomy:
+            registration = self.anatomy_registration("AP_frac1_annotations.json", frac2_anatomy_file)
+            anatomy_matrix = registration["matrix"]
+            print(f"Anatomy registration residual: {registration['rms']:.2f} px")
+
+        mm_per_px = self.object_mm_per_px("AP_frac1")
+        frame_differences = self.calculate_anatomy_frame_differences(mm_per_px)
+        # Without a registration the anatomy-referenced shift equals the direct one
+        geometry = landmark_geometry(frac1_points, frac2_points, mm_per_px=mm_per_px, matrix=anatomy_matrix)
         shifts = {}
 
-        def get_applicator_points(data, applicator):
-         
-            if isinstance(data, dict):
-                
-                if applicator in data and isinstance(data[applicator], dict):
-                    return data[applicator].get("tip"), data[applicator].get("base")
-            elif isinstance(data, list):
-                
-                for item in data:
-                    if isinstance(item, dict) and applicator in item:
-                        if isinstance(item[applicator], dict):
-                            return item[applicator].get("tip"), item[applicator].get("base")
-                        elif isinstance(item[applicator], list) and len(item[applicator]) > 0:
-                         
-                            points_list = item[applicator][0]
-                            if len(points_list) >= 2:
-                                return points_list[0], points_list[1]
-            return None, None
-
-        for applicator in ["applicator_tandem", "left_ovoid", "right_ovoid"]:
-            
-            tip1, base1 = get_applicator_points(frac1_points, applicator)
-            tip2, base2 = get_applicator_points(frac2_points, applicator)
-
-            if not all([tip1, base1, tip2, base2]):
-                print(f"Skipping {applicator} - missing points: tip1={tip1 is not None}, base1={base1 is not None}, tip2={tip2 is not None}, base2={base2 is not None}")
+        for applicator, (tip, base, _) in zip(LandmarkSet.APPLICATORS, geometry):
+            if not (tip["valid"] and base["valid"]):
+                print(f"Skipping {applicator} - missing points: tip1={frac1_points[applicator].tip is not None}, base1={frac1_points[applicator].base is not None}, tip2={frac2_points[applicator].tip is not None}, base2={frac2_points[applicator].base is not None}")
                 continue
 
-            
-            direct_tip_shift = self.euclidean_distance(tip1, tip2) * mm_per_px
-            direct_base_shift = self.euclidean_distance(base1, base2) * mm_per_px
-
-            
-            anatomy_referenced_tip_shift = direct_tip_shift
-            anatomy_referenced_base_shift = direct_base_shift
-
-            if frac1_anatomy and frac2_anatomy:
-                
-                anatomy_start1 = frac1_anatomy[0] if frac1_anatomy else (0, 0)
-                anatomy_start2 = frac2_anatomy[0] if frac2_anatomy else (0, 0)
-
-             
-                tip1_relative = (tip1[0] - anatomy_start1[0], tip1[1] - anatomy_start1[1])
-                tip2_relative = (tip2[0] - anatomy_start2[0], tip2[1] - anatomy_start2[1])
-
-              
-                anatomy_referenced_tip_shift = self.euclidean_distance(tip1_relative, tip2_relative) * mm_per_px
-    
-               
-                base1_relative = (base1[0] - anatomy_start1[0], base1[1] - anatomy_start1[1])
-                base2_relative = (base2[0] - anatomy_start2[0], base2[1] - anatomy_start2[1])
-
-                anatomy_referenced_base_shift = self.euclidean_distance(base1_relative, base2_relative) * mm_per_px
+            direct_tip_shift = float(tip["direct_shift_mm"])
+            direct_base_shift = float(base["direct_shift_mm"])
+            anatomy_referenced_tip_shift = float(tip["anatomy_shift_mm"])
+            anatomy_referenced_base_shift = float(base["anatomy_shift_mm"])
 
             applicator_name = applicator.replace('applicator_', '').replace('_', ' ').title()
+            frame_diffs = frame_differences.get(applicator, {})
 
             shifts[applicator_name] = {
             
@@ -3320,10 +6214,10 @@ class BrachyApp:
                 "anatomy_referenced_average_shift_mm": (anatomy_referenced_tip_shift + anatomy_referenced_base_shift) / 2,
 
           
-                "tip_to_anatomy_start_diff_mm": self.calculate_specific_distance_differences(applicator, "tip_to_start", mm_per_px),
-                "tip_to_anatomy_end_diff_mm": self.calculate_specific_distance_differences(applicator, "tip_to_end", mm_per_px),
-                "base_to_anatomy_start_diff_mm": self.calculate_specific_distance_differences(applicator, "base_to_start", mm_per_px),
-                "base_to_anatomy_end_diff_mm": self.calculate_specific_distance_differences(applicator, "base_to_end", mm_per_px)
+                "tip_to_anatomy_start_diff_mm": frame_diffs.get("tip_to_start", 0),
+                "tip_to_anatomy_end_diff_mm": frame_diffs.get("tip_to_end", 0),
+                "base_to_anatomy_start_diff_mm": frame_diffs.get("base_to_start", 0),
+                "base_to_anatomy_end_diff_mm": frame_diffs.get("base_to_end", 0)
             }
 
         return shifts
@@ -3349,59 +6243,77 @@ class BrachyApp:
 
     def calculate_specific_distance_differences(self, applicator, measurement_type, mm_per_px):
 
-        frac1_points = self.load_applicator_points("AP_frac1_annotations.json")
-        frac2_points = self.load_applicator_points("AP_frac2_annotations.json")
-        frac1_anatomy = self.load_anatomy_points("AP_frac1_annotations.json")
-        frac2_anatomy = self.load_anatomy_points("AP_frac2_annotations.json")
-    
+        differences = self.calculate_anatomy_frame_differences(mm_per_px)
+        return differences.get(applicator, {}).get(measurement_type, 0)  # F2 - F1
+
+    def calculate_anatomy_frame_differences(self, mm_per_px, frac2_json="AP_frac2_annotations.json"):
+        """Tip/base to anatomy start/end distance changes (F2 - F1) for every applicator.
+
+        Fraction 2 landmarks are first mapped into the fraction 1 anatomical frame
+        by a full-polyline registration of the two anatomy annotations.
+        """
+        frac1_points = self.load_applicator_points("AP_frac1_annotations.json", "AP", 1)
+        frac2_points = self.load_applicator_points(frac2_json, "AP", 2)
+        frac1_anatomy = self.load_anatomy_polylines("AP_frac1_annotations.json")
+        frac2_anatomy = self.load_anatomy_polylines(frac2_json)
+
         if not all([frac1_points, frac2_points, frac1_anatomy, frac2_anatomy]):
-            return 0
-    
-       
-        anatomy_start1 = frac1_anatomy[0]
-        anatomy_start2 = frac2_anatomy[0]
-        anatomy_end1 = frac1_anatomy[-1] if len(frac1_anatomy) > 1 else anatomy_start1
-        anatomy_end2 = frac2_anatomy[-1] if len(frac2_anatomy) > 1 else anatomy_start2
-    
-     
-        tip1 = frac1_points[applicator].get("tip")
-        tip2 = frac2_points[applicator].get("tip")
-        base1 = frac1_points[applicator].get("base")
-        base2 = frac2_points[applicator].get("base")
-    
-        if not all([tip1, tip2, base1, base2]):
-            return 0
-    
-       
-        if measurement_type == "tip_to_start":
-            dist1 = self.euclidean_distance(tip1, anatomy_start1) * mm_per_px
-            dist2 = self.euclidean_distance(tip2, anatomy_start2) * mm_per_px
-        elif measurement_type == "tip_to_end":
-            dist1 = self.euclidean_distance(tip1, anatomy_end1) * mm_per_px
-            dist2 = self.euclidean_distance(tip2, anatomy_end2) * mm_per_px
-        elif measurement_type == "base_to_start":
-            dist1 = self.euclidean_distance(base1, anatomy_start1) * mm_per_px
-            dist2 = self.euclidean_distance(base2, anatomy_start2) * mm_per_px
-        elif measurement_type == "base_to_end":
-            dist1 = self.euclidean_distance(base1, anatomy_end1) * mm_per_px
-            dist2 = self.euclidean_distance(base2, anatomy_end2) * mm_per_px
-        else:
-            return 0
-    
-        return dist2 - dist1  # F2 - F1
+            return {}
+
+        both = frac1_points.complete & frac2_points.complete
+        if not both.any():
+            return {}
+
+        matrix = self.anatomy_registration("AP_frac1_annotations.json", frac2_json)["matrix"]
+        geometry = landmark_geometry(frac1_points, frac2_points,
+                                     references=[frac1_anatomy[0][0], frac1_anatomy[0][-1]],
+                                     mm_per_px=mm_per_px, matrix=matrix)
+        # (applicator, tip/base/centroid, start/end)
+        diff = geometry["difference"]
+
+        return {
+            applicator: {
+                "tip_to_start": float(diff[i, 0, 0]),
+                "tip_to_end": float(diff[i, 0, 1]),
+                "base_to_start": float(diff[i, 1, 0]),
+                "base_to_end": float(diff[i, 1, 1])
+            }
+            for i, applicator in enumerate(LandmarkSet.APPLICATORS) if both[i]
+        }
+
+    def anatomy_registration(self, frac1_json, frac2_json):
+        """register_anatomy_polylines(frac1, frac2), reused until either annotation file changes"""
+        paths = [os.path.join(self.temp_dir, name) for name in (frac1_json, frac2_json)]
+
+        def compute():
+            frac1_anatomy = self.load_anatomy_polylines(frac1_json)
+            frac2_anatomy = self.load_anatomy_polylines(frac2_json)
+            if not frac1_anatomy or not frac2_anatomy:
+                return None
+            return register_anatomy_polylines(frac1_anatomy, frac2_anatomy)
+
+        return self.annotations.derived(("anatomy_registration",) + tuple(paths), paths, compute)
+
+    def load_anatomy_polylines(self, json_filename):
+        """Every anatomy polyline in an annotation file, or None"""
+        try:
+            data = self.load_annotation_json(json_filename)
+            if data is None:
+                return None
+            anatomy = [poly for poly in data.get("anatomy", []) if poly]
+            return anatomy or None
+        except Exception as e:
+            print(f"Error loading anatomy polylines: {e}")
+            return None
 
     def load_anatomy_points(self, json_filename):
        
         import os
-        import json
-    
-        json_path = os.path.join(self.temp_dir, json_filename)
-        if not os.path.exists(json_path):
-            return None
     
         try:
-            with open(json_path, 'r') as f:
-                data = json.load(f)
+            data = self.load_annotation_json(json_filename)
+            if data is None:
+                return None
         
             if "anatomy" in data and data["anatomy"]:
                 return data["anatomy"][0]  
@@ -3417,57 +6329,24 @@ class BrachyApp:
             return
         
         import os
-        import re
         from datetime import datetime
     
       
         file1 = os.path.join(self.temp_dir, "AP_frac1_distances_from_anatomy.txt")
         file2 = os.path.join(self.temp_dir, "AP_frac2_distances_from_anatomy.txt")
+        store = self.measurement_store()
+        dist1 = store.distances("AP", 1)
+        dist2 = store.distances("AP", 2)
     
     
-        if not os.path.exists(file1) or not os.path.exists(file2):
+        if not dist1 or not dist2:
             messagebox.showerror("Error", 
-                               "Missing distance files.\n\n"
-                               f"Fraction 1: {'Found' if os.path.exists(file1) else 'Missing'}\n"
-                               f"Fraction 2: {'Found' if os.path.exists(file2) else 'Missing'}")
+                               "Missing distance measurements.\n\n"
+                               f"Fraction 1: {'Found' if dist1 else 'Missing'}\n"
+                               f"Fraction 2: {'Found' if dist2 else 'Missing'}")
             return
     
-        def extract_distances(file_path):
-      
-            distances = {}
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    content = f.read()
-                
-               
-                pattern = r"(.+?)\s+(Tip|Base)\s+to\s+Anatomy\s+(Start|End):\s*([\d.]+)\s*mm"
-                matches = re.findall(pattern, content)
-            
-                for match in matches:
-                    applicator = match[0].strip()
-                    point_type = match[1].lower()  
-                    anatomy_point = match[2].lower()
-                    value = float(match[3])
-                
-                  
-                    if applicator not in distances:
-                        distances[applicator] = {}
-                
-                   
-                    key = f"{point_type}_to_{anatomy_point}"
-                    distances[applicator][key] = value
-                
-            except Exception as e:
-                print(f"Error reading file {file_path}: {e}")
-            return distances
-    
-      
-        dist1 = extract_distances(file1)
-        dist2 = extract_distances(file2)
     
-        if not dist1 or not dist2:
-            messagebox.showerror("Error", "No valid distance data found in one or both files")
-            return
     
      
         shifts = {}
@@ -3512,8 +6391,6 @@ class BrachyApp:
     def validate_comparison_files(self):
      
         required_files = [
-            "AP_frac1_distances_from_anatomy.txt",
-            "AP_frac2_distances_from_anatomy.txt",
             "AP_frac1_annotations.json", 
             "AP_frac2_annotations.json"
         ]
@@ -3523,6 +6400,11 @@ class BrachyApp:
             file_path = os.path.join(self.temp_dir, file_name)
             if not os.path.exists(file_path):
                 missing_files.append(file_name)
+
+        store = self.measurement_store()
+        for fraction in (1, 2):
+            if not store.has("AP", fraction):
+                missing_files.append(f"AP fraction {fraction} distance measurements")
     
         if missing_files:
             error_msg = "Missing required files for comparison:\n" + "\n".join(missing_files)
@@ -3958,60 +6840,23 @@ class BrachyApp:
     def compare_fraction_distances_txt_only(self):
      
         import os
-        import re
 
         
         file1 = os.path.join(self.temp_dir, "AP_frac1_distances_from_anatomy.txt")
         file2 = os.path.join(self.temp_dir, "AP_frac2_distances_from_anatomy.txt")
+        store = self.measurement_store()
+        dist1 = store.distances("AP", 1)
+        dist2 = store.distances("AP", 2)
 
         # Check if TXT files exist
-        if not os.path.exists(file1) or not os.path.exists(file2):
+        if not dist1 or not dist2:
             messagebox.showerror("Error", 
-                               "Missing distance files. Please complete annotation for both fractions first.\n\n"
-                               f"Fraction 1: {'Found' if os.path.exists(file1) else 'Missing'}\n"
-                               f"Fraction 2: {'Found' if os.path.exists(file2) else 'Missing'}")
+                               "Missing distance measurements. Please complete annotation for both fractions first.\n\n"
+                               f"Fraction 1: {'Found' if dist1 else 'Missing'}\n"
+                               f"Fraction 2: {'Found' if dist2 else 'Missing'}")
             return
 
-        def extract_structured_distances(file_path):
-           
-            distances = {}
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    current_applicator = None
-                    for line in f:
-                        line = line.strip()
-                
-                        
-                        if not line or "===" in line or "Anatomy" in line:
-                            continue
-                    
-                       
-                        match = re.match(r"(.+?)\s+(Tip|Base)\s+to\s+Anatomy\s+(Start|End):\s*([\d.]+)\s*mm", line)
-                        if match:
-                            applicator = match.group(1).strip()
-                            point_type = match.group(2).lower()  
-                            anatomy_point = match.group(3).lower()  
-                            value = float(match.group(4))
-                    
-                       
-                            if applicator not in distances:
-                                distances[applicator] = {}
-                    
-                           
-                            key = f"{point_type}_to_{anatomy_point}"
-                            distances[applicator][key] = value
-                    
-            except Exception as e:
-                print(f"Error reading TXT file {file_path}: {e}")
-            return distances
-
-       
-        dist1 = extract_structured_distances(file1)
-        dist2 = extract_structured_distances(file2)
 
-        if not dist1 or not dist2:
-            messagebox.showerror("Error", "No valid distance data found in one or both TXT files")
-            return
 
        
         shifts = {}
@@ -4360,6 +7205,7 @@ class BrachyApp:
             messagebox.showerror("Error", f"Failed to save report: {str(e)}")
 
     def open_annotation_window(self, img_path, fraction_key):
+        self.bind_workspace_to_patient()
         save_folder = self.temp_dir
         os.makedirs(save_folder, exist_ok=True)
 
@@ -4526,8 +7372,22 @@ class BrachyApp:
         
       
 
+        snap_map = FeatureSnapMap.for_image(img_resized)
+        snap_enabled = [False]
+
+        def toggle_snap():
+            snap_enabled[0] = not snap_enabled[0]
+            if not snap_enabled[0]:
+                status_var.set("Snap to edges OFF - points are placed exactly where you click")
+            elif snap_map.ready.is_set():
+                status_var.set("Snap to edges ON - clicks snap to the strongest nearby edge or end point")
+            else:
+                status_var.set("Snap to edges ON - edge map still building, clicks are unsnapped until it is ready")
+
         def on_click(event):
             x, y = int(event.x / zoom[0]), int(event.y / zoom[0])
+            if snap_enabled[0]:
+                x, y = snap_map.snap(x, y)
     
             if mode.get() == "anatomy":
                 current_points.append((x, y))
@@ -4613,8 +7473,7 @@ class BrachyApp:
 
             
             json_path = os.path.join(save_folder, f"{fraction_key}_annotations.json")
-            with open(json_path, 'w') as f:
-                json.dump(polygons, f)
+            self.file_writer.write_json(json_path, polygons)
 
             print(f"✅ SAVED ANNOTATIONS: {json_path}")
             print(f"✅ Anatomy points: {len(anatomy_points)}")
@@ -4624,8 +7483,7 @@ class BrachyApp:
 
             
             explicit_path = os.path.join(save_folder, f"{fraction_key}_explicit_points.json")
-            with open(explicit_path, 'w') as f:
-                json.dump(explicit_points, f)
+            self.file_writer.write_json(explicit_path, explicit_points)
 
             
           
@@ -4644,47 +7502,20 @@ class BrachyApp:
             anatomy_start = anatomy_poly[0]
             anatomy_end = anatomy_poly[-1]
 
-            mm_per_px = self.pixel_spacing.get("AP_frac1", 0.2979)  
+            mm_per_px = self.object_mm_per_px("AP_frac1")  
 
             
-            fraction_number = "1" if "frac1" in fraction_key else "2" if "frac2" in fraction_key else "Unknown"
-            view_type = "AP" if "AP" in fraction_key else "Lateral" if "LAT" in fraction_key else "Unknown"
-
-           
-            dist_results = []
-            dist_results.append(f"=== {view_type} View - Fraction {fraction_number} ===")
-            dist_results.append(f"Anatomy start point: {anatomy_start}")
-            dist_results.append(f"Anatomy end point: {anatomy_end}")
-            dist_results.append("")
-
-            structures = {
-                "applicator_tandem": "Tandem Applicator",
-                "left_ovoid": "Left Ovoid", 
-                "right_ovoid": "Right Ovoid"
-            }
-
-            for applicator_key, applicator_name in structures.items():
-                if applicator_key not in polygons or not polygons[applicator_key]:
-                    dist_results.append(f"{applicator_name}: Not annotated")
-                    continue
-
-                tip = explicit_points[applicator_key]["tip"]
-                base = explicit_points[applicator_key]["base"]
-
-                if not tip or not base:
-                    dist_results.append(f"{applicator_name}: Tip or base missing")
-                    continue
-
-               
-                distances = {
-                    f"{applicator_name} Tip to Anatomy Start": self.euclidean_distance(tip, anatomy_start) * mm_per_px,
-                    f"{applicator_name} Base to Anatomy Start": self.euclidean_distance(base, anatomy_start) * mm_per_px,
-                    f"{applicator_name} Tip to Anatomy End": self.euclidean_distance(tip, anatomy_end) * mm_per_px,
-                    f"{applicator_name} Base to Anatomy End": self.euclidean_distance(base, anatomy_end) * mm_per_px
-                }
+            parsed = parse_fraction_key(fraction_key)
+            if parsed is None:
+                print(f"⚠️ Cannot export distances: no fraction in {fraction_key}")
+                return
+            fraction_number = parsed[1]
+            view_type = "AP" if parsed[0] == "AP" else "Lateral"
 
-                for desc, dist in distances.items():
-                    dist_results.append(f"{desc}: {dist:.2f} mm")
+            # Only structures that were actually annotated are measured
+            measured_points = {key: explicit_points[key] for key in MeasurementStore.APPLICATORS if polygons.get(key)}
+            record = MeasurementStore.measure("LAT" if "LAT" in fraction_key else "AP", fraction_number,
+                                              anatomy_start, anatomy_end, measured_points, mm_per_px, zoom=zoom[0])
 
             
             if "LAT" in fraction_key:
@@ -4695,9 +7526,7 @@ class BrachyApp:
             txt_path = os.path.join(save_folder, txt_filename)
 
             try:
-                with open(txt_path, "w", encoding="utf-8") as f:
-                    for line in dist_results:
-                        f.write(line + "\n")
+                self.measurement_store().save(record, txt_path, writer=self.file_writer)
 
                 print(f"✅ DISTANCES EXPORTED: {txt_path}")
 
@@ -4783,6 +7612,9 @@ class BrachyApp:
                 ("🔍 Zoom Out View", zoom_out),
                 ("🔄 Reset Zoom Level", reset_zoom)
             ]),
+            ("Placement Assist", [
+                ("🧲 Toggle Snap to Edges", toggle_snap)
+            ]),
             ("Actions", [
                 ("💾 Save & Close Session", finish_and_close)
             ])
@@ -4862,6 +7694,8 @@ class BrachyApp:
                 
     def show_lat_images(self):
         """Show Lateral images editing window with navigation"""
+        # Edited images are written from this window on; an unassigned session can only move while empty
+        self.bind_workspace_to_patient()
         screen_info = self.get_screen_info()
 
       
@@ -5202,6 +8036,8 @@ class BrachyApp:
     
                          
                           img = get_img()
+                          # A stored transform that still matches both images refreshes the mapped annotations and masks
+                          self.apply_saved_alignment("LAT", 1, 2)
                           img_h, img_w = img.shape[:2]
                           screen_w, screen_h = align_win.winfo_screenwidth(), align_win.winfo_screenheight()
                           scale = min(screen_w / img_w, screen_h / img_h, 1.0)
@@ -5273,6 +8109,29 @@ class BrachyApp:
                           imported_anatomy_original = []
                           imported_anatomy_current = []
                           anatomy_offset = {"x": 0, "y": 0}
+
+                          anatomy_index = {"index": None, "source": None}
+                          anatomy_items = {"lines": {}, "vertices": {}}
+
+                          def get_anatomy_index():
+                              # Rebuilt only when a new anatomy list is imported or registered
+                              if anatomy_index["source"] is not imported_anatomy_current:
+                                  anatomy_index["index"] = PolylineGridIndex(imported_anatomy_current)
+                                  anatomy_index["source"] = imported_anatomy_current
+                              return anatomy_index["index"]
+
+                          def fraction1_display_scale():
+                              try:
+                                  with PILImage.open(os.path.join(self.temp_dir, "LAT", "LAT_frac1_edited.png")) as frac1_img:
+                                      frac1_w, frac1_h = frac1_img.size
+                                  return min(screen_w / frac1_w, screen_h / frac1_h, 1.0)
+                              except Exception:
+                                  return scale
+
+                          def placed_anatomy():
+                              return [[(int(round(x + anatomy_offset["x"])), int(round(y + anatomy_offset["y"]))) for x, y in poly]
+                                      for poly in imported_anatomy_current]
+
                           alignment_saved = False
                           in_annotation_mode = False
     
@@ -5301,14 +8160,18 @@ class BrachyApp:
                               canvas.image = img_tk_scaled
         
                            
-                              for poly in imported_anatomy_current:
+                              anatomy_items["lines"].clear()
+                              anatomy_items["vertices"].clear()
+                              for p, poly in enumerate(imported_anatomy_current):
                                   scaled_poly = [(int((x + anatomy_offset["x"]) * zoom[0]), int((y + anatomy_offset["y"]) * zoom[0])) for x, y in poly]
                                   if len(scaled_poly) > 1:
                                       item = canvas.create_line(scaled_poly, fill=color_map["anatomy"], width=2, tags="imported_anatomy")
                                       canvas_items["anatomy"].append(item)
-                                  for x, y in scaled_poly:
+                                      anatomy_items["lines"][p] = item
+                                  for v, (x, y) in enumerate(scaled_poly):
                                       item = canvas.create_oval(x-3, y-3, x+3, y+3, fill='yellow', tags="imported_anatomy")
                                       canvas_items["anatomy"].append(item)
+                                      anatomy_items["vertices"][(p, v)] = item
         
                               
                               for label in ["applicator_tandem", "left_ovoid", "right_ovoid"]:
@@ -5350,12 +8213,26 @@ class BrachyApp:
 
                 
 
+                          snap_map = FeatureSnapMap.for_image(img_resized)
+                          snap_enabled = [False]
+
+                          def toggle_snap():
+                              snap_enabled[0] = not snap_enabled[0]
+                              if not snap_enabled[0]:
+                                  status_var.set("Snap to edges OFF - points are placed exactly where you click")
+                              elif snap_map.ready.is_set():
+                                  status_var.set("Snap to edges ON - clicks snap to the strongest nearby edge or end point")
+                              else:
+                                  status_var.set("Snap to edges ON - edge map still building, clicks are unsnapped until it is ready")
+
                           def on_click(event):
                               
                               if not in_annotation_mode or not alignment_saved:
                                   return
 
                               x, y = int(event.x / zoom[0]), int(event.y / zoom[0])
+                              if snap_enabled[0]:
+                                  x, y = snap_map.snap(x, y)
         
                            
                               if mode.get() != "anatomy" and mode.get() != "none":
@@ -5383,39 +8260,65 @@ class BrachyApp:
                               status_var.set(status_text)
                                       
                          
-                          drag_data = {"x": 0, "y": 0, "item": None}
-                      
+                          drag_data = {"x": 0, "y": 0, "item": None, "vertex": None}
+
                           def start_move(event):
-                          
-                              if alignment_saved:
+                              # Plain drag moves the whole anatomy; Shift+drag edits the nearest vertex
+                              if alignment_saved or not imported_anatomy_current:
                                   return
 
-                          
-                              items = canvas.find_withtag("imported_anatomy")
-                              for item in items:
-                                  if canvas.type(item) == 'line':
-                                      coords = canvas.coords(item)
-                                      x_vals = coords[::2]
-                                      y_vals = coords[1::2]
-                                      if min(x_vals) - 10 <= event.x <= max(x_vals) + 10 and min(y_vals) - 10 <= event.y <= max(y_vals) + 10:
-                                          drag_data["item"] = item
-                                          drag_data["x"] = event.x
-                                          drag_data["y"] = event.y
-                                          break
+                              index = get_anatomy_index()
+                              ax = event.x / zoom[0] - anatomy_offset["x"]
+                              ay = event.y / zoom[0] - anatomy_offset["y"]
+                              tolerance = 10 / zoom[0]
+
+                              if event.state & 0x0001:
+                                  hit = index.nearest_vertex(ax, ay, tolerance)
+                                  if hit is not None:
+                                      drag_data["vertex"] = hit[:2]
+                                      drag_data["item"] = anatomy_items["vertices"].get(hit[:2])
+                                      drag_data["x"] = event.x
+                                      drag_data["y"] = event.y
+                                  return
+
+                              hit = index.hit_test(ax, ay, tolerance)
+                              if hit is not None:
+                                  drag_data["item"] = anatomy_items["lines"].get(hit[0]) or "imported_anatomy"
+                                  drag_data["x"] = event.x
+                                  drag_data["y"] = event.y
+
+                          def move_anatomy_vertex(event):
+                              p, v = drag_data["vertex"]
+                              x = event.x / zoom[0] - anatomy_offset["x"]
+                              y = event.y / zoom[0] - anatomy_offset["y"]
+                              get_anatomy_index().move_vertex(p, v, x, y)
+                              poly = list(imported_anatomy_current[p])
+                              poly[v] = (int(round(x)), int(round(y)))
+                              imported_anatomy_current[p] = poly
+
+                              cx, cy = event.x, event.y
+                              if drag_data["item"] is not None:
+                                  canvas.coords(drag_data["item"], cx - 3, cy - 3, cx + 3, cy + 3)
+                              line_item = anatomy_items["lines"].get(p)
+                              if line_item is not None:
+                                  scaled_poly = [(int((px + anatomy_offset["x"]) * zoom[0]), int((py + anatomy_offset["y"]) * zoom[0])) for px, py in poly]
+                                  canvas.coords(line_item, *[c for pt in scaled_poly for c in pt])
 
                           def on_move(event):
-                      
-                              if alignment_saved or drag_data["item"] is None:
+                              if alignment_saved:
+                                  return
+                              if drag_data["vertex"] is not None:
+                                  move_anatomy_vertex(event)
+                                  return
+                              if drag_data["item"] is None:
                                   return
 
                               dx = event.x - drag_data["x"]
                               dy = event.y - drag_data["y"]
 
-                           
                               anatomy_offset["x"] += dx / zoom[0]
                               anatomy_offset["y"] += dy / zoom[0]
 
-                        
                               for item in canvas.find_withtag("imported_anatomy"):
                                   canvas.move(item, dx, dy)
                               drag_data["x"] = event.x
@@ -5423,6 +8326,7 @@ class BrachyApp:
 
                           def stop_move(event):
                               drag_data["item"] = None
+                              drag_data["vertex"] = None
 
                           def undo_last_point():
                              
@@ -5461,6 +8365,8 @@ class BrachyApp:
                           def import_fraction1_anatomy():
                               nonlocal imported_anatomy_original, imported_anatomy_current
                               path = os.path.join(self.temp_dir, "LAT", "LAT_frac1_annotations.json")
+                              # Annotation and transform saves may still be queued on the writer thread
+                              self.file_writer.wait()
                               if not os.path.exists(path):
                                   print("Fraction 1 anatomy annotations not found")
                                   status_var.set("Error: Fraction 1 anatomy annotations not found")
@@ -5471,19 +8377,67 @@ class BrachyApp:
 
                               if "anatomy" in all_polygons:
                                   imported_anatomy_original = all_polygons["anatomy"]
-                                  imported_anatomy_current = all_polygons["anatomy"].copy() 
+                                  saved = AlignmentTransformStore(self.temp_dir).load(
+                                      "LAT", 1, 2, os.path.join(self.temp_dir, "LAT", "LAT_frac1_edited.png"), img)
+                                  if saved is not None:
+                                      imported_anatomy_current = transform_polylines(
+                                          imported_anatomy_original,
+                                          AlignmentTransformStore.display_matrix(saved, fraction1_display_scale(), scale))
+                                      print(f"✅ Restored saved LAT alignment from {saved['saved']}")
+                                  else:
+                                      imported_anatomy_current = all_polygons["anatomy"].copy()
                                   # Reset offset
                                   anatomy_offset["x"] = 0
                                   anatomy_offset["y"] = 0
                                   redraw_canvas()
                                   print("Imported Fraction 1 anatomy")
-                                  status_var.set("Anatomy imported. Drag to position, then click 'Save Alignment' when done.")
+                                  status_var.set("Anatomy imported. Drag to position (Shift+drag moves a single point), then click 'Save Alignment' when done.")
+                                  if saved is not None:
+                                      status_var.set("Saved alignment restored for these images. Check it, adjust if needed, then click 'Save Alignment'.")
+
+                          def auto_register_anatomy(motion="rigid"):
+                              nonlocal imported_anatomy_current
+                              if alignment_saved:
+                                  status_var.set("Alignment already saved - auto registration is disabled")
+                                  return
+                              if not imported_anatomy_original:
+                                  import_fraction1_anatomy()
+                                  if not imported_anatomy_original:
+                                      return
+
+                              frac1_path = os.path.join(self.temp_dir, "LAT", "LAT_frac1_edited.png")
+                              frac1_img = cv2.imread(frac1_path, cv2.IMREAD_GRAYSCALE)
+                              if frac1_img is None:
+                                  messagebox.showerror("Error", "Fraction 1 edited image not found. Please annotate Fraction 1 first.")
+                                  return
+
+                              status_var.set("Registering Fraction 1 to Fraction 2...")
+                              align_win.update_idletasks()
+                              try:
+                                  matrix, score = estimate_fraction_registration(frac1_img, get_img(), motion=motion)
+                              except Exception as e:
+                                  messagebox.showerror("Error", f"Automatic registration failed: {str(e)}")
+                                  print(f"❌ Auto registration failed: {e}")
+                                  return
+
+                              frac1_h, frac1_w = frac1_img.shape[:2]
+                              frac1_scale = min(screen_w / frac1_w, screen_h / frac1_h, 1.0)
+                              display_matrix = registration_to_display(matrix, frac1_scale, scale)
+                              imported_anatomy_current = transform_polylines(imported_anatomy_original, display_matrix)
+                              anatomy_offset["x"] = 0
+                              anatomy_offset["y"] = 0
+                              redraw_canvas()
+
+                              angle = math.degrees(math.atan2(matrix[1, 0], matrix[0, 0]))
+                              print(f"✅ Auto registration ({motion}): angle {angle:.2f}°, "
+                                    f"shift ({matrix[0, 2]:.1f}, {matrix[1, 2]:.1f}) px, ECC {score:.3f}")
+                              status_var.set(f"Auto registration applied (ECC {score:.3f}). Check the overlay, drag to fine-tune, then click 'Save Alignment'.")
 
                           def save_alignment():
                               nonlocal alignment_saved, in_annotation_mode
                              
                               polygons = {
-                                  "anatomy": imported_anatomy_current, 
+                                  "anatomy": placed_anatomy(), 
                                   "applicator_tandem": [],
                                   "left_ovoid": [],
                                   "right_ovoid": []
@@ -5499,18 +8453,16 @@ class BrachyApp:
 
                               
                               json_path = os.path.join(self.temp_dir, "AP_frac1_aligned_to_frac2.json")
-                              with open(json_path, 'w') as f:
-                                  json.dump(polygons, f, indent=4)
+                              self.file_writer.write_json(json_path, polygons, indent=4)
 
                            
                               explicit_path = os.path.join(self.temp_dir, "AP_frac1_aligned_to_frac2_explicit_points.json")
-                              with open(explicit_path, 'w') as f:
-                                  json.dump(explicit_points, f, indent=4)
+                              self.file_writer.write_json(explicit_path, explicit_points, indent=4)
 
                           
                               frac2_annotations_path = os.path.join(self.temp_dir, "AP_frac2_annotations.json")
                               frac2_data = {
-                                  "anatomy": imported_anatomy_current,
+                                  "anatomy": placed_anatomy(),
                                   "applicator_tandem": {"tip": explicit_points["applicator_tandem"]["tip"],
                                                         "base": explicit_points["applicator_tandem"]["base"]},
                                   "left_ovoid": {"tip": explicit_points["left_ovoid"]["tip"],
@@ -5518,13 +8470,17 @@ class BrachyApp:
                                   "right_ovoid": {"tip": explicit_points["right_ovoid"]["tip"],
                                                   "base": explicit_points["right_ovoid"]["base"]}
                               }
-                              with open(frac2_annotations_path, 'w') as f:
-                                  json.dump(frac2_data, f, indent=4)
+                              self.file_writer.write_json(frac2_annotations_path, frac2_data, indent=4)
+
+                              # The image annotated here, fingerprinted with the saved transform
+                              lat_frac2_path = os.path.join(self.temp_dir, "LAT", "LAT_frac2_edited.png")
+                              os.makedirs(os.path.dirname(lat_frac2_path), exist_ok=True)
+                              cv2.imwrite(lat_frac2_path, img)
 
                               
                               edited_img_path = os.path.join(self.temp_dir, "AP_frac2_edited.png")
                               if os.path.exists(edited_img_path):
-                                  self.save_masks_at_original_resolution(edited_img_path, polygons, self.temp_dir)
+                                  self.save_masks_at_original_resolution(edited_img_path, polygons, self.temp_dir, display_scale=scale)
 
                            
                               alignment_saved = True
@@ -5538,6 +8494,15 @@ class BrachyApp:
                              
                               canvas.bind("<Button-1>", on_click)
 
+                              if imported_anatomy_original:
+                                  transform = register_anatomy_polylines(placed_anatomy(), imported_anatomy_original, allow_scale=True)
+                                  # Fingerprinting hashes both images, so the store write runs on the writer thread
+                                  self.file_writer.submit(
+                                      AlignmentTransformStore(self.temp_dir).save,
+                                      "LAT", 1, 2, transform["matrix"], os.path.join(self.temp_dir, "LAT", "LAT_frac1_edited.png"), lat_frac2_path,
+                                      fraction1_display_scale(), scale,
+                                      description=f"LAT fraction 1 -> 2 transform (residual {transform['rms']:.2f} px)")
+
                               print(f"Alignment saved to {json_path}")
                               print(f"✅ Fraction 2 annotations saved to {frac2_annotations_path}")
                               status_var.set("Alignment and annotations saved! Anatomy is fixed. You may now calculate shifts or measurements.")
@@ -5585,56 +8550,21 @@ class BrachyApp:
                                   messagebox.showerror("Error", "Anatomy line is incomplete. Please ensure anatomy has at least 2 points.")
                                   return
 
-                              anatomy_poly = imported_anatomy_current[0]
-                              anatomy_start = anatomy_poly[0]
-                              anatomy_end = anatomy_poly[-1]
-
-                              mm_per_px = self.pixel_spacing["LAT_frac1"] 
-
-                           
-                              dist_results = []
-                              dist_results.append("=== LAT View - Fraction 2 ===")
-                              dist_results.append(f"Anatomy start point: {anatomy_start}")
-                              dist_results.append(f"Anatomy end point: {anatomy_end}")
-                              dist_results.append("")
-
-                              structures = {
-                                  "applicator_tandem": "Tandem Applicator",
-                                  "left_ovoid": "Left Ovoid", 
-                                  "right_ovoid": "Right Ovoid"
-                              }
-
-                              for applicator_key, applicator_name in structures.items():
-                                  tip = explicit_points[applicator_key]["tip"]
-                                  base = explicit_points[applicator_key]["base"]
-
-                                  if not tip or not base:
-                                     
-                                      dist_results.append(f"{applicator_name} Tip to Anatomy Start: ")
-                                      dist_results.append(f"{applicator_name} Base to Anatomy Start: ")
-                                      dist_results.append(f"{applicator_name} Tip to Anatomy End: ")
-                                      dist_results.append(f"{applicator_name} Base to Anatomy End: ")
-                                      continue
+                              # The placed anatomy already carries the registration (including any scale),
+                              # so its first and last vertices are the fraction-2 references
+                              placed = placed_anatomy()
+                              anatomy_start, anatomy_end = placed[0][0], placed[0][-1]
 
-                                  
-                                  tip_to_start = self.euclidean_distance(tip, anatomy_start) * mm_per_px
-                                  base_to_start = self.euclidean_distance(base, anatomy_start) * mm_per_px
-                                  tip_to_end = self.euclidean_distance(tip, anatomy_end) * mm_per_px
-                                  base_to_end = self.euclidean_distance(base, anatomy_end) * mm_per_px
+                              mm_per_px = self.object_mm_per_px("LAT_frac1") 
 
-                                  dist_results.append(f"{applicator_name} Tip to Anatomy Start: {tip_to_start:.2f} mm")
-                                  dist_results.append(f"{applicator_name} Base to Anatomy Start: {base_to_start:.2f} mm")
-                                  dist_results.append(f"{applicator_name} Tip to Anatomy End: {tip_to_end:.2f} mm")
-                                  dist_results.append(f"{applicator_name} Base to Anatomy End: {base_to_end:.2f} mm")
+                              record = MeasurementStore.measure("LAT", 2, anatomy_start, anatomy_end, explicit_points, mm_per_px,
+                                                               zoom=zoom[0])
 
-                              
                               txt_filename = "LAT_frac2_distances_from_anatomy.txt"
                               txt_path = os.path.join(self.temp_dir, "LAT", txt_filename)
 
                               try:
-                                  with open(txt_path, "w", encoding="utf-8") as f:
-                                      for line in dist_results:
-                                          f.write(line + "\n")
+                                  self.measurement_store().save(record, txt_path, writer=self.file_writer)
 
                                  
                                   messagebox.showinfo("Success", 
@@ -5646,7 +8576,7 @@ class BrachyApp:
 
                           
                                   print(f"✅ DISTANCES SAVED: {txt_path}")
-                                  for line in dist_results:
+                                  for line in MeasurementStore.render_text(record):
                                       print(f"   {line}")
 
                                  
@@ -5749,6 +8679,8 @@ class BrachyApp:
                           sections = [
                               ("Movement & Import Tools", [
                                   ("📥 Import Fraction 1 Anatomy", import_fraction1_anatomy),
+                                  ("🎯 Auto Register Anatomy (Rigid)", lambda: auto_register_anatomy("rigid")),
+                                  ("🎯 Auto Register Anatomy (Similarity)", lambda: auto_register_anatomy("similarity")),
                                   ("💾 Save Alignment Position", save_alignment)
                               ]),
                               ("Annotation Mode Selection", [
@@ -5769,6 +8701,9 @@ class BrachyApp:
                                   ("🔍 Zoom Out Image View", zoom_out),
                                   ("🔄 Reset Zoom Level", reset_zoom)
                               ]),
+                              ("Placement Assist", [
+                                  ("🧲 Toggle Snap to Edges", toggle_snap)
+                              ]),
                               ("Measurement Tools", [
                                   ("💾 Save & End Session", save_and_end_session)
                               ])
@@ -5952,6 +8887,7 @@ class BrachyApp:
             return False
 
     def open_annotation_window_lateral(self, img_path, fraction_key):
+        self.bind_workspace_to_patient()
         save_folder = os.path.join(self.temp_dir, "LAT")
         os.makedirs(save_folder, exist_ok=True)
 
@@ -6116,8 +9052,22 @@ class BrachyApp:
                 item = canvas.create_oval(x-3, y-3, x+3, y+3, fill='yellow', tags="annotation")
                 canvas_items["anatomy"].append(item)
 
+        snap_map = FeatureSnapMap.for_image(img_resized)
+        snap_enabled = [False]
+
+        def toggle_snap():
+            snap_enabled[0] = not snap_enabled[0]
+            if not snap_enabled[0]:
+                status_var.set("Snap to edges OFF - points are placed exactly where you click")
+            elif snap_map.ready.is_set():
+                status_var.set("Snap to edges ON - clicks snap to the strongest nearby edge or end point")
+            else:
+                status_var.set("Snap to edges ON - edge map still building, clicks are unsnapped until it is ready")
+
         def on_click(event):
             x, y = int(event.x / zoom[0]), int(event.y / zoom[0])
+            if snap_enabled[0]:
+                x, y = snap_map.snap(x, y)
 
             if mode.get() == "anatomy":
                 current_points.append((x, y))
@@ -6197,8 +9147,7 @@ class BrachyApp:
 
         
             json_path = os.path.join(save_folder, f"{fraction_key}_annotations.json")
-            with open(json_path, 'w') as f:
-                json.dump(polygons, f)
+            self.file_writer.write_json(json_path, polygons)
 
             print(f"✅ SAVED ANNOTATIONS: {json_path}")
             print(f"✅ Anatomy points: {len(anatomy_points)}")
@@ -6208,8 +9157,7 @@ class BrachyApp:
 
          
             explicit_path = os.path.join(save_folder, f"{fraction_key}_explicit_points.json")
-            with open(explicit_path, 'w') as f:
-                json.dump(explicit_points, f)
+            self.file_writer.write_json(explicit_path, explicit_points)
 
           
             export_distances_to_txt(polygons, json_path)
@@ -6226,56 +9174,27 @@ class BrachyApp:
             anatomy_start = anatomy_poly[0]
             anatomy_end = anatomy_poly[-1]
 
-            mm_per_px = self.pixel_spacing.get("LAT_frac1", 0.2979) 
+            mm_per_px = self.object_mm_per_px("LAT_frac1") 
 
        
-            fraction_number = "1" if "frac1" in fraction_key else "2" if "frac2" in fraction_key else "Unknown"
+            parsed = parse_fraction_key(fraction_key)
+            if parsed is None:
+                print(f"⚠️ Cannot export distances: no fraction in {fraction_key}")
+                return
+            fraction_number = parsed[1]
             view_type = "Lateral"
 
-         
-            dist_results = []
-            dist_results.append(f"=== {view_type} View - Fraction {fraction_number} ===")
-            dist_results.append(f"Anatomy start point: {anatomy_start}")
-            dist_results.append(f"Anatomy end point: {anatomy_end}")
-            dist_results.append("")
-
-            structures = {
-                "applicator_tandem": "Tandem Applicator",
-                "left_ovoid": "Left Ovoid", 
-                "right_ovoid": "Right Ovoid"
-            }
-
-            for applicator_key, applicator_name in structures.items():
-                if applicator_key not in polygons or not polygons[applicator_key]:
-                    dist_results.append(f"{applicator_name}: Not annotated")
-                    continue
-
-                tip = explicit_points[applicator_key]["tip"]
-                base = explicit_points[applicator_key]["base"]
-
-                if not tip or not base:
-                    dist_results.append(f"{applicator_name}: Tip or base missing")
-                    continue
-
-              
-                distances = {
-                    f"{applicator_name} Tip to Anatomy Start": self.euclidean_distance(tip, anatomy_start) * mm_per_px,
-                    f"{applicator_name} Base to Anatomy Start": self.euclidean_distance(base, anatomy_start) * mm_per_px,
-                    f"{applicator_name} Tip to Anatomy End": self.euclidean_distance(tip, anatomy_end) * mm_per_px,
-                    f"{applicator_name} Base to Anatomy End": self.euclidean_distance(base, anatomy_end) * mm_per_px
-                }
-
-                for desc, dist in distances.items():
-                    dist_results.append(f"{desc}: {dist:.2f} mm")
+            # Only structures that were actually annotated are measured
+            measured_points = {key: explicit_points[key] for key in MeasurementStore.APPLICATORS if polygons.get(key)}
+            record = MeasurementStore.measure("LAT", fraction_number, anatomy_start, anatomy_end,
+                                              measured_points, mm_per_px, zoom=zoom[0])
 
           
             txt_filename = f"LAT_frac{fraction_number}_distances_from_anatomy.txt"
             txt_path = os.path.join(save_folder, txt_filename)
 
             try:
-                with open(txt_path, "w", encoding="utf-8") as f:
-                    for line in dist_results:
-                        f.write(line + "\n")
+                self.measurement_store().save(record, txt_path, writer=self.file_writer)
 
                 print(f"✅ DISTANCES EXPORTED: {txt_path}")
 
@@ -6352,6 +9271,9 @@ class BrachyApp:
                 ("🔍 Zoom Out View", zoom_out),
                 ("🔄 Reset Zoom Level", reset_zoom)
             ]),
+            ("Placement Assist", [
+                ("🧲 Toggle Snap to Edges", toggle_snap)
+            ]),
             ("Actions", [
                 ("💾 Save & Close Session", finish_and_close)
             ])
@@ -6612,6 +9534,32 @@ class BrachyApp:
             label = tk.Label(dist_win, text=dist_text, justify="left", font=("Arial", 10))
             label.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
 
+        def auto_register_LAT():
+            frac1_img = cv2.imread(self.image_paths["LAT_frac1"], cv2.IMREAD_GRAYSCALE)
+            frac2_img = None
+            if self.image_paths["LAT_frac2"]:
+                frac2_img = cv2.imread(self.image_paths["LAT_frac2"], cv2.IMREAD_GRAYSCALE)
+            if frac1_img is None or frac2_img is None:
+                messagebox.showerror("Error", "Both LAT fraction images are needed for automatic registration.")
+                return
+
+            try:
+                matrix, score = estimate_fraction_registration(frac1_img, frac2_img)
+            except Exception as e:
+                messagebox.showerror("Error", f"Automatic registration failed: {e}")
+                return
+
+            # Both fractions share this canvas scale: the structures are drawn at fraction 1
+            # pixels * scale and finish_alignment_LAT divides the moved points by it again
+            display_matrix = registration_to_display(matrix, scale, scale)
+            for idx, (item, scaled_poly, label) in enumerate(polygon_items):
+                new_poly = transform_polylines([scaled_poly], display_matrix)[0]
+                polygon_items[idx] = (item, new_poly, label)
+                canvas.coords(item, *[c for pt in new_poly for c in pt])
+            offset["x"] = 0
+            offset["y"] = 0
+            print(f"Auto registration applied to LAT structures (ECC {score:.3f})")
+
         def finish_alignment_LAT():
             print("Finish alignment clicked")
             
@@ -6625,6 +9573,8 @@ class BrachyApp:
 
             win.destroy()
             
+        tk.Button(win, text="Auto Register to Fraction 2", command=auto_register_LAT).pack(pady=5)
+
         btn_export = tk.Button(win, text="Export Distances", command=calculate_and_show_distances)
         btn_export.pack(pady=5)
 
@@ -6643,82 +9593,32 @@ class BrachyApp:
     def compare_lateral_fraction_distances(self):
      
         import os
-        import re
     
         
         lat_dir = os.path.join(self.temp_dir, "LAT")
         file1 = os.path.join(lat_dir, "LAT_frac1_distances_from_anatomy.txt")
         file2 = os.path.join(lat_dir, "LAT_frac2_distances_from_anatomy.txt")
+        store = self.measurement_store()
+        dist1 = store.distances("LAT", 1)
+        dist2 = store.distances("LAT", 2)
     
        
-        self.debug_lateral_files()
-    
-        
-        if not os.path.exists(file1) or not os.path.exists(file2):
-            messagebox.showerror("Error", 
-                               "Missing lateral distance files.\n\n"
-                               f"LAT Fraction 1: {'Found' if os.path.exists(file1) else 'Missing'}\n"
-                               f"LAT Fraction 2: {'Found' if os.path.exists(file2) else 'Missing'}\n\n"
-                               "Please complete lateral annotation for both fractions first.")
-            return
-
-        def extract_structured_distances(file_path):
-            """Extract distances from lateral TXT files"""
-            distances = {}
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    content = f.read()
-                    print(f"DEBUG: Reading {os.path.basename(file_path)}")
-                    print(f"Content:\n{content}")
-            
-               
-                with open(file_path, "r", encoding="utf-8") as f:
-                    current_applicator = None
-                    for line in f:
-                        line = line.strip()
-                        print(f"DEBUG Line: {line}")
-                
-                     
-                        if not line or "===" in line:
-                            continue
-                    
-                     
-                        match = re.match(r"(.+?)\s+(Tip|Base)\s+to\s+Anatomy\s+(Start|End):\s*([\d.]+)\s*mm", line)
-                        if match:
-                            applicator = match.group(1).strip()
-                            point_type = match.group(2).lower()
-                            anatomy_point = match.group(3).lower()
-                            value = float(match.group(4))
-                    
-                     
-                            if applicator not in distances:
-                                distances[applicator] = {}
-                    
-                            
-                            key = f"{point_type}_to_{anatomy_point}"
-                            distances[applicator][key] = value
-                            print(f"DEBUG: Found {applicator} - {key}: {value}")
-                    
-            except Exception as e:
-                print(f"Error reading lateral file {file_path}: {e}")
-            return distances
-
-       
-        dist1 = extract_structured_distances(file1)
-        dist2 = extract_structured_distances(file2)
+        self.debug_lateral_files()
     
-        print(f"DEBUG: dist1 = {dist1}")
-        print(f"DEBUG: dist2 = {dist2}")
-
+        
         if not dist1 or not dist2:
             messagebox.showerror("Error", 
-                               "No valid distance data found in lateral files.\n\n"
-                               "Please ensure:\n"
-                               "1. Both lateral fractions are annotated\n"
-                               "2. All applicators are marked with tip and base points\n"
-                               "3. Anatomy line is drawn")
+                               "Missing lateral distance measurements.\n\n"
+                               f"LAT Fraction 1: {'Found' if dist1 else 'Missing'}\n"
+                               f"LAT Fraction 2: {'Found' if dist2 else 'Missing'}\n\n"
+                               "Please complete lateral annotation for both fractions first.")
             return
 
+    
+        print(f"DEBUG: dist1 = {dist1}")
+        print(f"DEBUG: dist2 = {dist2}")
+
+
         
         shifts = {}
     
@@ -6926,53 +9826,23 @@ class BrachyApp:
     def compare_lateral_fraction_distances_with_shifts(self):
        
         import os
-        import re
     
      
         file1 = os.path.join(self.temp_dir, "LAT", "LAT_frac1_distances_from_anatomy.txt")
         file2 = os.path.join(self.temp_dir, "LAT", "LAT_frac2_distances_from_anatomy.txt")
+        store = self.measurement_store()
+        dist1 = store.distances("LAT", 1)
+        dist2 = store.distances("LAT", 2)
     
         # Check if files exist
-        if not os.path.exists(file1) or not os.path.exists(file2):
+        if not dist1 or not dist2:
             messagebox.showerror("Error", 
-                               "Missing lateral distance files.\n\n"
-                               f"Fraction 1: {'Found' if os.path.exists(file1) else 'Missing'}\n"
-                               f"Fraction 2: {'Found' if os.path.exists(file2) else 'Missing'}")
+                               "Missing lateral distance measurements.\n\n"
+                               f"Fraction 1: {'Found' if dist1 else 'Missing'}\n"
+                               f"Fraction 2: {'Found' if dist2 else 'Missing'}")
             return
     
-        def extract_distances(file_path):
-          
-            distances = {}
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    content = f.read()
-            
-                pattern = r"(.+?)\s+(Tip|Base)\s+to\s+Anatomy\s+(Start|End):\s*([\d.]+)\s*mm"
-                matches = re.findall(pattern, content)
-        
-                for match in matches:
-                    applicator = match[0].strip()
-                    point_type = match[1].lower()
-                    anatomy_point = match[2].lower()
-                    value = float(match[3])
-            
-                    if applicator not in distances:
-                        distances[applicator] = {}
-                
-                    key = f"{point_type}_to_{anatomy_point}"
-                    distances[applicator][key] = value
-            
-            except Exception as e:
-                print(f"Error reading file {file_path}: {e}")
-            return distances
-
-       
-        dist1 = extract_distances(file1)
-        dist2 = extract_distances(file2)
     
-        if not dist1 or not dist2:
-            messagebox.showerror("Error", "No valid distance data found in lateral files")
-            return
     
        
         shifts = {}
@@ -7057,108 +9927,34 @@ class BrachyApp:
  
     def calculate_3d_displacements(self):
       
-        import os
-        import re
-    
-        
-        ap_files = {
-            "frac1": os.path.join(self.temp_dir, "AP_frac1_distances_from_anatomy.txt"),
-            "frac2": os.path.join(self.temp_dir, "AP_frac2_distances_from_anatomy.txt")
-        }
-    
-        lat_files = {
-            "frac1": os.path.join(self.temp_dir, "LAT", "LAT_frac1_distances_from_anatomy.txt"),
-            "frac2": os.path.join(self.temp_dir, "LAT", "LAT_frac2_distances_from_anatomy.txt")
-        }
+        store = self.measurement_store()
+        # Only fractions measured in both views can be reconstructed; the planned count is not required
+        ap_fractions, lat_fractions = set(store.fractions("AP")), set(store.fractions("LAT"))
+        fractions = sorted(ap_fractions & lat_fractions)
     
       
-        missing_files = []
-        for frac_key in ["frac1", "frac2"]:
-            if not os.path.exists(ap_files[frac_key]):
-                missing_files.append(f"AP Fraction {frac_key[-1]}")
-            if not os.path.exists(lat_files[frac_key]):
-                missing_files.append(f"Lateral Fraction {frac_key[-1]}")
-    
-        if missing_files:
+        if len(fractions) < 2:
+            missing_files = []
+            for frac in sorted(ap_fractions | lat_fractions | {1, 2}):
+                if frac not in ap_fractions:
+                    missing_files.append(f"AP Fraction {frac}")
+                if frac not in lat_fractions:
+                    missing_files.append(f"Lateral Fraction {frac}")
             messagebox.showerror(
-                "Missing Files", 
-                f"Could not find the following distance files:\n" + 
+                "Missing Measurements", 
+                f"At least two fractions need measurements in both views. Missing:\n" + 
                 "\n".join(f"• {file}" for file in missing_files) +
-                "\n\nPlease complete annotation for all fractions and views first."
+                "\n\nPlease complete the AP and lateral annotation of at least two fractions first."
             )
             return
     
-        def extract_3d_points_from_txt(file_path, view_type):
-       
-            points_3d = {}
-    
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    content = f.read()
-        
-          
-                applicators_list = ["Tandem Applicator", "Left Ovoid", "Right Ovoid"]
-        
-                for applicator in applicators_list:
-              
-                    height_pattern = rf"{applicator}.*?Height.*?:\s*([\d.]+)"
-                    height_match = re.search(height_pattern, content, re.DOTALL | re.IGNORECASE)
-            
-                  
-                    y_pattern = rf"{applicator}.*?Y.*?:\s*([\d.]+)"
-                    y_match = re.search(y_pattern, content, re.DOTALL | re.IGNORECASE)
-            
-           
-                    si_pattern = rf"{applicator}.*?Superior.*?Inferior.*?:\s*([\d.]+)"
-                    si_match = re.search(si_pattern, content, re.DOTALL | re.IGNORECASE)
-                    
-                  
-                    y_coordinate = 0
-                    if height_match:
-                        y_coordinate = float(height_match.group(1))
-                    elif y_match:
-                        y_coordinate = float(y_match.group(1))
-                    elif si_match:
-                        y_coordinate = float(si_match.group(1))
-            
-             
-                    dist_pattern = rf"{applicator}.*?Tip to Anatomy Start:\s*([\d.]+).*?Base to Anatomy Start:\s*([\d.]+)"
-                    dist_match = re.search(dist_pattern, content, re.DOTALL)
-            
-                    if dist_match:
-                        tip_dist = float(dist_match.group(1))
-                        base_dist = float(dist_match.group(2))
-                
-                        if view_type == "AP":
-                            points_3d[applicator] = {
-                                "tip": [tip_dist, y_coordinate, 0],
-                                "base": [base_dist, y_coordinate, 0]
-                            }
-                        elif view_type == "LAT":
-                            points_3d[applicator] = {
-                                "tip": [0, y_coordinate, tip_dist],  
-                                "base": [0, y_coordinate, base_dist]
-                            }
-                
-            except Exception as e:
-                print(f"Error extracting 3D points from {file_path}: {e}")
-            
-            return points_3d
-    
-       
-        ap_points_frac1 = extract_3d_points_from_txt(ap_files["frac1"], "AP")
-        ap_points_frac2 = extract_3d_points_from_txt(ap_files["frac2"], "AP")
-        lat_points_frac1 = extract_3d_points_from_txt(lat_files["frac1"], "LAT") 
-        lat_points_frac2 = extract_3d_points_from_txt(lat_files["frac2"], "LAT")
+        # (fraction, applicator, tip/base, x/y/z) from the AP and lateral films together
+        points_3d, _ = self.reconstruct_3d_landmarks(fractions)
     
        
-        applicators = ["Tandem Applicator", "Left Ovoid", "Right Ovoid"]
-        missing_data = []
-    
-        for applicator in applicators:
-            if (applicator not in ap_points_frac1 or applicator not in ap_points_frac2 or
-                applicator not in lat_points_frac1 or applicator not in lat_points_frac2):
-                missing_data.append(applicator)
+        applicators = [MeasurementStore.APPLICATORS[key] for key in LandmarkSet.APPLICATORS]
+        missing_data = [applicator for applicator, points in zip(applicators, np.isnan(points_3d).any(axis=(0, 2, 3)))
+                        if points]
     
         if missing_data:
             messagebox.showerror(
@@ -7169,109 +9965,240 @@ class BrachyApp:
             )
             return
     
-       
-        def combine_3d_points(ap_points, lat_points):
-            """Combine AP (X) and lateral (Z) data to get full 3D coordinates"""
-            combined = {}
+        # Every fraction pair at once; the detailed view follows the first to the last fraction
+        matrix = pairwise_displacements(points_3d, fractions)
+        # Whole-assembly rigid motion for every pair; what it leaves over is relative deformation
+        landmarks = points_3d.reshape(len(fractions), -1, 3)
+        matrix["rigid"] = fit_rigid_transforms(landmarks[:, None], landmarks[None, :])
+        matrix["rigid"]["angles"] = rotation_angles(matrix["rigid"]["rotation"])
+        positions = _landmark_coords(points_3d)
+        delta = matrix["delta"][0, -1]
+        magnitude = matrix["magnitude"][0, -1]
 
-            for applicator in applicators:
-                if applicator in ap_points and applicator in lat_points:
-              
-            
-                    
-                    combined[applicator] = {
-                        "tip": [
-                            ap_points[applicator]["tip"][0],  
-                            lat_points[applicator]["tip"][1],
-                            lat_points[applicator]["tip"][2]   
-                        ],
-                        "base": [
-                            ap_points[applicator]["base"][0],   
-                            lat_points[applicator]["base"][1],  
-                            lat_points[applicator]["base"][2]   
-                        ]
-                    }
-                
-                    
-                    tip = combined[applicator]["tip"]
-                    base = combined[applicator]["base"]
-                    centroid = [
-                        (tip[0] + base[0]) / 2,
-                        (tip[1] + base[1]) / 2, 
-                        (tip[2] + base[2]) / 2
-                    ]
-                    combined[applicator]["centroid"] = centroid
-        
-            return combined
-    
-        
-        points_3d_frac1 = combine_3d_points(ap_points_frac1, lat_points_frac1)
-        points_3d_frac2 = combine_3d_points(ap_points_frac2, lat_points_frac2)
-    
-       
-        displacements = {}
-    
-        for applicator in applicators:
-            if applicator in points_3d_frac1 and applicator in points_3d_frac2:
-               
-                tip1 = points_3d_frac1[applicator]["tip"]
-                tip2 = points_3d_frac2[applicator]["tip"]
-                base1 = points_3d_frac1[applicator]["base"]  
-                base2 = points_3d_frac2[applicator]["base"]
-                centroid1 = points_3d_frac1[applicator]["centroid"]
-                centroid2 = points_3d_frac2[applicator]["centroid"]
-            
-          
-                tip_displacement_3d = self.euclidean_distance_3d(tip1, tip2)
-                base_displacement_3d = self.euclidean_distance_3d(base1, base2)
-                centroid_displacement_3d = self.euclidean_distance_3d(centroid1, centroid2)
-            
-            
+        def point_dict(frac_index, a):
+            return {point: positions[frac_index, a, p].tolist() for p, point in enumerate(LANDMARK_POINTS)}
 
-            
-             
-                delta_x = centroid2[0] - centroid1[0]  
-                delta_y = centroid2[1] - centroid1[1]  
-                delta_z = centroid2[2] - centroid1[2]  
-            
-           
-                tip_delta_x = tip2[0] - tip1[0]
-                tip_delta_y = tip2[1] - tip1[1]
-                tip_delta_z = tip2[2] - tip1[2]
-            
-                
-                base_delta_x = base2[0] - base1[0]
-                base_delta_y = base2[1] - base1[1]
-                base_delta_z = base2[2] - base1[2]
-            
-                displacements[applicator] = {
-                    "tip_displacement_mm": tip_displacement_3d,
-                    "base_displacement_mm": base_displacement_3d, 
-                    "centroid_displacement_mm": centroid_displacement_3d,
-                    "points_frac1": points_3d_frac1[applicator],
-                    "points_frac2": points_3d_frac2[applicator],
-            
-                    "centroid_delta_x": delta_x,
-                    "centroid_delta_y": delta_y, 
-                    "centroid_delta_z": delta_z,
-                
-                    "tip_delta_x": tip_delta_x,
-                    "tip_delta_y": tip_delta_y,
-                    "tip_delta_z": tip_delta_z,
+        displacements = {}
+        for a, applicator in enumerate(applicators):
+            tip, base, centroid = delta[a]
+            displacements[applicator] = {
+                "source_fraction": fractions[0],
+                "target_fraction": fractions[-1],
+                "tip_displacement_mm": float(magnitude[a, 0]),
+                "base_displacement_mm": float(magnitude[a, 1]), 
+                "centroid_displacement_mm": float(magnitude[a, 2]),
+                "points_frac1": point_dict(0, a),
+                "points_frac2": point_dict(-1, a),
+            
+                "centroid_delta_x": float(centroid[0]),
+                "centroid_delta_y": float(centroid[1]), 
+                "centroid_delta_z": float(centroid[2]),
+                
+                "tip_delta_x": float(tip[0]),
+                "tip_delta_y": float(tip[1]),
+                "tip_delta_z": float(tip[2]),
                   
-                    "base_delta_x": base_delta_x,
-                    "base_delta_y": base_delta_y,
-                    "base_delta_z": base_delta_z
-                }
+                "base_delta_x": float(base[0]),
+                "base_delta_y": float(base[1]),
+                "base_delta_z": float(base[2])
+            }
     
         
-        self.show_3d_displacement_results(displacements)
+        self.show_3d_displacement_results(displacements, matrix)
 
-    def euclidean_distance_3d(self, p1, p2):
-        
-        return math.sqrt((p2[0]-p1[0])**2 + (p2[1]-p1[1])**2 + (p2[2]-p1[2])**2)
+    def displacement_uncertainty(self, fractions, samples=100000):
+        """monte_carlo_film_uncertainty() for this session's AP and lateral records"""
+        store = self.measurement_store()
+        default = self.click_uncertainty.quantization_px
+        steps = tuple(store.click_quantization(view, fractions, default) for view in ("AP", "LAT"))
+        summary = monte_carlo_film_uncertainty(store.film_pixels("AP", fractions), store.film_pixels("LAT", fractions),
+                                               self.imaging_geometry("AP_frac1"), self.imaging_geometry("LAT_frac1"),
+                                               self.click_uncertainty, samples=samples, quantization_px=steps)
+        summary["quantization_px"] = {view: step.ravel() for view, step in zip(("AP", "LAT"), steps)}
+        return summary
+
+    def show_displacement_uncertainty(self, fractions):
+        self.update_status("Running Monte Carlo uncertainty analysis...")
+        started = time.perf_counter()
+        try:
+            summary = self.displacement_uncertainty(fractions)
+        except Exception as e:
+            print(f"❌ Uncertainty analysis failed: {e}")
+            messagebox.showerror("Uncertainty Analysis", f"Could not run the uncertainty analysis:\n{e}")
+            return
+        elapsed = time.perf_counter() - started
+        self.update_status(f"Uncertainty analysis done ({summary['samples']:,} samples, {elapsed:.1f} s)")
+
+        level = f"{summary['confidence'] * 100:.0f}%"
+        lines = [f"Monte Carlo uncertainty - {summary['samples']:,} samples, {level} intervals",
+                 f"Click model: σ = {self.click_uncertainty.sigma_px:.2f} px observer error "
+                 f"+ one-sided truncation per axis of "
+                 + ", ".join(f"{view} {steps.min():.2f}-{steps.max():.2f} px"
+                             for view, steps in summary["quantization_px"].items()),
+                 ""]
+        displacement = summary["displacement_mm"]
+        for i, j in zip(*np.triu_indices(len(fractions), k=1)):
+            lines.append(f"3D displacement F{fractions[i]} → F{fractions[j]}:")
+            for a, key in enumerate(LandmarkSet.APPLICATORS):
+                cells = [f"{point} {displacement['mean'][i, j, a, p]:.2f} "
+                         f"[{displacement['low'][i, j, a, p]:.2f}, {displacement['high'][i, j, a, p]:.2f}]"
+                         for p, point in enumerate(LANDMARK_POINTS)]
+                lines.append(f"    {MeasurementStore.APPLICATORS[key]}: " + ", ".join(cells) + " mm")
+            lines.append("")
+        distance = summary["distance_mm"]
+        for v, view in enumerate(("AP", "LAT")):
+            for f, fraction in enumerate(fractions):
+                lines.append(f"{MeasurementStore.VIEW_LABELS[view]} Fraction {fraction} distances to anatomy:")
+                for a, key in enumerate(LandmarkSet.APPLICATORS):
+                    cells = [f"{LandmarkSet.POINTS[p]}→{reference} {distance['mean'][v, f, a, p, r]:.2f} "
+                             f"± {distance['std'][v, f, a, p, r]:.2f}"
+                             for p in range(2) for r, reference in enumerate(("start", "end"))]
+                    lines.append(f"    {MeasurementStore.APPLICATORS[key]}: " + ", ".join(cells) + " mm")
+                lines.append("")
+        lines = [line.replace("nan [nan, nan]", "n/a").replace("nan ± nan", "n/a") for line in lines]
+
+        window = tk.Toplevel(self.root)
+        window.title("Displacement Uncertainty")
+        window.geometry("1000x700")
+        text_widget = tk.Text(window, wrap=tk.NONE, font=("Courier", 10), padx=15, pady=15)
+        scrollbar = tk.Scrollbar(window, orient=tk.VERTICAL, command=text_widget.yview)
+        text_widget.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        text_widget.pack(fill=tk.BOTH, expand=True)
+        text_widget.insert(tk.END, "\n".join(lines))
+        text_widget.config(state=tk.DISABLED)
+
+    def dosimetric_impact(self, fractions, grid_spacing_mm=2.5):
+        """TG-43 dose of the first fraction's plan in every fraction's applicator geometry.
+
+        Dwells are inferred on the planned (first) fraction and their times set
+        so the mean of Points A receives the prescription; later fractions keep
+        those times with the dwells carried along with their applicators. Dose
+        is evaluated at the planned reference points and on a grid around the
+        planned applicators, both fixed in the anatomy frame.
+        """
+        points, _ = self.reconstruct_3d_landmarks(fractions)
+        planned = points[0]
+        if np.isnan(planned).any():
+            raise ValueError(f"Fraction {fractions[0]} needs the tip and base of every applicator")
+        plan = DwellPlan.from_landmarks(planned, self.dwell_step_mm)
+        source = self.tg43_source
+        references = manchester_points(planned)
+        reference_xyz = np.stack(list(references.values()))
+        point_a = reference_xyz[:2]
+
+        unit_dose = plan.dose_gy(source, point_a, np.ones(len(plan.positions_mm))).mean()
+        dwell_times = np.full(len(plan.positions_mm), self.dose_prescription_gy / unit_dose)
+        grid = dose_grid(planned, spacing_mm=grid_spacing_mm)
+        voxel_cc = grid_spacing_mm ** 3 / 1000.0
+
+        usable = [0] + [f for f in range(1, len(fractions)) if not np.isnan(points[f]).any()]
+        plans = [plan] + [plan.moved_to(planned, points[f]) for f in usable[1:]]
+        reference_dose = np.stack([p.dose_gy(source, reference_xyz, dwell_times) for p in plans])
+        grid_dose = np.stack([p.dose_gy(source, grid, dwell_times) for p in plans])
+        # Local changes are compared below 200% of the prescription; closer to a dwell they are dominated by 1/r^2
+        rx = self.dose_prescription_gy
+        difference = np.where((grid_dose < 2 * rx) & (grid_dose[0] < 2 * rx), grid_dose - grid_dose[0], 0.0)
+        return {
+            "fractions": [fractions[f] for f in usable],
+            "references": list(references),
+            "reference_dose_gy": reference_dose,
+            "v100_cc": (grid_dose >= rx).sum(axis=(1, 2, 3)) * voxel_cc,
+            "max_increase_gy": difference.max(axis=(1, 2, 3)),
+            "max_decrease_gy": -difference.min(axis=(1, 2, 3)),
+            "dwell_count": len(plan.positions_mm),
+            "grid_shape": grid.shape[:3],
+            "source": source.name
+        }
+
+    def show_dosimetric_impact(self, fractions):
+        self.update_status("Calculating TG-43 dose for planned and displaced geometry...")
+        started = time.perf_counter()
+        try:
+            impact = self.dosimetric_impact(fractions)
+        except Exception as e:
+            print(f"❌ Dose calculation failed: {e}")
+            messagebox.showerror("Dosimetric Impact", f"Could not calculate the dose:\n{e}")
+            return
+        self.update_status(f"Dose calculation done ({time.perf_counter() - started:.1f} s)")
+
+        done = impact["fractions"]
+        skipped = [f for f in fractions if f not in done]
+        lines = [f"TG-43 dosimetric impact - source: {impact['source']}",
+                 f"Plan: {impact['dwell_count']} dwells every {self.dwell_step_mm:.1f} mm on Fraction {done[0]}, "
+                 f"normalised to {self.dose_prescription_gy:.2f} Gy mean Point A",
+                 "Displaced fractions reuse the planned dwell times; points and grid stay in the planned anatomy frame.",
+                 ""]
+        header = f"{'Point':<14}{'F' + str(done[0]) + ' (plan)':>14}" + "".join(
+            f"{'F' + str(f):>10}{'Δ':>9}{'Δ%':>8}" for f in done[1:])
+        lines += ["Reference point dose (Gy):", header]
+        dose = impact["reference_dose_gy"]
+        for r, name in enumerate(impact["references"]):
+            row = f"{name:<14}{dose[0, r]:>14.2f}"
+            for f in range(1, len(done)):
+                delta = dose[f, r] - dose[0, r]
+                row += f"{dose[f, r]:>10.2f}{delta:>+9.2f}{delta / dose[0, r] * 100:>+7.1f}%"
+            lines.append(row)
+        lines += ["", f"Dose grid {' x '.join(str(n) for n in impact['grid_shape'])} voxels:"]
+        for f, fraction in enumerate(done):
+            line = f"    F{fraction}: V100 {impact['v100_cc'][f]:7.1f} cc"
+            if f:
+                line += (f" ({impact['v100_cc'][f] - impact['v100_cc'][0]:+.1f} cc), "
+                         f"max local increase {impact['max_increase_gy'][f]:.2f} Gy, "
+                         f"max local decrease {impact['max_decrease_gy'][f]:.2f} Gy (below 200% Rx)")
+            lines.append(line)
+        if skipped:
+            lines += ["", "Skipped (incomplete 3D landmarks): " + ", ".join(f"F{f}" for f in skipped)]
+
+        window = tk.Toplevel(self.root)
+        window.title("Dosimetric Impact")
+        window.geometry("1000x600")
+        text_widget = tk.Text(window, wrap=tk.NONE, font=("Courier", 10), padx=15, pady=15)
+        scrollbar = tk.Scrollbar(window, orient=tk.VERTICAL, command=text_widget.yview)
+        text_widget.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        text_widget.pack(fill=tk.BOTH, expand=True)
+        text_widget.insert(tk.END, "\n".join(lines))
+        text_widget.config(state=tk.DISABLED)
 
-    def show_3d_displacement_results(self, displacements):
+    def rigid_motion_lines(self, matrix, applicators):
+        """Text of the rigid translation, rotation and per-landmark residual for every fraction pair"""
+        rigid = matrix["rigid"]
+        fractions = matrix["fractions"]
+        lines = []
+        for i, j in zip(*np.triu_indices(len(fractions), k=1)):
+            tx, ty, tz = rigid["translation"][i, j]
+            ax, ay, az = rigid["angles"][i, j]
+            lines.append(f"F{fractions[i]} → F{fractions[j]}: translation [ΔX={tx:+.2f}, ΔY={ty:+.2f}, ΔZ={tz:+.2f}] mm, "
+                         f"rotation [X={ax:+.1f}°, Y={ay:+.1f}°, Z={az:+.1f}°], residual RMS {rigid['rms'][i, j]:.2f} mm")
+            residual = rigid["residual"][i, j].reshape(len(applicators), len(LandmarkSet.POINTS))
+            for a, applicator in enumerate(applicators):
+                lines.append(f"    {applicator}: " + ", ".join(f"{point} {residual[a, p]:.2f} mm"
+                                                            for p, point in enumerate(LandmarkSet.POINTS)))
+        lines.append("Residuals above the landmark uncertainty mean the applicators moved relative to each other "
+                     "(bent or separated), not just shifted as one body.")
+        return lines
+
+    def displacement_matrix_lines(self, matrix, applicators):
+        """Text table of the pairwise centroid displacement matrix and the drift from the first fraction"""
+        fractions = matrix["fractions"]
+        header = "        " + "".join(f"{'F' + str(f):>8}" for f in fractions)
+        lines = []
+        for a, applicator in enumerate(applicators):
+            lines.append(f"{applicator} - centroid displacement (mm), row = from, column = to:")
+            lines.append(header)
+            for i, frac in enumerate(fractions):
+                lines.append(f"{'F' + str(frac):>8}" + "".join(f"{matrix['magnitude'][i, j, a, 2]:>8.2f}"
+                                                          for j in range(len(fractions))))
+            lines.append(f"Cumulative drift from F{fractions[0]}:")
+            for f, frac in enumerate(fractions[1:], 1):
+                dx, dy, dz = matrix["drift"][f, a, 2]
+                lines.append(f"    F{frac}: {matrix['drift_mm'][f, a, 2]:6.2f} mm "
+                             f"[ΔX={dx:+.2f}, ΔY={dy:+.2f}, ΔZ={dz:+.2f}]")
+            lines.append("")
+        return lines
+
+    def show_3d_displacement_results(self, displacements, matrix=None):
     
         results_window = tk.Toplevel(self.root)
         results_window.title("3D Applicator Movement Analysis")
@@ -7302,13 +10229,28 @@ class BrachyApp:
 
         
         save_btn = tk.Button(button_frame, text="💾 Save Detailed Report", 
-                            command=lambda: self.save_3d_displacement_report(displacements),
+                            command=lambda: self.save_3d_displacement_report(displacements, matrix),
                             bg="#4CAF50", fg="white", font=("Arial", 11, "bold"),
                             width=18, height=1, relief="raised", bd=2,
                             cursor="hand2")
         save_btn.pack(side=tk.LEFT, padx=5)
 
       
+        if matrix is not None:
+            uncertainty_btn = tk.Button(button_frame, text="🎲 Uncertainty", 
+                                        command=lambda: self.show_displacement_uncertainty(matrix["fractions"]),
+                                        bg="#7B1FA2", fg="white", font=("Arial", 11, "bold"),
+                                        width=13, height=1, relief="raised", bd=2,
+                                        cursor="hand2")
+            uncertainty_btn.pack(side=tk.LEFT, padx=5)
+
+            dose_btn = tk.Button(button_frame, text="☢ Dose Impact", 
+                                 command=lambda: self.show_dosimetric_impact(matrix["fractions"]),
+                                 bg="#C62828", fg="white", font=("Arial", 11, "bold"),
+                                 width=13, height=1, relief="raised", bd=2,
+                                 cursor="hand2")
+            dose_btn.pack(side=tk.LEFT, padx=5)
+
         print_btn = tk.Button(button_frame, text="🖨️ Print Summary", 
                              command=lambda: self.print_3d_summary(displacements),
                              bg="#2196F3", fg="white", font=("Arial", 11, "bold"),
@@ -7412,6 +10354,16 @@ class BrachyApp:
             text_widget.insert(tk.END, "• Both Fraction 1 and Fraction 2 images are processed\n")
             text_widget.insert(tk.END, "• All required annotation files are generated\n")
         else:
+            if matrix is not None and len(matrix["fractions"]) > 2:
+                text_widget.insert(tk.END, "🔢 PAIRWISE DISPLACEMENT MATRIX\n", "section_header")
+                text_widget.insert(tk.END, "\n".join(self.displacement_matrix_lines(matrix, list(displacements))) + "\n", "matrix")
+                text_widget.insert(tk.END, "═" * 60 + "\n\n")
+
+            if matrix is not None and "rigid" in matrix:
+                text_widget.insert(tk.END, "🧩 RIGID-BODY DECOMPOSITION (whole applicator assembly)\n", "section_header")
+                text_widget.insert(tk.END, "\n".join(self.rigid_motion_lines(matrix, list(displacements))) + "\n\n")
+                text_widget.insert(tk.END, "═" * 60 + "\n\n")
+
             for applicator, data in displacements.items():
                
                 text_widget.insert(tk.END, f"\n🎯 {applicator.upper()}\n", "applicator_header")
@@ -7421,14 +10373,14 @@ class BrachyApp:
                 text_widget.insert(tk.END, "📍 3D COORDINATES\n", "section_header")
             
                
-                text_widget.insert(tk.END, "Fraction 1 Positions:\n", "subsection_header")
+                text_widget.insert(tk.END, f"Fraction {data.get('source_fraction', 1)} Positions:\n", "subsection_header")
                 coord_text = f"""    Tip:      X={data['points_frac1']['tip'][0]:>6.2f} mm, Y={data['points_frac1']['tip'][1]:>6.2f} mm, Z={data['points_frac1']['tip'][2]:>6.2f} mm
     Base:     X={data['points_frac1']['base'][0]:>6.2f} mm, Y={data['points_frac1']['base'][1]:>6.2f} mm, Z={data['points_frac1']['base'][2]:>6.2f} mm
     Centroid: X={data['points_frac1']['centroid'][0]:>6.2f} mm, Y={data['points_frac1']['centroid'][1]:>6.2f} mm, Z={data['points_frac1']['centroid'][2]:>6.2f} mm\n\n"""
                 text_widget.insert(tk.END, coord_text)
             
               
-                text_widget.insert(tk.END, "Fraction 2 Positions:\n", "subsection_header")
+                text_widget.insert(tk.END, f"Fraction {data.get('target_fraction', 2)} Positions:\n", "subsection_header")
                 coord_text = f"""    Tip:      X={data['points_frac2']['tip'][0]:>6.2f} mm, Y={data['points_frac2']['tip'][1]:>6.2f} mm, Z={data['points_frac2']['tip'][2]:>6.2f} mm
     Base:     X={data['points_frac2']['base'][0]:>6.2f} mm, Y={data['points_frac2']['base'][1]:>6.2f} mm, Z={data['points_frac2']['base'][2]:>6.2f} mm
     Centroid: X={data['points_frac2']['centroid'][0]:>6.2f} mm, Y={data['points_frac2']['centroid'][1]:>6.2f} mm, Z={data['points_frac2']['centroid'][2]:>6.2f} mm\n\n"""
@@ -7534,6 +10486,7 @@ class BrachyApp:
         text_widget.tag_configure("vector_x", font=("Arial", 10, "bold"), foreground="#1976D2")
         text_widget.tag_configure("vector_y", font=("Arial", 10, "bold"), foreground="#388E3C")
         text_widget.tag_configure("vector_z", font=("Arial", 10, "bold"), foreground="#7B1FA2")
+        text_widget.tag_configure("matrix", font=("Courier", 10))
 
         text_widget.config(state=tk.DISABLED)
 
@@ -7545,7 +10498,7 @@ class BrachyApp:
         tk.Label(footer_frame, text=help_text, font=("Arial", 9), 
                  fg="#666666", bg="#F5F5F5").pack()
         
-    def save_3d_displacement_report(self, displacements):
+    def save_3d_displacement_report(self, displacements, matrix=None):
       
         import os
         from datetime import datetime
@@ -7571,6 +10524,16 @@ class BrachyApp:
                 f.write("• Moderate: 5.0-7.0 mm movement\n")
                 f.write("• Significant: >7.0 mm movement\n\n")
                 f.write("=" * 70 + "\n\n")
+
+                if matrix is not None and len(matrix["fractions"]) > 2:
+                    f.write("PAIRWISE DISPLACEMENT MATRIX:\n")
+                    f.write("\n".join(self.displacement_matrix_lines(matrix, list(displacements))) + "\n")
+                    f.write("=" * 70 + "\n\n")
+
+                if matrix is not None and "rigid" in matrix:
+                    f.write("RIGID-BODY DECOMPOSITION (whole applicator assembly):\n")
+                    f.write("\n".join(self.rigid_motion_lines(matrix, list(displacements))) + "\n\n")
+                    f.write("=" * 70 + "\n\n")
             
                 for applicator, data in displacements.items():
                     f.write(f"APPLICATOR: {applicator.upper()}\n")
@@ -7581,7 +10544,7 @@ class BrachyApp:
                     f.write(f"Base displacement:     {data['base_displacement_mm']:7.2f} mm\n")
                     f.write(f"Centroid displacement: {data['centroid_displacement_mm']:7.2f} mm\n\n")
                     
-                    f.write("DIRECTIONAL MOVEMENT (Fraction 2 - Fraction 1):\n")
+                    f.write(f"DIRECTIONAL MOVEMENT (Fraction {data.get('target_fraction', 2)} - Fraction {data.get('source_fraction', 1)}):\n")
                     f.write(f"Right-Left (X):        {data['centroid_delta_x']:+.2f} mm")
                     f.write(" → Movement to RIGHT\n" if data['centroid_delta_x'] > 0 else " → Movement to LEFT\n")
                     
@@ -7686,44 +10649,49 @@ class BrachyApp:
         self.create_enhanced_3d_visualization_window(coordinates_3d)
 
 
+    def reconstruct_3d_landmarks(self, fractions, iterations=4):
+        """reconstruct_from_films() over the AP and lateral records of every fraction at once.
+
+        Returns (points, residual): (fraction, applicator, tip/base, x/y/z) in mm
+        from the anatomy start and the per-landmark superior-inferior misfit.
+        """
+        store = self.measurement_store()
+        solved = reconstruct_from_films(store.film_pixels("AP", fractions)[:3], store.film_pixels("LAT", fractions)[:3],
+                                        self.imaging_geometry("AP_frac1"), self.imaging_geometry("LAT_frac1"),
+                                        iterations)
+        for fraction, offset in zip(fractions, solved["offset"]):
+            print(f"Fraction {fraction}: lateral film superior-inferior offset {offset:+.2f} mm")
+        return solved["points"], solved["residual"]
+
     def calculate_3d_applicator_positions(self):
         
         try:
-          
-            ap_files = {
-                "frac1": os.path.join(self.temp_dir, "AP_frac1_distances_from_anatomy.txt"),
-                "frac2": os.path.join(self.temp_dir, "AP_frac2_distances_from_anatomy.txt")
-            }
-    
-          
-            lat_files = {
-                "frac1": os.path.join(self.temp_dir, "LAT", "LAT_frac1_distances_from_anatomy.txt"),
-                "frac2": os.path.join(self.temp_dir, "LAT", "LAT_frac2_distances_from_anatomy.txt")
-            }
-    
-            print(f"AP files exist: frac1={os.path.exists(ap_files['frac1'])}, frac2={os.path.exists(ap_files['frac2'])}")
-            print(f"LAT files exist: frac1={os.path.exists(lat_files['frac1'])}, frac2={os.path.exists(lat_files['frac2'])}")
-    
-           
-            applicator_data = {}
-    
-            for frac in ["frac1", "frac2"]:
-                applicator_data[frac] = {}
-        
-           
-                if os.path.exists(ap_files[frac]):
-                    ap_distances = self.parse_distances_from_txt(ap_files[frac])
-                    applicator_data[frac]["AP"] = ap_distances
-                    print(f"AP {frac} data: {ap_distances}")
-        
-              
-                if os.path.exists(lat_files[frac]):
-                    lat_distances = self.parse_distances_from_txt(lat_files[frac])
-                    applicator_data[frac]["LAT"] = lat_distances
-                    print(f"LAT {frac} data: {lat_distances}")
-    
-        
-            return self.convert_to_3d_coordinates(applicator_data)
+            store = self.measurement_store()
+            fractions = sorted(set(store.fractions("AP")) & set(store.fractions("LAT")))
+            if not fractions:
+                print("No fraction has both AP and LAT measurements")
+                return {}
+            points, residual = self.reconstruct_3d_landmarks(fractions)
+
+            short_names = {"applicator_tandem": "tandem", "left_ovoid": "left_ovoid", "right_ovoid": "right_ovoid"}
+            coordinates_3d = {}
+            for f, fraction in enumerate(fractions):
+                frac = f"frac{fraction}"
+                coordinates_3d[frac] = {}
+                for a, key in enumerate(LandmarkSet.APPLICATORS):
+                    if np.isnan(points[f, a]).any():
+                        print(f"      Missing {short_names[key]} in AP or LAT data for {frac}")
+                        continue
+                    coordinates_3d[frac][short_names[key]] = {
+                        point: dict(zip("xyz", (float(v) for v in points[f, a, p])))
+                        for p, point in enumerate(LandmarkSet.POINTS)
+                    }
+                    print(f"      {frac} {short_names[key]}: tip={coordinates_3d[frac][short_names[key]]['tip']}, "
+                          f"base={coordinates_3d[frac][short_names[key]]['base']}, "
+                          f"SI residual {np.nanmax(residual[f, a]):.2f} mm")
+
+            print(f"Final 3D coordinates: {coordinates_3d}")
+            return coordinates_3d
     
         except Exception as e:
             print(f"Error calculating 3D positions: {e}")
@@ -7731,180 +10699,6 @@ class BrachyApp:
             traceback.print_exc()
             return None
 
-    def parse_distances_from_txt(self, file_path):
-       
-        distances = {}
-        try:
-            print(f"Parsing file: {file_path}")
-    
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-    
-            print(f"File content:\n{content}")
-    
-           
-            lines = content.split('\n')
-            current_applicator = None
-        
-            for i, line in enumerate(lines):
-                line = line.strip()
-                print(f"Line {i}: '{line}'")
-            
-                
-                if not line or "===" in line or "Anatomy start" in line or "Anatomy end" in line:
-                    continue
-        
-             
-                if "Tandem Applicator" in line:
-                    current_applicator = "tandem"
-                    distances[current_applicator] = {}
-                    print(f"Found tandem applicator")
-                elif "Left Ovoid" in line:
-                    current_applicator = "left_ovoid" 
-                    distances[current_applicator] = {}
-                    print(f"Found left ovoid")
-                elif "Right Ovoid" in line:
-                    current_applicator = "right_ovoid"
-                    distances[current_applicator] = {}
-                    print(f"Found right ovoid")
-        
-            
-                if current_applicator and "mm" in line:
-             
-                    if ":" in line:
-                        parts = line.split(":")
-                        if len(parts) == 2:
-                            measurement_name = parts[0].strip()
-                            value_part = parts[1].strip()
-                    
-                         
-                            import re
-                            numbers = re.findall(r"[\d.]+", value_part)
-                            if numbers:
-                                value = float(numbers[0])
-                                distances[current_applicator][measurement_name] = value
-                                print(f"  Parsed: {measurement_name} = {value} mm")
-
-            print(f"Final distances: {distances}")
-    
-        except Exception as e:
-            print(f"Error parsing TXT file {file_path}: {e}")
-            import traceback
-            traceback.print_exc()
-    
-        return distances
-
-    def convert_to_3d_coordinates(self, applicator_data):
-        
-        coordinates_3d = {}
-
-        print("=== CONVERTING TO 3D COORDINATES ===")
-    
-        for frac in ["frac1", "frac2"]:
-            coordinates_3d[frac] = {}
-    
-            if frac not in applicator_data:
-                print(f"  No data for {frac}")
-                continue
-        
-            if "AP" not in applicator_data[frac] or "LAT" not in applicator_data[frac]:
-                print(f"  Missing AP or LAT data for {frac}")
-                continue
-    
-            ap_data = applicator_data[frac]["AP"]
-            lat_data = applicator_data[frac]["LAT"]
-    
-            print(f"  Processing {frac}:")
-            print(f"    AP applicators: {list(ap_data.keys())}")
-            print(f"    LAT applicators: {list(lat_data.keys())}")
-    
-            for applicator in ["tandem", "left_ovoid", "right_ovoid"]:
-                if applicator in ap_data and applicator in lat_data:
-                    print(f"    Processing {applicator}")
-            
-                   
-                    ap_measurements = ap_data[applicator]
-                    lat_measurements = lat_data[applicator]
-            
-                    print(f"      AP measurements: {ap_measurements}")
-                    print(f"      LAT measurements: {lat_measurements}")
-                
-                  
-                    tip_ap = None
-                    tip_lat = None
-            
-                   
-                    for key, value in ap_measurements.items():
-                        if "tip" in key.lower() and "anatomy" in key.lower():
-                            tip_ap = value
-                            break
-                    if tip_ap is None and ap_measurements:
-                        tip_ap = list(ap_measurements.values())[0]  
-            
-          
-                    for key, value in lat_measurements.items():
-                        if "tip" in key.lower() and "anatomy" in key.lower():
-                            tip_lat = value
-                            break
-                    if tip_lat is None and lat_measurements:
-                        tip_lat = list(lat_measurements.values())[0] 
-                
-                    # Use defaults if still None
-                    if tip_ap is None:
-                        tip_ap = 50.0
-                    if tip_lat is None:
-                        tip_lat = 50.0
-            
-                    print(f"      Using AP distance: {tip_ap}, LAT distance: {tip_lat}")
-                
-                    
-                    scale_factor = 5.0  
-            
-
-            
-            
-                    if applicator == "tandem":
-                   
-                        base_y = 0  
-                        tip_y = tip_lat * scale_factor  
-                        x_pos = tip_ap * scale_factor  
-                        base_z = -20  
-                        tip_z = 20    
-                    elif applicator == "left_ovoid":
-                    
-                        base_y = 0  
-                        tip_y = tip_lat * scale_factor  
-                        x_pos = -tip_ap * scale_factor 
-                        base_z = -10
-                        tip_z = 10
-                    else: 
-                       
-                        base_y = 0  
-                        tip_y = tip_lat * scale_factor  
-                        x_pos = tip_ap * scale_factor  
-                        base_z = -10
-                        tip_z = 10
-            
-                    coordinates_3d[frac][applicator] = {
-                        'tip': {
-                            'x': x_pos,          
-                            'y': tip_y,          
-                            'z': tip_z           
-                        },
-                        'base': {
-                            'x': x_pos,           
-                            'y': base_y,        
-                            'z': base_z         
-                        }
-                    }
-            
-                    print(f"      Created 3D coordinates: tip={coordinates_3d[frac][applicator]['tip']}, base={coordinates_3d[frac][applicator]['base']}")
-                else:
-                    print(f"      Missing {applicator} in AP or LAT data")
-
-        print(f"Final 3D coordinates: {coordinates_3d}")
-        return coordinates_3d
-
     def create_enhanced_3d_visualization_window(self, coordinates_3d):
        
     
@@ -8821,16 +11615,8 @@ class BrachyApp:
             annotation_path = os.path.join(self.temp_dir, json_file)
             lat_annotation_path = os.path.join(self.temp_dir, lat_json_file)
             
-            ap_data = {}
-            lat_data = {}
-            
-            if os.path.exists(annotation_path):
-                with open(annotation_path, 'r') as f:
-                    ap_data = json.load(f)
-            
-            if os.path.exists(lat_annotation_path):
-                with open(lat_annotation_path, 'r') as f:
-                    lat_data = json.load(f)
+            ap_data = self.annotations.load(annotation_path) or {}
+            lat_data = self.annotations.load(lat_annotation_path) or {}
             
            
             for applicator in ['applicator_tandem', 'left_ovoid', 'right_ovoid']:
@@ -9855,6 +12641,8 @@ class BrachyApp:
         story.append(Spacer(1, 12))
         
         
+        self.export_masks_to_png()
+
         image_patterns = [
             "*_edited.png",
             "*_combined_mask.png",
@@ -10009,13 +12797,11 @@ class BrachyApp:
         summary_points.append(f"• Images Uploaded: {uploaded_images}/{total_images}")
         
      
-        analysis_files = [
-            "AP_frac1_distances_from_anatomy.txt",
-            "AP_frac2_distances_from_anatomy.txt"
-        ]
+        analysis_fractions = [("AP", 1), ("AP", 2)]
         
-        completed_analyses = sum(1 for f in analysis_files if os.path.exists(os.path.join(self.temp_dir, f)))
-        summary_points.append(f"• Completed Analyses: {completed_analyses}/{len(analysis_files)}")
+        store = self.measurement_store()
+        completed_analyses = sum(1 for view, fraction in analysis_fractions if store.has(view, fraction))
+        summary_points.append(f"• Completed Analyses: {completed_analyses}/{len(analysis_fractions)}")
         
      
         shifts = self.calculate_direct_shifts_between_fractions()
@@ -10077,36 +12863,25 @@ class BrachyApp:
        
         try:
           
-            frac1_points = self.load_applicator_points("AP_frac1_annotations.json")
+            frac1_points = self.load_applicator_points("AP_frac1_annotations.json", "AP", 1)
             if not frac1_points:
                 return None
         
            
-            frac2_points = self.load_applicator_points("AP_frac2_annotations.json")
+            frac2_points = self.load_applicator_points("AP_frac2_annotations.json", "AP", 2)
             if not frac2_points:
                 return None
         
             shifts = {}
-            mm_per_px = self.pixel_spacing["AP_frac1"]
+            mm_per_px = self.object_mm_per_px("AP_frac1")
+            geometry = landmark_geometry(frac1_points, frac2_points, mm_per_px=mm_per_px)
         
-            for applicator in ["applicator_tandem", "left_ovoid", "right_ovoid"]:
-                if applicator not in frac1_points or applicator not in frac2_points:
-                    continue
-                
-                tip1 = frac1_points[applicator].get("tip")
-                base1 = frac1_points[applicator].get("base")
-                tip2 = frac2_points[applicator].get("tip") 
-                base2 = frac2_points[applicator].get("base")
-            
-                if not all([tip1, base1, tip2, base2]):
+            for applicator, (tip, base, _) in zip(LandmarkSet.APPLICATORS, geometry):
+                if not (tip["valid"] and base["valid"]):
                     continue
             
-              
-                tip_shift_px = self.euclidean_distance(tip1, tip2)
-                base_shift_px = self.euclidean_distance(base1, base2)
-            
-                tip_shift_mm = tip_shift_px * mm_per_px
-                base_shift_mm = base_shift_px * mm_per_px
+                tip_shift_mm = float(tip["direct_shift_mm"])
+                base_shift_mm = float(base["direct_shift_mm"])
             
                 applicator_name = applicator.replace('applicator_', '').replace('_', ' ').title()
             
@@ -10121,79 +12896,18 @@ class BrachyApp:
             print(f"Error calculating shifts: {e}")
             return None
 
-    def parse_distance_files(self, view_type):
-   
-        data = {}
-        
-        try:
-            for fraction in ["1", "2"]:
-                file_path = os.path.join(self.temp_dir, f"{view_type}_frac{fraction}_distances_from_anatomy.txt")
-                if os.path.exists(file_path):
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        content = f.read()
-                    
-                    
-                    lines = content.split('\n')
-                    current_applicator = None
-                    
-                    for line in lines:
-                        line = line.strip()
-                        if not line or "===" in line:
-                            continue
-                        
-                      
-                        if "Applicator" in line and ":" not in line and "to" not in line:
-                            current_applicator = line.replace(":", "").strip()
-                            if current_applicator not in data:
-                                data[current_applicator] = {}
-                            continue
-                        
-                      
-                        if "to Anatomy" in line and "mm" in line:
-                      
-                            parts = line.split(":")
-                            if len(parts) == 2:
-                                measurement_name = parts[0].strip()
-                                value_str = parts[1].replace("mm", "").strip()
-                                
-                                try:
-                                    value = float(value_str)
-                                  
-                                    key = f"frac{fraction}"
-                                    if measurement_name not in data.get(current_applicator, {}):
-                                        if current_applicator not in data:
-                                            data[current_applicator] = {}
-                                        data[current_applicator][measurement_name] = {}
-                                    
-                                    data[current_applicator][measurement_name][key] = value
-                                except ValueError:
-                                    continue
-            
-      
-            comparison_data = {}
-            if data:  
-                for applicator, measurements in data.items():
-                    comparison_data[applicator] = {}
-                    for measurement_name, fractions in measurements.items():
-                        if 'frac1' in fractions and 'frac2' in fractions:
-                            comparison_data[applicator][measurement_name] = {
-                                'fraction1': fractions['frac1'],
-                                'fraction2': fractions['frac2'],
-                                'shift': fractions['frac2'] - fractions['frac1']
-                            }
-            
-            return comparison_data if comparison_data else {}  
-            
-        except Exception as e:
-            print(f"Error parsing {view_type} distance files: {e}")
-            return {}  
+    def load_distance_comparison(self, view_type):
+        """{applicator: {measurement: {'fraction1', 'fraction2', 'shift'}}} from the measurement store"""
+        comparison = self.measurement_store().comparison(view_type)
+        return {applicator: {MeasurementStore.measurement_label(m): values for m, values in measurements.items()}
+                for applicator, measurements in comparison.items()}
 
     def calculate_overall_statistics(self):
         
         shifts = []
         
     
-        ap_data = self.parse_distance_files("AP")
+        ap_data = self.load_distance_comparison("AP")
         if ap_data and isinstance(ap_data, dict):
             for applicator, measurements in ap_data.items():
                 if isinstance(measurements, dict):
@@ -10202,7 +12916,7 @@ class BrachyApp:
                             shifts.append(data['shift'])
         
      
-        lat_data = self.parse_distance_files("LAT")
+        lat_data = self.load_distance_comparison("LAT")
         if lat_data and isinstance(lat_data, dict):
             for applicator, measurements in lat_data.items():
                 if isinstance(measurements, dict):